@@ -3,32 +3,29 @@
 # Shows state transformations and agent hand-offs clearly
 
 import json
-import re
 from typing import Dict, Any
 
-from google import genai
-from google.genai import types
 from dotenv import load_dotenv
+from langgraph.config import get_stream_writer
 from config import get_settings
-from schemas import MindMoneyState
+from finance_engine import compute_financials, extracted_profile
+from llm import generate_content_stream, generate_model
+from limiter import UpstreamOverloaded
+from model_router import agent_generation_config, choose_model
+from intent_classifier import classify_intent_fast
+from response_cache import get_response_cache, response_cache_key
+from prompting import HIGH, LOW, NORMAL, PromptBuilder, build_profile_fragments, compact_json, get_fragment
+from schemas import ActionPlan, FinancialProfile, IntakeProfile, MindMoneyState, merge_dicts
 
 load_dotenv()
 
 # --- SHARED UTILS ---
-def get_gemini_client():
-    settings = get_settings()
-    return genai.Client(api_key=settings.gemini_api_key)
-
-
-def safe_parse_json(response_text: str | None) -> Dict[str, Any]:
-    if not response_text:
-        return {}
+def emit_stream_event(event: Dict[str, Any]) -> None:
+    """Push a custom event to a streaming graph run (no-op outside a graph)."""
     try:
-        text = re.sub(r'```json\s*', '', response_text)
-        text = re.sub(r'```\s*', '', text)
-        return json.loads(text.strip())
-    except json.JSONDecodeError:
-        return {}
+        get_stream_writer()(event)
+    except RuntimeError:
+        pass
 
 
 def truncate_for_log(data: Any, max_length: int = 200) -> str:
@@ -56,31 +53,8 @@ CATEGORIZATION RULES:
 Be careful: Vague statements like "I have debt" or "I'm struggling" are CLARIFICATION, not DATA_SUBMISSION.
 Only classify as DATA_SUBMISSION if the user provides actual numbers.
 
-OUTPUT ONLY VALID JSON:
-{
-  "intent": "GREETING" | "CLARIFICATION" | "DATA_SUBMISSION",
-  "emotional_state": {
-    "anxiety": 0-10,
-    "shame": 0-10,
-    "overwhelm": 0-10,
-    "hope": 0-10,
-    "primary_emotion": "string describing their main feeling"
-  },
-  "financial_psychology": {
-    "money_beliefs": ["any beliefs about money you detect"],
-    "triggers": ["emotional triggers around money"]
-  },
-  "rapport_indicators": {
-    "engagement_level": "low|medium|high",
-    "trust_needed": ["validation", "competence", "confidentiality"]
-  },
-  "safety_concerns": {
-    "crisis_flag": false,
-    "escalation_needed": false
-  },
-  "validation_hook": "A compassionate, specific sentence validating their situation or emotion.",
-  "missing_info": ["List 1-3 specific things needed to build a plan - ONLY if intent is CLARIFICATION. Examples: 'monthly income', 'total debt amount', 'monthly expenses'"]
-}"""
+OUTPUT: the structured intake profile. Always fill emotional_state and safety_concerns;
+fill missing_info only for CLARIFICATION."""
 
 
 async def run_intake_agent(state: MindMoneyState):
@@ -91,7 +65,6 @@ async def run_intake_agent(state: MindMoneyState):
     - First agent in the pipeline - receives raw user input
     """
     settings = get_settings()
-    client = get_gemini_client()
     
     # =========== INPUT STATE ===========
     input_state = {
@@ -101,26 +74,34 @@ async def run_intake_agent(state: MindMoneyState):
         "existing_financial_profile": bool(state.get("financial_profile"))
     }
     
-    # Build conversation context
-    history_context = ""
-    if state.get("conversation_history"):
-        history_context = "\n".join([
-            f"{msg.get('role', 'user').upper()}: {msg.get('content', '')}"
-            for msg in state["conversation_history"][-4:]
-        ])
-    
     try:
-        messages = f"{history_context}\nCURRENT MESSAGE:\n{state['user_input']}" if history_context else state['user_input']
+        # Obvious cases are settled locally; ambiguous/emotional/crisis input goes to the LLM
+        data = None
+        if settings.intake_fast_path:
+            data = classify_intent_fast(state['user_input'], state.get("conversation_history"))
+        classified_by = "fast_path" if data else "llm"
+        prompt_fields: Dict[str, Any] = {"input_tokens": 0}
+        llm_attempts = 0
+        model = None
         
-        response = client.models.generate_content(
-            model=settings.model_name,
-            contents=f"SYSTEM: {INTAKE_PROMPT}\nCONTEXT:\n{messages}",
-            config=types.GenerateContentConfig(
-                temperature=settings.intake_temperature,
-                response_mime_type="application/json"
+        if data is None:
+            history = state.get("conversation_history") or []
+            builder = PromptBuilder("Intake Specialist", INTAKE_PROMPT, settings.intake_token_budget)
+            builder.add("CONTEXT:")
+            builder.add_history(history[-4:])
+            builder.add(f"CURRENT MESSAGE:\n{state['user_input']}" if history else state['user_input'])
+            contents = builder.build()
+            prompt_fields = builder.log_fields()
+            
+            model = choose_model("intake")
+            profile, llm_attempts = await generate_model(
+                contents=contents,
+                config=agent_generation_config("intake", temperature=settings.intake_temperature),
+                schema=IntakeProfile,
+                model=model,
+                agent="intake"
             )
-        )
-        data = safe_parse_json(response.text)
+            data = profile.model_dump(exclude_none=True)
         
         # Extract key fields
         intent = data.get("intent", "GREETING")
@@ -139,6 +120,8 @@ async def run_intake_agent(state: MindMoneyState):
             "primary_emotion": primary_emotion,
             "crisis_flag": safety.get("crisis_flag", False),
             "missing_info": missing_info[:2] if missing_info else [],
+            "classified_by": classified_by,
+            "llm_attempts": llm_attempts,
             "routing_decision": "→ Wealth Architect + Market Researcher" if intent == "DATA_SUBMISSION" else "→ Care Manager (skip analysis)"
         }
         
@@ -146,14 +129,16 @@ async def run_intake_agent(state: MindMoneyState):
         log = {
             "agent": "Intake Specialist",
             "role": "Emotional Assessment & Intent Classification",
-            "thought": f"Classified as {intent}. User feels {primary_emotion} (anxiety: {anxiety}/10, shame: {shame}/10). {f'Missing: {missing_info[:2]}' if missing_info else 'Has sufficient data.' if intent == 'DATA_SUBMISSION' else ''}",
+            "thought": f"{'[Fast path, no LLM call] ' if classified_by == 'fast_path' else ''}Classified as {intent}. User feels {primary_emotion} (anxiety: {anxiety}/10, shame: {shame}/10). {f'Missing: {missing_info[:2]}' if missing_info else 'Has sufficient data.' if intent == 'DATA_SUBMISSION' else ''}",
             "status": "complete",
             "input_state": input_state,
             "output_state": output_state,
             "state_changes": {
                 "added": ["intake_profile.intent", "intake_profile.emotional_state", "intake_profile.safety_concerns"],
                 "routing": output_state["routing_decision"]
-            }
+            },
+            **prompt_fields,
+            "model_used": model
         }
         
         return {
@@ -161,6 +146,9 @@ async def run_intake_agent(state: MindMoneyState):
             "agent_log": [log]
         }
         
+    except UpstreamOverloaded:
+        # Shed by the Gemini limiter - fail the request fast (503) rather than degrade
+        raise
     except Exception as e:
         print(f"Intake Error: {e}")
         return {
@@ -183,47 +171,22 @@ async def run_intake_agent(state: MindMoneyState):
 WEALTH_PROMPT = """You are an Expert Financial Planner with 15+ years experience.
 Analyze the user's financial situation and create a comprehensive plan.
 
-OUTPUT ONLY VALID JSON:
-{
-  "financial_snapshot": {
-    "monthly_income": "Amount or 'Unknown'",
-    "monthly_expenses": "Estimated or stated",
-    "current_cash_flow": "Positive/Negative/Neutral",
-    "savings_rate": "Percentage if calculable"
-  },
-  "debt_analysis": {
-    "total_debt": "Amount or 'Unknown'",
-    "debt_types": [{"type": "Credit Card|Student Loan|Mortgage|Medical|Other", "amount": 0, "interest_rate": "if known", "priority": "High|Medium|Low"}],
-    "debt_to_income_ratio": "Calculation or estimate",
-    "recommended_strategy": "Avalanche|Snowball|Consolidation|Hybrid"
-  },
-  "assets_and_savings": {
-    "emergency_fund": "Amount or status",
-    "retirement_savings": "Amount if mentioned",
-    "other_assets": "Any other assets mentioned"
-  },
-  "financial_health_score": 0-100,
-  "major_challenges": ["Specific challenge 1", "Challenge 2"],
-  "immediate_opportunities": ["Quick win 1", "Opportunity 2"],
-  "detailed_strategy": {
-    "phase_1_immediate": {
-      "focus": "Main priority",
-      "actions": ["Action 1", "Action 2"],
-      "timeline": "1-4 weeks"
-    },
-    "phase_2_short_term": {
-      "focus": "Next priority",
-      "actions": ["Action 1", "Action 2"],
-      "timeline": "1-3 months"
-    },
-    "phase_3_long_term": {
-      "focus": "Future goals",
-      "actions": ["Action 1"],
-      "timeline": "3-12 months"
-    }
-  },
-  "key_metrics_to_track": ["Metric 1", "Metric 2"]
-}"""
+OUTPUT: the structured financial profile - snapshot, debts, assets, challenges, opportunities,
+a three-phase detailed_strategy and metrics to track. Amounts are plain dollar numbers and
+interest rates annual percentages; use null for anything not stated or inferable.
+Do not compute ratios, scores, totals or payoff timelines - they are calculated separately from
+the figures you extract. Keep phase timelines qualitative."""
+
+# Follow-up turns: the stored profile already holds earlier facts, so only the change is generated
+WEALTH_DELTA_PROMPT = """You are an Expert Financial Planner with 15+ years experience.
+You already built this user's financial profile (STORED PROFILE). Update it with what the new message adds or corrects.
+
+OUTPUT: the structured financial profile with just the changed parts:
+- Fill a field only if its value is new or different; leave the rest null. Nested objects may be partial.
+- Lists (debt_types, major_challenges, immediate_opportunities, actions) replace the stored list - send the complete updated list.
+- Update strategy phases when the new figures change them. Ratios, scores, totals and payoff
+  timelines are calculated separately - don't produce them.
+- If nothing changes, leave every field null."""
 
 
 async def run_financial_agent(state: MindMoneyState):
@@ -231,7 +194,8 @@ async def run_financial_agent(state: MindMoneyState):
     AGENT 2: Wealth Architect
     - Receives intake_profile from Agent 1
     - Only activates if intent == DATA_SUBMISSION
-    - Produces comprehensive financial analysis
+    - Produces comprehensive financial analysis on the first data turn,
+      then only a delta against the session's stored financial_profile
     """
     intake = state.get("intake_profile", {})
     intent = intake.get("intent", "GREETING")
@@ -260,28 +224,44 @@ async def run_financial_agent(state: MindMoneyState):
         }
 
     settings = get_settings()
-    client = get_gemini_client()
+    prior_profile = state.get("financial_profile") or {}
+    history = state.get("conversation_history") or []
     
-    # Include conversation history for context
-    history_context = ""
-    if state.get("conversation_history"):
-        history_context = "\n".join([
-            f"{msg.get('role', 'user').upper()}: {msg.get('content', '')}"
-            for msg in state["conversation_history"][-3:]
-        ])
-    
-    context = f"{history_context}\nCURRENT MESSAGE: {state['user_input']}" if history_context else state['user_input']
+    if prior_profile:
+        # Delta mode: stored profile + the new message (and the question it answers)
+        builder = PromptBuilder("Wealth Architect", WEALTH_DELTA_PROMPT, settings.wealth_token_budget)
+        builder.add(f"STORED PROFILE:\n{compact_json(extracted_profile(prior_profile))}")
+        if history and history[-1].get("role") == "assistant":
+            builder.add_history(history[-1:], priority=NORMAL)
+        builder.add(f"NEW MESSAGE: {state['user_input']}")
+    else:
+        # Include conversation history for context
+        builder = PromptBuilder("Wealth Architect", WEALTH_PROMPT, settings.wealth_token_budget)
+        builder.add("USER FINANCIAL SITUATION:")
+        builder.add_history(history[-3:])
+        builder.add(f"CURRENT MESSAGE: {state['user_input']}" if history else state['user_input'])
+    contents = builder.build()
+    input_state["prior_profile"] = bool(prior_profile)
+    model = choose_model("wealth")
     
     try:
-        response = client.models.generate_content(
-            model=settings.model_name,
-            contents=f"SYSTEM: {WEALTH_PROMPT}\nUSER FINANCIAL SITUATION:\n{context}",
-            config=types.GenerateContentConfig(
-                temperature=settings.planner_temperature,
-                response_mime_type="application/json"
-            )
+        delta_model, llm_attempts = await generate_model(
+            contents=contents,
+            config=agent_generation_config("wealth", temperature=settings.planner_temperature),
+            schema=FinancialProfile,
+            model=model,
+            agent="wealth"
         )
-        data = safe_parse_json(response.text)
+        delta = delta_model.model_dump(exclude_none=True)
+        # The state reducer applies the same merge; `data` is what downstream agents will see.
+        # Derived figures come from the engine, recomputed over the merged extraction only -
+        # every computed field is emitted (None when unknown), so both merges replace last turn's.
+        # Strip before merging: a delta that clears the debts must not keep last turn's sum.
+        data = merge_dicts(extracted_profile(prior_profile), delta)
+        computed = compute_financials(data)
+        data = merge_dicts(data, computed)
+        delta = merge_dicts(delta, computed)
+        plan = data.get('payoff_plan') or {}
         
         # Extract key metrics for logging
         health_score = data.get('financial_health_score', 0)
@@ -297,32 +277,44 @@ async def run_financial_agent(state: MindMoneyState):
             "debt_types_count": len(debt_types),
             "challenges_identified": len(challenges),
             "recommended_strategy": strategy,
-            "phases_generated": list(data.get('detailed_strategy', {}).keys())
+            "months_to_debt_free": plan.get('months_to_debt_free'),
+            "total_interest": plan.get('total_interest'),
+            "phases_generated": list(data.get('detailed_strategy', {}).keys()),
+            "mode": "delta" if prior_profile else "full",
+            "llm_attempts": llm_attempts,
+            "changed_keys": list(delta.keys())
         }
         
         # =========== ENHANCED LOG ===========
         log = {
             "agent": "Wealth Architect",
             "role": "Financial Analysis & Strategy",
-            "thought": f"Health Score: {health_score}/100 | Total Debt: {total_debt} | Strategy: {strategy} | Found {len(challenges)} challenges, {len(debt_types)} debt types",
+            "thought": f"{'Updated stored profile (' + str(len(delta)) + ' sections changed) | ' if prior_profile else ''}Health Score: {health_score}/100 | Total Debt: {total_debt} | Strategy: {strategy} | Found {len(challenges)} challenges, {len(debt_types)} debt types",
             "status": "complete",
             "input_state": input_state,
             "output_state": output_state,
             "state_changes": {
-                "added": ["financial_profile.health_score", "financial_profile.debt_analysis", "financial_profile.detailed_strategy"],
+                "added": [f"financial_profile.{key}" for key in delta] if prior_profile else ["financial_profile.health_score", "financial_profile.debt_analysis", "financial_profile.detailed_strategy"],
                 "routing": "→ Care Manager (with financial context)"
-            }
+            },
+            **builder.log_fields(),
+            "model_used": model
         }
         
         return {
-            "financial_profile": data,
+            "financial_profile": delta,
+            # Serialised once here for the Care Manager and Action Generator
+            "prompt_fragments": build_profile_fragments(data),
             "agent_log": [log]
         }
         
+    except UpstreamOverloaded:
+        raise
     except Exception as e:
         print(f"Wealth Error: {e}")
+        # The error goes in the log only; the stored profile is left as it was
         return {
-            "financial_profile": {"error": str(e)},
+            "financial_profile": {},
             "agent_log": [{
                 "agent": "Wealth Architect",
                 "role": "Financial Analysis & Strategy",
@@ -330,7 +322,8 @@ async def run_financial_agent(state: MindMoneyState):
                 "status": "failed",
                 "input_state": input_state,
                 "output_state": {"error": str(e)[:100]},
-                "state_changes": {"added": [], "routing": "→ Care Manager (without financial data)"}
+                "state_changes": {"added": [], "routing": "→ Care Manager (without financial data)"},
+                "model_used": model
             }]
         }
 
@@ -399,7 +392,6 @@ async def run_synthesizer_agent(state: MindMoneyState):
     - Synthesizes empathetic, actionable response
     """
     settings = get_settings()
-    client = get_gemini_client()
     
     intake = state.get("intake_profile") or {}
     wealth = state.get("financial_profile") or {}
@@ -425,7 +417,6 @@ async def run_synthesizer_agent(state: MindMoneyState):
     # Determine style and build prompt
     if intent == "GREETING":
         prompt = CARE_PROMPT_GREETING
-        context = f"USER MESSAGE: {state['user_input']}"
         style = "greeting"
         style_reason = "User sent a greeting/inquiry"
         
@@ -436,22 +427,19 @@ async def run_synthesizer_agent(state: MindMoneyState):
             validation=validation,
             missing_info=", ".join(missing_info) if missing_info else "income and debt details"
         )
-        context = f"USER MESSAGE: {state['user_input']}"
         style = "clarification"
         style_reason = f"User needs to provide: {', '.join(missing_info[:2]) if missing_info else 'financial details'}"
         
     else:  # DATA_SUBMISSION
         health_score = wealth.get('financial_health_score', 50)
         challenges = wealth.get('major_challenges', [])
-        opportunities = wealth.get('immediate_opportunities', [])
-        strategy = wealth.get('detailed_strategy', {})
         
         if anxiety >= 7:
             prompt = CARE_PROMPT_STRESSED.format(
                 anxiety=anxiety,
                 primary_emotion=primary_emotion,
                 validation=validation,
-                strategy_summary=json.dumps(strategy.get('phase_1_immediate', {}), indent=2)
+                strategy_summary=get_fragment(state, "phase_1")
             )
             style = "crisis_support"
             style_reason = f"High anxiety ({anxiety}/10) - using calming approach"
@@ -462,7 +450,7 @@ async def run_synthesizer_agent(state: MindMoneyState):
                 anxiety=anxiety,
                 health_score=health_score,
                 challenges=", ".join(challenges[:3]) if challenges else "None identified",
-                strategy_summary=json.dumps(strategy, indent=2)[:500]
+                strategy_summary=get_fragment(state, "strategy")
             )
             style = "supportive_guidance"
             style_reason = f"Moderate anxiety ({anxiety}/10) - balanced approach"
@@ -470,25 +458,51 @@ async def run_synthesizer_agent(state: MindMoneyState):
         else:
             prompt = CARE_PROMPT_CALM.format(
                 health_score=health_score,
-                challenges=json.dumps(challenges, indent=2),
-                opportunities=json.dumps(opportunities, indent=2),
-                strategy=json.dumps(strategy, indent=2)
+                challenges=get_fragment(state, "challenges"),
+                opportunities=get_fragment(state, "opportunities"),
+                strategy=get_fragment(state, "strategy")
             )
             style = "strategic_optimization"
             style_reason = f"Low anxiety ({anxiety}/10) - optimization focus"
-        
-        context = f"USER MESSAGE: {state['user_input']}\nFINANCIAL ANALYSIS: {json.dumps(wealth, indent=2)[:1000]}"
-
+    
+    builder = PromptBuilder("Care Manager", prompt, settings.care_token_budget)
+    builder.add("\nCONTEXT:")
+    builder.add(f"USER MESSAGE: {state['user_input']}")
+    if intent == "DATA_SUBMISSION":
+        facts = get_fragment(state, "facts")
+        if facts:
+            builder.add(f"COMPUTED FACTS (exact - explain, don't recalculate): {facts}", priority=HIGH)
+        # Droppable: the style prompt above already carries the parts of the analysis it needs
+        builder.add(f"FINANCIAL ANALYSIS: {get_fragment(state, 'profile')}", priority=NORMAL)
+
+    model = choose_model("care")
+    
+    # GREETING replies depend only on the template and the message - serve repeats from the pool
+    cache_key = None
+    if intent == "GREETING" and settings.response_cache_enabled:
+        cache_key = response_cache_key(prompt, state["user_input"], model, settings.synthesizer_temperature)
+    
     try:
-        response = client.models.generate_content(
-            model=settings.model_name,
-            contents=f"SYSTEM: {prompt}\n\nCONTEXT:\n{context}",
-            config=types.GenerateContentConfig(
-                temperature=settings.synthesizer_temperature
-            )
-        )
-        
-        final_text = response.text.strip() if response.text else "I'm here to help. Could you tell me more about your financial situation?"
+        cached_text = get_response_cache().get(cache_key) if cache_key else None
+        if cached_text is not None:
+            final_text = cached_text
+            emit_stream_event({"type": "token", "text": final_text})
+        else:
+            # Stream tokens so /api/chat/stream can forward them as they arrive
+            chunks = []
+            async for text in generate_content_stream(
+                contents=builder.build(),
+                config=agent_generation_config("care", temperature=settings.synthesizer_temperature),
+                model=model,
+                agent="care"
+            ):
+                chunks.append(text)
+                emit_stream_event({"type": "token", "text": text})
+            
+            full_text = "".join(chunks).strip()
+            final_text = full_text if full_text else "I'm here to help. Could you tell me more about your financial situation?"
+            if cache_key and full_text:
+                get_response_cache().put(cache_key, full_text)
         
         # =========== OUTPUT STATE ===========
         output_state = {
@@ -496,21 +510,28 @@ async def run_synthesizer_agent(state: MindMoneyState):
             "style_reason": style_reason,
             "response_length": len(final_text),
             "used_financial_data": bool(wealth and intent == "DATA_SUBMISSION"),
-            "emotional_calibration": f"Matched {primary_emotion} with {style} approach"
+            "emotional_calibration": f"Matched {primary_emotion} with {style} approach",
+            "served_from_cache": cached_text is not None
         }
         
         # =========== ENHANCED LOG ===========
         log = {
             "agent": "Care Manager",
             "role": "Empathetic Response Synthesis",
-            "thought": f"Style: {style} | {style_reason}. Synthesized {len(final_text)} char response using {'financial analysis + ' if wealth else ''}emotional profile.",
+            "thought": (
+                f"Style: {style} | {style_reason}. Served {len(final_text)} char response from the reply cache (no LLM call)."
+                if cached_text is not None else
+                f"Style: {style} | {style_reason}. Synthesized {len(final_text)} char response using {'financial analysis + ' if wealth else ''}emotional profile."
+            ),
             "status": "complete",
             "input_state": input_state,
             "output_state": output_state,
             "state_changes": {
                 "added": ["final_response"],
-                "routing": "→ Action Generator" if intent == "DATA_SUBMISSION" else "→ END (conversational)"
-            }
+                "routing": "→ END (joins Action Generator)" if intent == "DATA_SUBMISSION" else "→ END (conversational)"
+            },
+            **builder.log_fields(),
+            "model_used": model if cached_text is None else None
         }
         
         return {
@@ -518,6 +539,8 @@ async def run_synthesizer_agent(state: MindMoneyState):
             "agent_log": [log]
         }
         
+    except UpstreamOverloaded:
+        raise
     except Exception as e:
         print(f"Synthesizer Error: {e}")
         return {
@@ -529,7 +552,8 @@ async def run_synthesizer_agent(state: MindMoneyState):
                 "status": "failed",
                 "input_state": input_state,
                 "output_state": {"error": str(e)[:100]},
-                "state_changes": {"added": ["final_response (fallback)"], "routing": "→ END"}
+                "state_changes": {"added": ["final_response (fallback)"], "routing": "→ END"},
+                "model_used": model
             }]
         }
 
@@ -538,38 +562,17 @@ async def run_synthesizer_agent(state: MindMoneyState):
 # AGENT 4: ACTION GENERATOR
 # ============================================================================
 ACTION_PROMPT = """You are a Financial Planning Specialist. 
-Generate a JSON form schema and specific action items based on the financial strategy.
-
-OUTPUT ONLY VALID JSON:
-{
-  "financial_planning_form": {
-    "title": "Your Financial Action Plan",
-    "description": "Track your progress with these action items"
-  },
-  "immediate_actions": [
-    {
-      "action": "Specific action description",
-      "deadline": "This week|Next 2 weeks|This month",
-      "difficulty": "easy|medium|hard",
-      "expected_impact": "What this accomplishes",
-      "category": "debt|savings|income|budgeting"
-    }
-  ],
-  "quick_wins": ["Easy win 1", "Easy win 2"],
-  "metrics_to_track": [
-    {"name": "Metric name", "current": "Current value", "target": "Target value", "timeframe": "When"}
-  ],
-  "milestones": [
-    {"milestone": "Description", "target_date": "Timeframe", "reward": "How to celebrate"}
-  ]
-}"""
+Generate a form header and specific action items based on the financial strategy.
+OUTPUT: the structured action plan - immediate_actions (each with deadline, difficulty,
+expected_impact and category), quick_wins, metrics_to_track (current vs target) and
+milestones with a way to celebrate each."""
 
 
 async def run_action_generator(state: MindMoneyState):
     """
     AGENT 4: Action Generator
     - Receives financial_profile from Agent 2
-    - Receives care context from Agent 3
+    - Runs concurrently with Agent 3 (doesn't need final_response)
     - Generates actionable plan items
     """
     intake = state.get("intake_profile", {})
@@ -578,7 +581,7 @@ async def run_action_generator(state: MindMoneyState):
     
     # =========== INPUT STATE ===========
     input_state = {
-        "received_from": ["Wealth Architect", "Care Manager"],
+        "received_from": ["Intake Specialist", "Wealth Architect"],
         "intent": intent,
         "has_financial_profile": bool(wealth),
         "health_score": wealth.get("financial_health_score") if wealth else None,
@@ -602,31 +605,26 @@ async def run_action_generator(state: MindMoneyState):
         }
 
     settings = get_settings()
-    client = get_gemini_client()
-    
-    context = f"""
-FINANCIAL HEALTH SCORE: {wealth.get('financial_health_score', 'Unknown')}/100
-
-STRATEGY:
-{json.dumps(wealth.get('detailed_strategy', {}), indent=2)}
-
-CHALLENGES:
-{json.dumps(wealth.get('major_challenges', []), indent=2)}
-
-OPPORTUNITIES:
-{json.dumps(wealth.get('immediate_opportunities', []), indent=2)}
-"""
+    builder = PromptBuilder("Action Generator", ACTION_PROMPT, settings.action_token_budget)
+    builder.add("CONTEXT:")
+    builder.add(f"FINANCIAL HEALTH SCORE: {wealth.get('financial_health_score', 'Unknown')}/100")
+    builder.add(f"STRATEGY:\n{get_fragment(state, 'strategy')}")
+    facts = get_fragment(state, "facts")
+    if facts:
+        builder.add(f"COMPUTED FACTS (exact - explain, don't recalculate): {facts}", priority=HIGH)
+    builder.add(f"CHALLENGES:\n{get_fragment(state, 'challenges')}", priority=NORMAL)
+    builder.add(f"OPPORTUNITIES:\n{get_fragment(state, 'opportunities')}", priority=LOW)
+    model = choose_model("action")
     
     try:
-        response = client.models.generate_content(
-            model=settings.model_name,
-            contents=f"SYSTEM: {ACTION_PROMPT}\nCONTEXT:\n{context}",
-            config=types.GenerateContentConfig(
-                temperature=0.3,
-                response_mime_type="application/json"
-            )
+        plan, llm_attempts = await generate_model(
+            contents=builder.build(),
+            config=agent_generation_config("action", temperature=0.3),
+            schema=ActionPlan,
+            model=model,
+            agent="action"
         )
-        data = safe_parse_json(response.text)
+        data = plan.model_dump(exclude_none=True)
         
         # Extract metrics for logging
         num_actions = len(data.get('immediate_actions', []))
@@ -640,7 +638,8 @@ OPPORTUNITIES:
             "quick_wins": quick_wins,
             "milestones": milestones,
             "metrics_to_track": metrics,
-            "categories": list(set([a.get("category", "general") for a in data.get("immediate_actions", [])]))
+            "categories": list(set([a.get("category", "general") for a in data.get("immediate_actions", [])])),
+            "llm_attempts": llm_attempts
         }
         
         # =========== ENHANCED LOG ===========
@@ -654,7 +653,9 @@ OPPORTUNITIES:
             "state_changes": {
                 "added": ["action_plan.immediate_actions", "action_plan.quick_wins", "action_plan.milestones", "action_plan.metrics"],
                 "routing": "→ END (pipeline complete)"
-            }
+            },
+            **builder.log_fields(),
+            "model_used": model
         }
         
         return {
@@ -662,6 +663,8 @@ OPPORTUNITIES:
             "agent_log": [log]
         }
         
+    except UpstreamOverloaded:
+        raise
     except Exception as e:
         print(f"Action Generator Error: {e}")
         return {
@@ -673,7 +676,8 @@ OPPORTUNITIES:
                 "status": "failed",
                 "input_state": input_state,
                 "output_state": {"error": str(e)[:100]},
-                "state_changes": {"added": [], "routing": "→ END (with error)"}
+                "state_changes": {"added": [], "routing": "→ END (with error)"},
+                "model_used": model
             }]
         }
 
@@ -715,7 +719,7 @@ async def run_research_agent(state: MindMoneyState):
     
     # Try to import and use Tavily if available
     try:
-        from tools import perform_market_search
+        from tools import cached_market_search
         
         wealth = state.get("financial_profile", {})
         debt_types = wealth.get("debt_analysis", {}).get("debt_types", [])
@@ -727,7 +731,8 @@ async def run_research_agent(state: MindMoneyState):
         else:
             query = "personal finance tips debt payoff strategies"
         
-        search_results = perform_market_search(query)
+        # Cached, coalesced and run off the event loop (see tools.py)
+        search_results = await cached_market_search(query)
         
         # =========== OUTPUT STATE ===========
         output_state = {
@@ -0,0 +1,93 @@
+"""
+bench_intent_classifier.py - Fast-path intent classifier vs the Intake LLM
+
+Runs intent_classifier.classify_intent_fast over a labelled corpus and reports:
+  - coverage:   fraction of messages settled locally (= Intake LLM calls avoided)
+  - accuracy:   agreement with the reference label on the messages it settled
+  - crisis:     crisis messages settled locally (must be 0; exits 1 otherwise)
+  - latency:    per-message cost of the fast path
+
+The corpus labels are the Intake LLM's intent for each message. Pass --llm to
+re-label against the live model (needs GEMINI_API_KEY) instead of using the
+stored labels.
+
+Usage (from backend/):
+    python -m benchmarks.bench_intent_classifier [--corpus path] [--llm] [-v]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+
+from intent_classifier import classify_intent_fast
+
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "intent_corpus.jsonl")
+
+
+async def llm_labels(messages):
+    """Ask the real Intake Specialist (fast path off) for each message's intent."""
+    import agents
+    from config import get_settings
+
+    get_settings().intake_fast_path = False
+    labels = []
+    for message in messages:
+        result = await agents.run_intake_agent({"user_input": message, "conversation_history": []})
+        labels.append(result["intake_profile"].get("intent", "GREETING"))
+    return labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--llm", action="store_true", help="Re-label the corpus with the live Intake LLM")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print every disagreement")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    labels = [row["intent"] for row in corpus]
+    if args.llm:
+        labels = asyncio.run(llm_labels([row["message"] for row in corpus]))
+
+    settled = correct = crisis_settled = 0
+    confusion = Counter()
+    started = time.perf_counter()
+    predictions = [classify_intent_fast(row["message"]) for row in corpus]
+    per_message_us = (time.perf_counter() - started) / len(corpus) * 1e6
+
+    for row, label, prediction in zip(corpus, labels, predictions):
+        if prediction is None:
+            continue
+        settled += 1
+        predicted = prediction["intent"]
+        confusion[(label, predicted)] += 1
+        if predicted == label:
+            correct += 1
+        elif args.verbose:
+            print(f"  MISMATCH: {row['message']!r} expected {label} got {predicted}")
+        if row.get("crisis"):
+            crisis_settled += 1
+            print(f"  CRISIS SETTLED LOCALLY: {row['message']!r}")
+
+    crisis_total = sum(1 for row in corpus if row.get("crisis"))
+    print(f"corpus:        {len(corpus)} messages ({'live LLM labels' if args.llm else 'stored labels'})")
+    print(f"coverage:      {settled}/{len(corpus)} = {settled / len(corpus):.1%} of Intake LLM calls avoided")
+    print(f"accuracy:      {correct}/{settled} = {correct / settled:.1%} on settled messages" if settled else "accuracy:      n/a")
+    print(f"crisis:        {crisis_settled}/{crisis_total} crisis messages settled locally (must be 0)")
+    print(f"latency:       {per_message_us:.1f} us/message")
+    print("confusion (reference -> fast path):")
+    for (label, predicted), count in sorted(confusion.items()):
+        print(f"  {label:>16} -> {predicted:<16} {count}")
+
+    # Crisis rows are must-defer cases: fail the run if any was settled locally
+    if crisis_settled:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
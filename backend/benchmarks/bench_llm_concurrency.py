@@ -0,0 +1,73 @@
+"""
+bench_llm_concurrency.py - Event-loop friendliness of the agent LLM path
+
+Drives run_intake_agent with N simulated users against a stubbed Gemini
+client and reports per-call latency. With the async path p50/p99 should stay
+close to the stub latency as concurrency grows; with --blocking the stub
+sleeps synchronously (the old behaviour) and latency grows linearly.
+
+Usage (from backend/):
+    python -m benchmarks.bench_llm_concurrency --latency-ms 200 --users 1,8,32,64
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import agents
+import llm
+from benchmarks.stubs import StubGeminiClient
+from config import get_settings
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_level(users: int, rounds: int) -> list:
+    """Each round, every user sends one message at the same instant."""
+    async def one_call(user: int, turn: int, arrived: float) -> float:
+        state = {
+            "user_input": f"hi from user {user} turn {turn}",
+            "conversation_history": [],
+            "intake_profile": {},
+            "financial_profile": {},
+            "agent_log": []
+        }
+        await agents.run_intake_agent(state)
+        return (time.perf_counter() - arrived) * 1000
+
+    timings = []
+    for turn in range(rounds):
+        arrived = time.perf_counter()
+        timings += await asyncio.gather(*(one_call(u, turn, arrived) for u in range(users)))
+    return timings
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--users", default="1,8,32,64")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--blocking", action="store_true", help="Simulate the old synchronous SDK call")
+    args = parser.parse_args()
+
+    stub = StubGeminiClient(args.latency_ms / 1000, blocking=args.blocking)
+    llm.get_gemini_client = lambda: stub
+    # Measure the LLM path itself, not the local intent fast path
+    get_settings().intake_fast_path = False
+
+    print(f"stub latency={args.latency_ms:.0f}ms mode={'blocking' if args.blocking else 'async'}")
+    print(f"{'users':>6} {'calls':>6} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    for users in [int(u) for u in args.users.split(",")]:
+        timings = await run_level(users, args.rounds)
+        print(
+            f"{users:>6} {len(timings):>6} {percentile(timings, 50):>9.1f} "
+            f"{percentile(timings, 99):>9.1f} {statistics.mean(timings):>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,131 @@
+"""
+bench_startup.py - Worker startup and cold-start cost
+
+Two measurements:
+  in-process  Each scenario runs in a fresh interpreter with the stubs from
+              benchmarks/stubs.py: import time of main, lifespan startup,
+              then the first and second /api/chat latency. "cold" skips the
+              lifespan warm-up (the old lazy behaviour), "warm" runs it.
+  --serve N   Launches `serve.py --workers N` for real and reports the time
+              until /readyz answers, until all N workers have answered, and
+              how long a SIGTERM takes to drain and exit.
+
+Usage (from backend/):
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --serve 4 --port 8765
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# ============================================================================
+# IN-PROCESS (one fresh interpreter per scenario)
+# ============================================================================
+async def child(scenario: str, llm_latency_ms: float):
+    from benchmarks.stubs import install_stubs
+    install_stubs(llm_latency_s=llm_latency_ms / 1000, search_latency_s=0.05, db_latency_s=0.01)
+
+    started = time.perf_counter()
+    import main as api
+    import_ms = (time.perf_counter() - started) * 1000
+
+    if scenario == "cold":
+        async def no_warm_up():
+            return None
+        api.warm_up = no_warm_up
+
+    result = {"scenario": scenario, "import_ms": round(import_ms, 1)}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        async with api.lifespan(api.app):
+            result["startup_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            transport = httpx.ASGITransport(app=api.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+                for label, message in (("first_chat_ms", "hello there"), ("second_chat_ms", "good morning")):
+                    started = time.perf_counter()
+                    await client.post("/api/chat", json={"message": message, "session_id": f"startup-{label}"})
+                    result[label] = round((time.perf_counter() - started) * 1000, 1)
+    print(json.dumps(result))
+
+
+def run_in_process(llm_latency_ms: float):
+    print(f"{'scenario':<8} {'import ms':>10} {'startup ms':>11} {'1st chat ms':>12} {'2nd chat ms':>12}")
+    for scenario in ("cold", "warm"):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_startup", "--child", scenario, "--llm-latency-ms", str(llm_latency_ms)],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(f"{scenario:<8} {r['import_ms']:>10.1f} {r['startup_ms']:>11.1f} {r['first_chat_ms']:>12.1f} {r['second_chat_ms']:>12.1f}")
+
+
+# ============================================================================
+# REAL LAUNCHER
+# ============================================================================
+def run_serve(workers: int, port: int, timeout_s: float):
+    env = {**os.environ, "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY") or "bench-placeholder"}
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--port", str(port), "--host", "127.0.0.1"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    first_ready = None
+    pids = set()
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1) as client:
+            while time.perf_counter() - started < timeout_s and len(pids) < workers:
+                try:
+                    response = client.get("/readyz", headers={"Connection": "close"})
+                    if response.status_code == 200:
+                        first_ready = first_ready or time.perf_counter() - started
+                        pids.add(response.json()["pid"])
+                except httpx.HTTPError:
+                    pass
+                time.sleep(0.02)
+        all_ready = time.perf_counter() - started if len(pids) >= workers else None
+
+        stop_started = time.perf_counter()
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=timeout_s)
+        drain_s = time.perf_counter() - stop_started
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+
+    print(f"workers={workers}")
+    print(f"  first worker ready  {first_ready * 1000:.0f} ms" if first_ready else "  never became ready")
+    print(f"  all workers seen    {all_ready * 1000:.0f} ms" if all_ready else f"  saw {len(pids)}/{workers} workers")
+    print(f"  SIGTERM to exit     {drain_s * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--serve", type=int, metavar="N", help="Launch serve.py with N workers instead")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--child", choices=["cold", "warm"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(child(args.child, args.llm_latency_ms))
+    elif args.serve:
+        run_serve(args.serve, args.port, args.timeout)
+    else:
+        run_in_process(args.llm_latency_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+loadtest.py - Offline throughput benchmark for main.app
+
+Drives /api/chat, /api/sessions and /api/history in-process (httpx over
+ASGI, lifespan included) with Gemini, Tavily and Supabase replaced by the
+deterministic stand-ins in benchmarks/stubs.py. Reports req/s,
+p50/p95/p99 per endpoint and intent, and event-loop lag.
+
+The request plan is generated from --seed, so two runs with the same
+arguments send the same requests; use --json to append results (tagged with
+the git commit) to a file and compare across commits.
+
+Usage (from backend/):
+    python -m benchmarks.loadtest --concurrency 1,16,64 --requests 400 \\
+        --mix greeting=0.4,clarification=0.3,data=0.3 --llm-latency-ms 300
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import httpx
+
+from benchmarks.stubs import install_stubs
+
+
+MESSAGES = {
+    "greeting": ["hi", "hello!", "hey there", "what can you do?", "good morning"],
+    "clarification": [
+        "I keep running out of money before payday",
+        "I have some credit card debt and don't know where to start",
+        "my student loans feel like they'll never go away",
+        "how do I even start budgeting"
+    ],
+    "data": [
+        "I make $4,200 a month and owe $6,500 on a card at 22%",
+        "rent is $1,600, I earn 3800 monthly, and have $12k in student loans",
+        "I have $800 saved and $18,500 of debt total",
+        "my car loan is $9,000 at 7% and I bring in $5k a month"
+    ]
+}
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def build_plan(total: int, users: int, endpoint_mix: Dict[str, float], intent_mix: Dict[str, float], seed: int) -> List[List[Tuple[str, str]]]:
+    """Per-user request lists: (kind, message) where kind is chat:<intent>, sessions or history."""
+    rng = random.Random(seed)
+    plan: List[List[Tuple[str, str]]] = [[] for _ in range(users)]
+    for i in range(total):
+        endpoint = rng.choices(list(endpoint_mix), weights=list(endpoint_mix.values()))[0]
+        if endpoint == "chat":
+            intent = rng.choices(list(intent_mix), weights=list(intent_mix.values()))[0]
+            plan[i % users].append((f"chat:{intent}", rng.choice(MESSAGES[intent])))
+        else:
+            plan[i % users].append((endpoint, ""))
+    return plan
+
+
+async def monitor_loop_lag(samples: List[float], stop: asyncio.Event, interval_s: float = 0.01):
+    """Event-loop lag = how late a short sleep wakes up."""
+    while not stop.is_set():
+        expected = time.perf_counter() + interval_s
+        await asyncio.sleep(interval_s)
+        samples.append(max(0.0, (time.perf_counter() - expected) * 1000))
+
+
+async def run_level(app, users: int, plan: List[List[Tuple[str, str]]], run_id: str) -> Dict[str, object]:
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    lag: List[float] = []
+    stop = asyncio.Event()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        async def user(index: int):
+            session_id = f"bench-{run_id}-{users}-{index}"
+            user_id = f"user-{index}"
+            for n, (kind, message) in enumerate(plan[index]):
+                started = time.perf_counter()
+                if kind.startswith("chat:"):
+                    # A fresh key per turn: every planned request runs, none is coalesced or replayed
+                    response = await client.post("/api/chat", json={
+                        "message": message, "session_id": session_id, "user_id": user_id
+                    }, headers={"Idempotency-Key": f"{session_id}-{n}"})
+                elif kind == "sessions":
+                    response = await client.get("/api/sessions", params={"user_id": user_id})
+                else:
+                    response = await client.get(f"/api/history/{session_id}")
+                latencies[kind].append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    errors[kind] += 1
+
+        lag_task = asyncio.create_task(monitor_loop_lag(lag, stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(user(i) for i in range(users)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await lag_task
+
+    all_latencies = [ms for samples in latencies.values() for ms in samples]
+    return {
+        "users": users,
+        "requests": len(all_latencies),
+        "errors": sum(errors.values()),
+        "req_per_s": round(len(all_latencies) / elapsed, 1),
+        "p50_ms": round(percentile(all_latencies, 50), 1),
+        "p95_ms": round(percentile(all_latencies, 95), 1),
+        "p99_ms": round(percentile(all_latencies, 99), 1),
+        "loop_lag_p99_ms": round(percentile(lag, 99), 2),
+        "loop_lag_max_ms": round(max(lag), 2) if lag else 0.0,
+        "by_kind": {
+            kind: {
+                "n": len(samples),
+                "p50_ms": round(percentile(samples, 50), 1),
+                "p95_ms": round(percentile(samples, 95), 1),
+                "p99_ms": round(percentile(samples, 99), 1),
+                "mean_ms": round(statistics.mean(samples), 1),
+                "errors": errors.get(kind, 0)
+            }
+            for kind, samples in sorted(latencies.items())
+        }
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,16,64", help="Concurrent simulated users per level")
+    parser.add_argument("--requests", type=int, default=400, help="Requests per level")
+    parser.add_argument("--mix", default="greeting=0.4,clarification=0.3,data=0.3", help="Intent mix of chat requests")
+    parser.add_argument("--endpoints", default="chat=0.8,sessions=0.1,history=0.1", help="Endpoint mix")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-jitter-ms", type=float, default=0)
+    parser.add_argument("--search-latency-ms", type=float, default=400)
+    parser.add_argument("--db-latency-ms", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Append results to this JSON-lines file")
+    parser.add_argument("--show-logs", action="store_true", help="Keep the app's per-request prints")
+    args = parser.parse_args()
+
+    stubs = install_stubs(
+        llm_latency_s=args.llm_latency_ms / 1000,
+        llm_jitter_s=args.llm_jitter_ms / 1000,
+        search_latency_s=args.search_latency_ms / 1000,
+        db_latency_s=args.db_latency_ms / 1000,
+        seed=args.seed
+    )
+    import main as api
+
+    intent_mix = parse_mix(args.mix)
+    endpoint_mix = parse_mix(args.endpoints)
+    run_id = f"{int(time.time())}"
+    results = []
+
+    print(f"stubs: llm={args.llm_latency_ms:.0f}ms search={args.search_latency_ms:.0f}ms db={args.db_latency_ms:.0f}ms | mix {args.mix} | endpoints {args.endpoints}")
+    print(f"{'users':>6} {'reqs':>6} {'err':>4} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'lag p99':>8} {'lag max':>8}")
+    async with api.lifespan(api.app):
+        for users in [int(u) for u in args.concurrency.split(",")]:
+            plan = build_plan(args.requests, users, endpoint_mix, intent_mix, args.seed)
+            calls_before = stubs["gemini"].calls
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if args.show_logs else devnull):
+                result = await run_level(api.app, users, plan, run_id)
+            result["llm_calls"] = stubs["gemini"].calls - calls_before
+            results.append(result)
+            print(
+                f"{users:>6} {result['requests']:>6} {result['errors']:>4} {result['req_per_s']:>8.1f} "
+                f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+                f"{result['loop_lag_p99_ms']:>8.2f} {result['loop_lag_max_ms']:>8.2f}"
+            )
+            for kind, stats in result["by_kind"].items():
+                print(f"{'':>6} {kind:<22} n={stats['n']:<5} p50={stats['p50_ms']:.1f} p95={stats['p95_ms']:.1f} p99={stats['p99_ms']:.1f} err={stats['errors']}")
+
+    if args.json:
+        with open(args.json, "a") as f:
+            f.write(json.dumps({
+                "commit": git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "args": vars(args),
+                "results": results
+            }) + "\n")
+        print(f"results appended to {args.json}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
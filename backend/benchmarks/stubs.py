@@ -0,0 +1,343 @@
+"""
+stubs.py - Deterministic stand-ins for Gemini, Tavily and Supabase
+
+Lets the benchmarks drive the real agents, workflow and API without quota or
+network: every upstream answers after a configurable latency with a fixed,
+schema-shaped payload. The Supabase stand-in replaces only the client, so
+SupabaseService's own query building and row shaping still run.
+
+    from benchmarks.stubs import install_stubs
+    install_stubs(llm_latency_s=0.3, search_latency_s=0.4, db_latency_s=0.02)
+"""
+import asyncio
+import json
+import random
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import agents
+import llm
+import supabase_logger
+import tools
+from config import get_settings
+
+
+# ============================================================================
+# GEMINI
+# ============================================================================
+WEALTH_PAYLOAD = {
+    "financial_snapshot": {"monthly_income": 4200, "monthly_expenses": 3900},
+    "debt_analysis": {
+        "debt_types": [
+            {"type": "Credit Card", "amount": 6500, "interest_rate": 22},
+            {"type": "Student Loan", "amount": 12000, "interest_rate": 5}
+        ]
+    },
+    "assets_and_savings": {"emergency_fund": "$800", "retirement_savings": "Unknown", "other_assets": "None"},
+    "major_challenges": ["High-interest card balance", "Thin emergency fund"],
+    "immediate_opportunities": ["Call card issuer for a rate reduction", "Automate $100/month to savings"],
+    "detailed_strategy": {
+        "phase_1_immediate": {"focus": "Stop card growth", "actions": ["Freeze card spending", "List all bills"], "timeline": "1-4 weeks"},
+        "phase_2_short_term": {"focus": "Pay down card", "actions": ["Avalanche extra $250/month"], "timeline": "1-3 months"},
+        "phase_3_long_term": {"focus": "Build buffer", "actions": ["Grow emergency fund to 3 months"], "timeline": "3-12 months"}
+    },
+    "key_metrics_to_track": ["Card balance", "Emergency fund"]
+}
+
+WEALTH_DELTA_PAYLOAD = {"financial_snapshot": {"monthly_expenses": 3700}}
+
+ACTION_PAYLOAD = {
+    "financial_planning_form": {"title": "Your Financial Action Plan", "description": "Track your progress"},
+    "immediate_actions": [
+        {"action": "Freeze card spending", "deadline": "This week", "difficulty": "easy", "category": "debt"},
+        {"action": "Call issuer about APR", "deadline": "This week", "difficulty": "medium", "category": "debt"}
+    ],
+    "quick_wins": ["Cancel unused subscriptions"],
+    "milestones": [{"milestone": "Card under $5,000", "target_date": "3 months"}],
+    "metrics_to_track": [{"name": "Card balance", "current": "$6,500", "target": "$0", "timeframe": "18 months"}]
+}
+
+CARE_REPLY = (
+    "Thanks for sharing this with me - it takes courage to look at the numbers. "
+    "## Your First Steps\n- Pause new card spending\n- List every bill and due date\n"
+    "- Move $100 to savings on payday\nYou're not behind, you're starting."
+)
+
+
+class StubUsage:
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+
+
+class StubResponse:
+    def __init__(self, text: str, usage: Optional[StubUsage] = None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+def stub_intent(message: str) -> str:
+    """What the stub Intake LLM answers: figures → data, greetings → greeting, else clarification."""
+    lowered = message.lower()
+    if any(ch.isdigit() for ch in message):
+        return "DATA_SUBMISSION"
+    if lowered.split()[:1] and lowered.split()[0].strip("!,.?") in {"hi", "hello", "hey", "thanks"}:
+        return "GREETING"
+    return "CLARIFICATION"
+
+
+class _StubModels:
+    def __init__(self, latency_s: float, jitter_s: float, blocking: bool, rng: random.Random):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.blocking = blocking
+        self.rng = rng
+        self.calls = 0
+
+    async def _wait(self):
+        delay = self.latency_s + (self.rng.uniform(0, self.jitter_s) if self.jitter_s else 0.0)
+        if self.blocking:
+            time.sleep(delay)
+        else:
+            await asyncio.sleep(delay)
+
+    def _payload(self, contents: str) -> str:
+        if contents.startswith(f"SYSTEM: {agents.INTAKE_PROMPT}"):
+            message = contents.rsplit("CURRENT MESSAGE:", 1)[-1].split("CONTEXT:")[-1].strip()
+            intent = stub_intent(message)
+            return json.dumps({
+                "intent": intent,
+                "emotional_state": {"anxiety": 5, "shame": 2, "overwhelm": 4, "hope": 5, "primary_emotion": "worried"},
+                "safety_concerns": {"crisis_flag": False, "escalation_needed": False},
+                "validation_hook": "It makes sense to feel uneasy about this.",
+                "missing_info": [] if intent == "DATA_SUBMISSION" else ["monthly income", "total debt amount"]
+            })
+        if contents.startswith(f"SYSTEM: {agents.WEALTH_DELTA_PROMPT}"):
+            return json.dumps(WEALTH_DELTA_PAYLOAD)
+        if contents.startswith(f"SYSTEM: {agents.WEALTH_PROMPT}"):
+            return json.dumps(WEALTH_PAYLOAD)
+        if contents.startswith(f"SYSTEM: {agents.ACTION_PROMPT}"):
+            return json.dumps(ACTION_PAYLOAD)
+        return CARE_REPLY
+
+    async def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        await self._wait()
+        text = self._payload(contents)
+        return StubResponse(text, StubUsage(len(contents) // 4, len(text) // 4))
+
+    async def generate_content_stream(self, model, contents, config=None):
+        self.calls += 1
+        await self._wait()
+        text = self._payload(contents)
+        words = text.split(" ")
+
+        async def chunks():
+            for i, word in enumerate(words):
+                last = i == len(words) - 1
+                usage = StubUsage(len(contents) // 4, len(text) // 4) if last else None
+                yield StubResponse(word if last else word + " ", usage)
+        return chunks()
+
+
+class _StubAio:
+    def __init__(self, models: _StubModels):
+        self.models = models
+
+
+class StubGeminiClient:
+    """Shape-compatible with genai.Client for the calls llm.py makes."""
+
+    def __init__(self, latency_s: float, jitter_s: float = 0.0, blocking: bool = False, seed: int = 0):
+        self.aio = _StubAio(_StubModels(latency_s, jitter_s, blocking, random.Random(seed)))
+
+    @property
+    def calls(self) -> int:
+        return self.aio.models.calls
+
+
+# ============================================================================
+# TAVILY
+# ============================================================================
+def make_stub_search(latency_s: float):
+    def stub_search(query: str) -> str:
+        time.sleep(latency_s)  # runs in a worker thread, like the real client
+        return (
+            f"- Debt avalanche vs snowball: pay highest APR first (Source: https://www.nerdwallet.com/)\n"
+            f"- Credit counselling in Canada (Source: https://www.canada.ca/)\n"
+            f"- Query: {query[:60]}"
+        )
+    return stub_search
+
+
+# ============================================================================
+# SUPABASE
+# ============================================================================
+class _Result:
+    def __init__(self, data: Any):
+        self.data = data
+
+
+class _FakeQuery:
+    """The subset of the postgrest builder SupabaseService uses."""
+
+    def __init__(self, db: "FakeSupabaseClient", table: str):
+        self.db = db
+        self.table = table
+        self.filters: List[tuple] = []
+        self.order_by: Optional[tuple] = None
+        self.row_limit: Optional[int] = None
+        self.op = "select"
+        self.payload: Any = None
+        self.is_single = False
+        self.columns: Optional[List[str]] = None
+
+    def select(self, *columns):
+        # "a, b" or "alias:column->key" (PostgREST JSON path); "*" = whole row
+        parts = [c.strip() for spec in columns for c in spec.split(",") if c.strip()]
+        self.columns = None if not parts or "*" in parts else parts
+        return self
+
+    def _project(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        if self.columns is None:
+            return dict(row)
+        projected = {}
+        for spec in self.columns:
+            alias, _, expr = spec.rpartition(":")
+            column, _, key = expr.partition("->")
+            value = row.get(column)
+            if key:
+                value = (value or {}).get(key)
+            projected[alias or key or column] = value
+        return projected
+
+    def eq(self, column: str, value: Any):
+        self.filters.append((column, value))
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, count: int):
+        self.row_limit = count
+        return self
+
+    def single(self):
+        self.is_single = True
+        return self
+
+    def insert(self, rows):
+        self.op, self.payload = "insert", rows
+        return self
+
+    def update(self, values: Dict[str, Any]):
+        self.op, self.payload = "update", values
+        return self
+
+    async def execute(self) -> _Result:
+        await asyncio.sleep(self.db.latency_s)
+        rows = self.db.tables.setdefault(self.table, [])
+        if self.op == "insert":
+            new_rows = self.payload if isinstance(self.payload, list) else [self.payload]
+            inserted = [{"id": str(uuid.uuid4()), **row} for row in new_rows]
+            rows.extend(inserted)
+            return _Result(inserted)
+
+        matched = [r for r in rows if all(r.get(c) == v for c, v in self.filters)]
+        if self.op == "update":
+            for row in matched:
+                row.update(self.payload)
+            return _Result(matched)
+
+        if self.order_by:
+            column, desc = self.order_by
+            matched = sorted(matched, key=lambda r: r.get(column) or 0, reverse=desc)
+        if self.row_limit is not None:
+            matched = matched[:self.row_limit]
+        if self.is_single:
+            return _Result(self._project(matched[0]) if matched else None)
+        return _Result([self._project(r) for r in matched])
+
+
+class _FakeRpc:
+    def __init__(self, db: "FakeSupabaseClient", params: Dict[str, Any]):
+        self.db = db
+        self.params = params
+
+    async def execute(self) -> _Result:
+        """Same effect as sql/upsert_session.sql."""
+        await asyncio.sleep(self.db.latency_s)
+        sessions = self.db.tables.setdefault("sessions", [])
+        now = datetime.utcnow().isoformat()
+        turns = self.params.get("p_turns", 1)
+        for session in sessions:
+            if session["session_id"] == self.params["p_session_id"]:
+                session["last_message_at"] = now
+                session["total_turns"] += turns
+                return _Result(None)
+        sessions.append({
+            "session_id": self.params["p_session_id"],
+            "preview": self.params["p_preview"],
+            "user_id": self.params["p_user_id"],
+            "first_message_at": now,
+            "last_message_at": now,
+            "total_turns": turns,
+            "had_safety_flag": False
+        })
+        return _Result(None)
+
+
+class FakeSupabaseClient:
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+
+    def table(self, name: str) -> _FakeQuery:
+        return _FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Dict[str, Any]) -> _FakeRpc:
+        return _FakeRpc(self, params)
+
+
+class InMemorySupabaseService(supabase_logger.SupabaseService):
+    """The real SupabaseService over an in-process table store."""
+
+    def __init__(self, latency_s: float):
+        super().__init__()
+        self.fake = FakeSupabaseClient(latency_s)
+
+    async def _create_client(self):
+        return self.fake
+
+    async def close(self):
+        self._client = None
+
+
+# ============================================================================
+# INSTALL
+# ============================================================================
+def install_stubs(
+    llm_latency_s: float = 0.3,
+    llm_jitter_s: float = 0.0,
+    search_latency_s: float = 0.4,
+    db_latency_s: float = 0.02,
+    seed: int = 0
+) -> Dict[str, Any]:
+    """Point every upstream at its stand-in. Returns the stubs for inspection."""
+    settings = get_settings()
+    settings.tavily_api_key = settings.tavily_api_key or "stub"
+    settings.redis_url = ""
+
+    gemini = StubGeminiClient(llm_latency_s, llm_jitter_s, seed=seed)
+    llm.get_gemini_client = lambda: gemini
+
+    search = make_stub_search(search_latency_s)
+    tools._tavily_search = search
+    tools.perform_market_search = search
+
+    service = InMemorySupabaseService(db_latency_s)
+    supabase_logger._service = service
+    return {"gemini": gemini, "supabase": service}
@@ -0,0 +1,150 @@
+"""
+Coalesce - In-flight request coalescing and idempotent replay for /api/chat.
+Double-submits and client retries of the same turn share one workflow run
+(and one logged turn) instead of each launching the full agent pipeline.
+Finished results are replayed only for requests carrying an Idempotency-Key:
+without one, the same message sent again later ("yes", "ok") is a new turn.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from config import get_settings
+from schemas import ChatRequest
+
+
+class IdempotencyConflict(Exception):
+    """An Idempotency-Key was reused for a different request body."""
+
+
+@dataclass
+class _InFlight:
+    fingerprint: str
+    task: "asyncio.Task[Any]"
+
+
+@dataclass
+class _CachedResult:
+    fingerprint: str
+    result: Any
+    expires_at: float
+
+
+def request_fingerprint(request: ChatRequest) -> str:
+    """Hash of everything that shapes the turn: session, user, message and client-sent history."""
+    raw = "\x1f".join([
+        request.session_id,
+        request.user_id or "",
+        request.message,
+        json.dumps(request.history, sort_keys=True, separators=(",", ":"))
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def coalesce_key(request: ChatRequest, idempotency_key: Optional[str]) -> Tuple[str, str]:
+    """
+    (key, fingerprint). The client's Idempotency-Key wins when sent (scoped to
+    the session); otherwise the request fingerprint itself is the key, which
+    only joins an identical request still in flight (see RequestCoalescer.run).
+    """
+    fingerprint = request_fingerprint(request)
+    if idempotency_key:
+        return f"idem:{request.session_id}:{idempotency_key}", fingerprint
+    return f"req:{fingerprint}", fingerprint
+
+
+class RequestCoalescer:
+    """
+    Runs one task per key at a time. Duplicates that arrive while it runs
+    await the same task; with `replay`, duplicates that arrive within
+    `result_ttl_s` after it succeeds get its result back. Failures are not
+    cached, so a retry after an error runs again. The task is shielded: a client disconnecting
+    doesn't cancel the work the other waiters (or its own retry) depend on.
+    """
+
+    def __init__(self, result_ttl_s: float, max_results: int):
+        self.result_ttl_s = result_ttl_s
+        self.max_results = max_results
+        self._inflight: Dict[str, _InFlight] = {}
+        self._results: "OrderedDict[str, _CachedResult]" = OrderedDict()
+
+        self.started = 0
+        self.joined = 0
+        self.replayed = 0
+        self.conflicts = 0
+
+    def _cached(self, key: str) -> Optional[_CachedResult]:
+        entry = self._results.get(key)
+        if entry is not None and entry.expires_at <= time.time():
+            del self._results[key]
+            return None
+        return entry
+
+    def _store(self, key: str, fingerprint: str, result: Any):
+        self._results[key] = _CachedResult(fingerprint, result, time.time() + self.result_ttl_s)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_results:
+            self._results.popitem(last=False)
+
+    async def run(self, key: str, fingerprint: str, work: Callable[[], Awaitable[Any]], replay: bool = True) -> Any:
+        cached = self._cached(key)
+        if cached is not None:
+            if cached.fingerprint != fingerprint:
+                self.conflicts += 1
+                raise IdempotencyConflict(key)
+            self.replayed += 1
+            return cached.result
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            if inflight.fingerprint != fingerprint:
+                self.conflicts += 1
+                raise IdempotencyConflict(key)
+            self.joined += 1
+            return await asyncio.shield(inflight.task)
+
+        async def leader():
+            try:
+                result = await work()
+                if replay:
+                    self._store(key, fingerprint, result)
+                return result
+            finally:
+                self._inflight.pop(key, None)
+
+        task = asyncio.create_task(leader())
+        self._inflight[key] = _InFlight(fingerprint, task)
+        self.started += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        duplicates = self.joined + self.replayed
+        total = self.started + duplicates
+        return {
+            "in_flight": len(self._inflight),
+            "cached_results": len(self._results),
+            "started": self.started,
+            "joined": self.joined,
+            "replayed": self.replayed,
+            "conflicts": self.conflicts,
+            "duplicate_rate": round(duplicates / total, 4) if total else 0.0
+        }
+
+
+_coalescer: Optional[RequestCoalescer] = None
+
+
+def get_coalescer() -> RequestCoalescer:
+    global _coalescer
+    if _coalescer is None:
+        settings = get_settings()
+        _coalescer = RequestCoalescer(
+            result_ttl_s=settings.coalesce_result_ttl_s,
+            max_results=settings.coalesce_max_results
+        )
+    return _coalescer
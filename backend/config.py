@@ -2,6 +2,7 @@
 config.py - Google GenAI SDK Setup (Type Safe)
 """
 import os
+from typing import Any, Dict
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from functools import lru_cache
 from dotenv import load_dotenv
@@ -15,13 +16,122 @@ class Settings(BaseSettings):
     # Supabase configuration
     supabase_url: str = ""
     supabase_key: str = ""
+    # Optional direct PostgREST endpoint (e.g. a local stand-in); bypasses supabase_url
+    supabase_rest_url: str = ""
+    supabase_pool_size: int = 20
+    supabase_timeout_s: float = 10.0
     
     model_name: str = "gemini-2.5-flash"
     
+    # Per-agent model tiers (agents: intake, wealth, care, action); unlisted agents use model_name.
+    # Env overrides are JSON, e.g. AGENT_MODELS='{"wealth": "gemini-2.5-pro"}'
+    agent_models: Dict[str, str] = {
+        "intake": "gemini-2.5-flash-lite",
+        "wealth": "gemini-2.5-flash",
+        "care": "gemini-2.5-flash",
+        "action": "gemini-2.5-flash-lite"
+    }
+    # Extra GenerateContentConfig fields per agent, e.g. {"wealth": {"max_output_tokens": 2048}}
+    agent_generation_config: Dict[str, Dict[str, Any]] = {}
+    # When an agent's rolling p95 Gemini latency exceeds its SLO, it uses fallback_model
+    agent_latency_slo_s: Dict[str, float] = {"intake": 4.0, "wealth": 25.0, "care": 15.0, "action": 12.0}
+    fallback_model: str = "gemini-2.5-flash-lite"
+    latency_window_s: float = 300.0
+    latency_min_samples: int = 20
+    
     intake_temperature: float = 0.3
+    # Settle obvious intents locally before calling the Intake LLM
+    intake_fast_path: bool = True
+    # Start Wealth/Research alongside intake when the message carries figures
+    speculative_analysis: bool = True
     planner_temperature: float = 0.1
     synthesizer_temperature: float = 0.6
     
+    # Per-agent input token budgets (prompt sections are dropped, never cut, to fit)
+    intake_token_budget: int = 1500
+    wealth_token_budget: int = 4000
+    care_token_budget: int = 3000
+    action_token_budget: int = 2500
+    
+    # Share of positive monthly cash flow the payoff plan puts toward debt (rest = savings)
+    payoff_surplus_share: float = 0.5
+    
+    # Extra Gemini calls allowed when a structured reply fails validation
+    structured_output_retries: int = 1
+    
+    # Hedged Gemini calls (opt-in): a call still running after the agent's rolling p90
+    # (time to first chunk for streams) gets a duplicate; first reply wins.
+    # Budget = hedges as % of calls.
+    llm_hedging: bool = False
+    hedge_quantile: float = 0.9
+    hedge_min_delay_s: float = 0.5
+    hedge_budget_pct: float = 5.0
+    hedge_burst: float = 10.0
+    
+    # Max Gemini calls kept in flight per worker (start and ceiling of the adaptive limit)
+    llm_max_concurrency: int = 64
+    
+    # Per-upstream limiter overrides (see limiter.UPSTREAM_DEFAULTS), e.g.
+    # UPSTREAM_LIMITS='{"gemini": {"rate_per_s": 10, "breaker_reset_s": 30}}'
+    upstream_limits: Dict[str, Dict[str, float]] = {}
+    
+    # Shared Gemini HTTP pool
+    gemini_pool_size: int = 32
+    gemini_keepalive_s: float = 120.0
+    gemini_http2: bool = True
+    
+    # Per-branch budgets for the parallel analysis fan-out (seconds)
+    wealth_timeout_s: float = 45.0
+    research_timeout_s: float = 8.0
+    
+    # Write-behind queue for Supabase turn logging
+    write_queue_max_size: int = 1000
+    write_batch_size: int = 50
+    write_flush_interval_s: float = 0.5
+    write_max_retries: int = 5
+    write_retry_base_s: float = 0.5
+    write_shutdown_timeout_s: float = 10.0
+    
+    # Recent-history cache (turns kept per session = what the agents read)
+    history_window_turns: int = 4
+    history_cache_ttl_s: float = 1800.0
+    history_cache_max_sessions: int = 10000
+    history_cache_max_bytes: int = 64 * 1024 * 1024
+    history_cache_max_profile_bytes: int = 32 * 1024 * 1024
+    
+    # Optional Redis session-state tier (disabled when redis_url is empty)
+    redis_url: str = ""
+    redis_pool_size: int = 50
+    state_ttl: int = 86400
+    
+    # Market Researcher search-result cache (empty path = memory only)
+    search_cache_ttl_s: float = 6 * 3600
+    search_cache_max_entries: int = 512
+    search_cache_path: str = ""
+    
+    # Care Manager reply cache for the GREETING path (set enabled=false to bypass)
+    response_cache_enabled: bool = True
+    response_cache_max_keys: int = 1024
+    response_cache_variants: int = 3
+    response_cache_ttl_s: float = 24 * 3600
+    
+    # /api/chat duplicate handling: finished results answer retries that resend
+    # the same Idempotency-Key for this long (requests without one only join in-flight twins)
+    coalesce_result_ttl_s: float = 30.0
+    coalesce_max_results: int = 2048
+    
+    # Production launcher (serve.py); web_concurrency 0 = one worker per CPU when
+    # redis_url is set, else a single worker (per-process session caches would go
+    # stale across workers without the shared tier)
+    server_host: str = "0.0.0.0"
+    server_port: int = 8000
+    web_concurrency: int = 0
+    # On SIGTERM: /readyz answers 503 for readiness_drain_s while still serving,
+    # then stop accepting and let in-flight turns finish for up to graceful_shutdown_s
+    readiness_drain_s: float = 5.0
+    graceful_shutdown_s: int = 30
+    server_keepalive_s: int = 75
+    
     debug: bool = True
     cors_origins: str = "*"
 
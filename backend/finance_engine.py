@@ -0,0 +1,423 @@
+"""
+finance_engine.py - Deterministic financial metrics for the Wealth Architect
+
+The Wealth Architect's LLM call only extracts figures (income, expenses,
+debts with balances and rates) and writes the qualitative strategy. Every
+number derived from those figures is computed here instead: cash flow,
+savings rate, debt-to-income, the 0-100 health score, Avalanche vs
+Snowball, and month-by-month payoff schedules. Same figures in, same
+numbers out - so results are reproducible, cacheable and consistent
+between turns, and downstream agents get them as facts to explain.
+"""
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import get_settings
+
+
+# Typical APRs used when the user didn't state one (flagged as assumed)
+DEFAULT_APR = {
+    "credit card": 22.0,
+    "student loan": 5.5,
+    "mortgage": 6.5,
+    "medical": 0.0,
+    "car loan": 8.0,
+    "auto loan": 8.0,
+    "personal loan": 12.0
+}
+OTHER_APR = 10.0
+
+# Amortisation term (months) used to estimate an installment loan's minimum payment
+DEFAULT_TERM_MONTHS = {"student loan": 120, "mortgage": 360, "car loan": 60, "auto loan": 60, "medical": 24}
+OTHER_TERM_MONTHS = 60
+
+# Fields the engine owns; everything else in the profile came from the LLM.
+# (total_debt is extracted too, but owned by the engine once debts are itemised.)
+COMPUTED_FIELDS = {
+    "financial_snapshot": ("monthly_cash_flow", "current_cash_flow", "savings_rate"),
+    "debt_analysis": ("minimum_payments", "debt_to_income_ratio", "recommended_strategy")
+}
+
+HIGH_INTEREST_APR = 15.0
+MAX_MONTHS = 600
+
+AMOUNT_PATTERN = re.compile(r"\$?\s*(\d[\d,]*(?:\.\d+)?)\s*([kK])?")
+RATE_PATTERN = re.compile(r"(\d+(?:\.\d+)?)")
+
+
+# ============================================================================
+# INPUT NORMALISATION
+# ============================================================================
+def parse_amount(value: Any) -> Optional[float]:
+    """Dollar amount from a number or text like "$1,200" / "5k"; None if there isn't one."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = AMOUNT_PATTERN.search(value or "") if isinstance(value, str) else None
+    if not match:
+        return None
+    amount = float(match.group(1).replace(",", ""))
+    return amount * 1000 if match.group(2) else amount
+
+
+def parse_rate(value: Any) -> Optional[float]:
+    """
+    Annual percentage from 22, "22%" or "0.9% APR"; None if unknown. The
+    value is always a percentage, as the schema asks - 0.9 is a 0.9% promo
+    rate, not 90%.
+    """
+    if isinstance(value, (int, float)):
+        rate = float(value)
+    else:
+        match = RATE_PATTERN.search(value or "") if isinstance(value, str) else None
+        if not match:
+            return None
+        rate = float(match.group(1))
+    return rate
+
+
+def _kind(debt_type: Optional[str]) -> str:
+    return (debt_type or "other").strip().lower()
+
+
+def _round_money(value: float) -> float:
+    return round(value, 2)
+
+
+def _percent(value: float) -> str:
+    return f"{value * 100:.0f}%"
+
+
+def normalise_debts(debt_types: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Debts with a balance, an APR (stated or assumed) and a minimum payment.
+    Names are unique - a second "Credit Card" becomes "Credit Card #2" - since
+    schedules and payoff orders are keyed by name.
+    """
+    debts = []
+    seen: Dict[str, int] = {}
+    for i, item in enumerate(debt_types or []):
+        balance = parse_amount(item.get("amount"))
+        if not balance or balance <= 0:
+            continue
+        kind = _kind(item.get("type"))
+        apr = parse_rate(item.get("interest_rate"))
+        apr_assumed = apr is None
+        if apr is None:
+            apr = DEFAULT_APR.get(kind, OTHER_APR)
+
+        minimum = parse_amount(item.get("minimum_payment"))
+        if not minimum:
+            minimum = estimate_minimum_payment(kind, balance, apr)
+        name = item.get("type") or f"Debt {i + 1}"
+        seen[name] = seen.get(name, 0) + 1
+        if seen[name] > 1:
+            name = f"{name} #{seen[name]}"
+        debts.append({
+            "name": name,
+            "balance": balance,
+            "apr": apr,
+            "apr_assumed": apr_assumed,
+            "minimum": min(minimum, balance)
+        })
+    return debts
+
+
+def estimate_minimum_payment(kind: str, balance: float, apr: float) -> float:
+    """Card-style (interest + 1%, at least $25) for revolving debt, amortised otherwise."""
+    monthly_rate = apr / 100 / 12
+    if kind == "credit card":
+        return max(25.0, balance * monthly_rate + balance * 0.01)
+    term = DEFAULT_TERM_MONTHS.get(kind, OTHER_TERM_MONTHS)
+    if monthly_rate == 0:
+        return balance / term
+    return balance * monthly_rate / (1 - (1 + monthly_rate) ** -term)
+
+
+# ============================================================================
+# PAYOFF SIMULATION
+# ============================================================================
+DebtKey = Tuple[Tuple[str, float, float, float], ...]
+
+
+def _debt_key(debts: List[Dict[str, Any]]) -> DebtKey:
+    return tuple((d["name"], round(d["balance"], 2), round(d["apr"], 4), round(d["minimum"], 2)) for d in debts)
+
+
+@lru_cache(maxsize=1024)
+def _simulate(debts: DebtKey, monthly_budget: float, strategy: str) -> Tuple:
+    """
+    Month-by-month payoff: interest accrues, every debt gets its minimum,
+    everything left in the budget (including minimums freed by paid-off
+    debts) goes to the target debt - highest APR first for Avalanche,
+    smallest balance first for Snowball. Returns nested tuples, so the
+    cached result can't be mutated by a caller (see simulate_payoff).
+    """
+    names = [d[0] for d in debts]
+    balances = [d[1] for d in debts]
+    aprs = [d[2] for d in debts]
+    minimums = [d[3] for d in debts]
+    if strategy == "Avalanche":
+        order = sorted(range(len(debts)), key=lambda i: (-aprs[i], balances[i]))
+    else:
+        order = sorted(range(len(debts)), key=lambda i: (balances[i], -aprs[i]))
+
+    interest_paid = [0.0] * len(debts)
+    paid_off_month: List[Optional[int]] = [None] * len(debts)
+    schedule = []
+    month = 0
+    while any(b > 0.005 for b in balances) and month < MAX_MONTHS:
+        month += 1
+        for i in range(len(debts)):
+            if balances[i] > 0:
+                interest = balances[i] * aprs[i] / 100 / 12
+                balances[i] += interest
+                interest_paid[i] += interest
+
+        available = monthly_budget
+        payments = [0.0] * len(debts)
+        for i in range(len(debts)):
+            pay = min(minimums[i], balances[i], available)
+            payments[i] += pay
+            balances[i] -= pay
+            available -= pay
+        for i in order:
+            if available <= 0:
+                break
+            pay = min(balances[i], available)
+            payments[i] += pay
+            balances[i] -= pay
+            available -= pay
+
+        for i in range(len(debts)):
+            if balances[i] <= 0.005 and paid_off_month[i] is None:
+                balances[i] = 0.0
+                paid_off_month[i] = month
+        schedule.append((
+            month,
+            tuple((names[i], _round_money(payments[i])) for i in range(len(debts)) if payments[i]),
+            _round_money(sum(balances))
+        ))
+
+    paid_off = all(b <= 0.005 for b in balances)
+    return (
+        paid_off,
+        month if paid_off else None,
+        _round_money(sum(interest_paid)),
+        tuple((names[i], aprs[i], paid_off_month[i], _round_money(interest_paid[i])) for i in order),
+        tuple(schedule)
+    )
+
+
+def simulate_payoff(debts: List[Dict[str, Any]], monthly_budget: float, strategy: str) -> Dict[str, Any]:
+    """Full payoff schedule for normalised debts (see normalise_debts), as fresh dicts."""
+    paid_off, months, total_interest, order, schedule = _simulate(_debt_key(debts), round(monthly_budget, 2), strategy)
+    return {
+        "strategy": strategy,
+        "paid_off": paid_off,
+        "months_to_debt_free": months,
+        "total_interest": total_interest,
+        "order": [
+            {"debt": name, "apr": apr, "paid_off_month": month, "interest_paid": interest}
+            for name, apr, month, interest in order
+        ],
+        "schedule": [
+            {"month": month, "payments": dict(payments), "remaining_balance": remaining}
+            for month, payments, remaining in schedule
+        ]
+    }
+
+
+def _summary(result: Dict[str, Any]) -> Dict[str, Any]:
+    """The schedule without its month-by-month rows (see payoff_schedule), plus the balance at each year end."""
+    summary = {k: v for k, v in result.items() if k != "schedule"}
+    summary["balance_by_year"] = [row["remaining_balance"] for row in result["schedule"][11::12]]
+    return summary
+
+
+# ============================================================================
+# METRICS
+# ============================================================================
+def health_score(
+    savings_rate: Optional[float],
+    dti: Optional[float],
+    emergency_months: Optional[float],
+    high_interest_share: float
+) -> int:
+    """
+    0-100 from four components; an unknown input earns half its points.
+      savings rate   30  (-10% → 0, 20%+ → 30)
+      debt-to-income 30  (50%+ → 0, 10% or less → 30)
+      emergency fund 20  (0 → 0, 6+ months of expenses → 20)
+      high-APR debt  20  (share of debt at 15%+ APR: none → 20, all → 0)
+    """
+    def scaled(value: Optional[float], worst: float, best: float, points: float) -> float:
+        if value is None:
+            return points / 2
+        position = (value - worst) / (best - worst)
+        return points * min(1.0, max(0.0, position))
+
+    score = (
+        scaled(savings_rate, -0.10, 0.20, 30)
+        + scaled(dti, 0.50, 0.10, 30)
+        + scaled(emergency_months, 0.0, 6.0, 20)
+        + 20 * (1 - high_interest_share)
+    )
+    return int(round(score))
+
+
+def choose_strategy(avalanche: Dict[str, Any], snowball: Dict[str, Any], total_debt: float) -> str:
+    """
+    Avalanche unless the two orders differ and it saves little interest
+    (under $100 or 1% of the debt), in which case Snowball's earlier wins
+    are worth more than the difference.
+    """
+    same_order = [step["debt"] for step in avalanche["order"]] == [step["debt"] for step in snowball["order"]]
+    saving = snowball["total_interest"] - avalanche["total_interest"]
+    if not same_order and saving < max(100.0, 0.01 * total_debt):
+        return "Snowball"
+    return "Avalanche"
+
+
+def compute_financials(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Every derived figure for a financial profile, shaped as a partial
+    profile to merge over it. Pass the extracted profile (see
+    extracted_profile) so nothing computed last turn is read back in.
+    Every engine-owned field is always present - None when its inputs are
+    missing rather than guessed - and payoff_plan is complete or None, so a
+    deep merge replaces last turn's figures instead of keeping stale ones.
+    """
+    settings = get_settings()
+    snapshot = profile.get("financial_snapshot") or {}
+    debt_analysis = profile.get("debt_analysis") or {}
+    assets = profile.get("assets_and_savings") or {}
+
+    income = parse_amount(snapshot.get("monthly_income"))
+    expenses = parse_amount(snapshot.get("monthly_expenses"))
+    debts = normalise_debts(debt_analysis.get("debt_types") or [])
+
+    computed_snapshot: Dict[str, Any] = dict.fromkeys(COMPUTED_FIELDS["financial_snapshot"])
+    computed_debt: Dict[str, Any] = dict.fromkeys(COMPUTED_FIELDS["debt_analysis"])
+    cash_flow = savings_rate = dti = None
+
+    if income and expenses is not None:
+        cash_flow = income - expenses
+        savings_rate = cash_flow / income
+        computed_snapshot["monthly_cash_flow"] = _round_money(cash_flow)
+        computed_snapshot["current_cash_flow"] = (
+            "Neutral" if abs(cash_flow) < 0.02 * income else "Positive" if cash_flow > 0 else "Negative"
+        )
+        computed_snapshot["savings_rate"] = _percent(savings_rate)
+
+    # Itemised debts are summed; otherwise the stated total (if any) stands
+    total_debt = sum(d["balance"] for d in debts) if debts else parse_amount(debt_analysis.get("total_debt"))
+    computed_debt["total_debt"] = _round_money(total_debt) if total_debt is not None else None
+    if debts:
+        minimums = sum(d["minimum"] for d in debts)
+        computed_debt["minimum_payments"] = _round_money(minimums)
+        if income:
+            dti = minimums / income
+            computed_debt["debt_to_income_ratio"] = _percent(dti)
+
+    emergency_fund = parse_amount(assets.get("emergency_fund"))
+    emergency_months = emergency_fund / expenses if emergency_fund is not None and expenses else None
+    high_interest = sum(d["balance"] for d in debts if d["apr"] >= HIGH_INTEREST_APR)
+    high_interest_share = high_interest / total_debt if debts and total_debt else 0.0
+
+    computed: Dict[str, Any] = {
+        "financial_snapshot": computed_snapshot,
+        "debt_analysis": computed_debt,
+        "financial_health_score": None,
+        "payoff_plan": None
+    }
+    if income or debts:
+        computed["financial_health_score"] = health_score(savings_rate, dti, emergency_months, high_interest_share)
+
+    if debts:
+        # Minimums plus a share of any surplus go to debt; the rest builds savings
+        budget = sum(d["minimum"] for d in debts) + max(0.0, cash_flow or 0.0) * settings.payoff_surplus_share
+        avalanche = simulate_payoff(debts, budget, "Avalanche")
+        snowball = simulate_payoff(debts, budget, "Snowball")
+        strategy = choose_strategy(avalanche, snowball, total_debt)
+        chosen = avalanche if strategy == "Avalanche" else snowball
+        other = snowball if strategy == "Avalanche" else avalanche
+        computed_debt["recommended_strategy"] = strategy
+        same_order = [step["debt"] for step in chosen["order"]] == [step["debt"] for step in other["order"]]
+        computed["payoff_plan"] = {
+            **_summary(chosen),
+            "monthly_budget": _round_money(budget),
+            "assumed_aprs": [d["name"] for d in debts if d["apr_assumed"]],
+            "alternative": None if same_order else {
+                "strategy": other["strategy"],
+                "months_to_debt_free": other["months_to_debt_free"],
+                "total_interest": other["total_interest"]
+            }
+        }
+    return computed
+
+
+def payoff_schedule(profile: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    The month-by-month schedule behind a profile's payoff_plan (same debts,
+    budget and strategy), or None if it has none. Kept out of the profile -
+    up to MAX_MONTHS rows - and recomputed on request, which the simulation
+    cache makes cheap.
+    """
+    plan = profile.get("payoff_plan")
+    debts = normalise_debts((profile.get("debt_analysis") or {}).get("debt_types") or [])
+    if not plan or not debts:
+        return None
+    return simulate_payoff(debts, plan["monthly_budget"], plan["strategy"])
+
+
+def extracted_profile(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The profile without computed fields - what the LLM is shown when updating
+    it, and what compute_financials recomputes from. total_debt counts as
+    computed when the debts are itemised, since it's then the engine's sum.
+    """
+    extracted = {k: v for k, v in profile.items() if k not in ("financial_health_score", "payoff_plan")}
+    for section, fields in COMPUTED_FIELDS.items():
+        if isinstance(extracted.get(section), dict):
+            extracted[section] = {k: v for k, v in extracted[section].items() if k not in fields}
+    debt_analysis = extracted.get("debt_analysis")
+    if isinstance(debt_analysis, dict) and debt_analysis.get("debt_types"):
+        extracted["debt_analysis"] = {k: v for k, v in debt_analysis.items() if k != "total_debt"}
+    return extracted
+
+
+def format_facts(profile: Dict[str, Any]) -> str:
+    """One compact line of the computed figures, for prompts that must explain (not redo) them."""
+    snapshot = profile.get("financial_snapshot") or {}
+    debt = profile.get("debt_analysis") or {}
+    plan = profile.get("payoff_plan") or {}
+    facts = []
+    if snapshot.get("monthly_cash_flow") is not None:
+        facts.append(f"cash flow ${snapshot['monthly_cash_flow']:,.0f}/mo (savings rate {snapshot.get('savings_rate')})")
+    if debt.get("total_debt") is not None:
+        facts.append(f"total debt ${debt['total_debt']:,.0f}")
+    if debt.get("debt_to_income_ratio"):
+        facts.append(f"minimum payments {debt['debt_to_income_ratio']} of income")
+    if profile.get("financial_health_score") is not None:
+        facts.append(f"health score {profile['financial_health_score']}/100")
+    if plan:
+        if plan.get("paid_off"):
+            facts.append(
+                f"{plan['strategy']} at ${plan['monthly_budget']:,.0f}/mo: debt-free in {plan['months_to_debt_free']} months, "
+                f"${plan['total_interest']:,.0f} interest"
+            )
+        else:
+            facts.append(f"{plan['strategy']} at ${plan['monthly_budget']:,.0f}/mo does not clear the debt within {MAX_MONTHS // 12} years")
+        alternative = plan.get("alternative") or {}
+        if alternative.get("months_to_debt_free"):
+            facts.append(
+                f"{alternative['strategy']} instead: {alternative['months_to_debt_free']} months, "
+                f"${alternative['total_interest']:,.0f} interest"
+            )
+        order = [f"{step['debt']} (month {step['paid_off_month']})" for step in plan.get("order", []) if step.get("paid_off_month")]
+        if order:
+            facts.append("payoff order: " + ", ".join(order))
+        if plan.get("assumed_aprs"):
+            facts.append("typical APR assumed for: " + ", ".join(plan["assumed_aprs"]))
+    return "; ".join(facts)
@@ -0,0 +1,194 @@
+"""
+History Cache - In-process LRU + TTL cache of recent conversation turns.
+Sits in front of Supabase so a chat turn doesn't re-read the whole session.
+"""
+
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List
+
+from config import get_settings
+
+
+# Rough per-turn bookkeeping overhead (dicts, ints) on top of the text itself
+_TURN_OVERHEAD_BYTES = 200
+
+
+@dataclass
+class _CachedSession:
+    turns: List[Dict[str, Any]]
+    expires_at: float
+    size_bytes: int
+
+
+@dataclass
+class _CachedProfile:
+    profile: Dict[str, Any]
+    expires_at: float
+    size_bytes: int
+
+
+def _turn_size(turn: Dict[str, Any]) -> int:
+    return (
+        len((turn.get("user_message") or "").encode("utf-8"))
+        + len((turn.get("assistant_response") or "").encode("utf-8"))
+        + _TURN_OVERHEAD_BYTES
+    )
+
+
+class HistoryCache:
+    """
+    Keeps the last `window_turns` turns per session, in turn order, plus the
+    session's last financial profile. Entries expire after `ttl_s`; least
+    recently used entries are evicted once either the session count or the
+    approximate byte budget is exceeded. Turns and profiles have separate
+    byte budgets, so one kind can't crowd the other out.
+    """
+
+    def __init__(
+        self,
+        window_turns: int,
+        ttl_s: float,
+        max_sessions: int,
+        max_bytes: int,
+        max_profile_bytes: int
+    ):
+        self.window_turns = window_turns
+        self.ttl_s = ttl_s
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.max_profile_bytes = max_profile_bytes
+        self._entries: "OrderedDict[str, _CachedSession]" = OrderedDict()
+        self._profiles: "OrderedDict[str, _CachedProfile]" = OrderedDict()
+        self._bytes = 0
+        self._profile_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Cached turns for a session, or None on a miss/expiry."""
+        entry = self._entries.get(session_id)
+        if entry is None or entry.expires_at < time.monotonic():
+            if entry is not None:
+                self._remove(session_id)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(session_id)
+        self.hits += 1
+        return list(entry.turns)
+
+    def put(self, session_id: str, turns: List[Dict[str, Any]]):
+        """Replace a session's cached window (e.g. after loading it from the DB)."""
+        turns = sorted(turns, key=lambda t: t.get("turn_number", 0))[-self.window_turns:]
+        self._store(session_id, turns)
+
+    def append_turn(
+        self,
+        session_id: str,
+        turn_number: int,
+        user_message: str,
+        assistant_response: str
+    ):
+        """
+        Write-through for a freshly logged turn. Idempotent per turn_number.
+        A session we don't hold is only started when this is its first turn;
+        otherwise the next read loads the real window from the DB.
+        """
+        turn = {
+            "turn_number": turn_number,
+            "user_message": user_message,
+            "assistant_response": assistant_response
+        }
+        entry = self._entries.get(session_id)
+        if entry is None or entry.expires_at < time.monotonic():
+            if turn_number == 1:
+                self._store(session_id, [turn])
+            elif entry is not None:
+                self._remove(session_id)
+            return
+        turns = [t for t in entry.turns if t.get("turn_number") != turn_number] + [turn]
+        self.put(session_id, turns)
+
+    def get_profile(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Last financial profile ({} = session has none yet), or None if not cached."""
+        entry = self._profiles.get(session_id)
+        if entry is None or entry.expires_at < time.monotonic():
+            if entry is not None:
+                self._remove_profile(session_id)
+            return None
+        self._profiles.move_to_end(session_id)
+        return entry.profile
+
+    def put_profile(self, session_id: str, profile: Dict[str, Any]):
+        if session_id in self._profiles:
+            self._remove_profile(session_id)
+        size = len(json.dumps(profile, default=str)) + _TURN_OVERHEAD_BYTES
+        self._profiles[session_id] = _CachedProfile(
+            profile=profile,
+            expires_at=time.monotonic() + self.ttl_s,
+            size_bytes=size
+        )
+        self._profile_bytes += size
+        while self._profiles and (len(self._profiles) > self.max_sessions or self._profile_bytes > self.max_profile_bytes):
+            oldest = next(iter(self._profiles))
+            self._remove_profile(oldest)
+            self.evictions += 1
+
+    def _store(self, session_id: str, turns: List[Dict[str, Any]]):
+        if session_id in self._entries:
+            self._remove(session_id)
+        size = sum(_turn_size(t) for t in turns)
+        self._entries[session_id] = _CachedSession(
+            turns=turns,
+            expires_at=time.monotonic() + self.ttl_s,
+            size_bytes=size
+        )
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_sessions or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, session_id: str):
+        entry = self._entries.pop(session_id)
+        self._bytes -= entry.size_bytes
+
+    def _remove_profile(self, session_id: str):
+        entry = self._profiles.pop(session_id)
+        self._profile_bytes -= entry.size_bytes
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._entries),
+            "profiles": len(self._profiles),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "profile_bytes": self._profile_bytes,
+            "max_profile_bytes": self.max_profile_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions
+        }
+
+
+_cache: Optional[HistoryCache] = None
+
+
+def get_history_cache() -> HistoryCache:
+    global _cache
+    if _cache is None:
+        settings = get_settings()
+        _cache = HistoryCache(
+            window_turns=settings.history_window_turns,
+            ttl_s=settings.history_cache_ttl_s,
+            max_sessions=settings.history_cache_max_sessions,
+            max_bytes=settings.history_cache_max_bytes,
+            max_profile_bytes=settings.history_cache_max_profile_bytes
+        )
+    return _cache
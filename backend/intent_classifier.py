@@ -0,0 +1,158 @@
+"""
+intent_classifier.py - Deterministic fast path ahead of the Intake LLM call
+
+Settles the obvious cases locally (plain greetings, vague money concerns
+without numbers, messages carrying amounts or percentages) and returns None
+for anything ambiguous or emotionally loaded, so the Intake Specialist only
+spends a Gemini call where judgement is actually needed. Crisis language
+always goes to the LLM.
+"""
+import re
+from typing import Any, Dict, List, Optional
+
+
+# Anything that could signal risk of harm - never settled locally. Deliberately
+# broad (self-harm, methods, hopelessness, wanting to vanish): a false alarm
+# only costs one Intake LLM call. "can(no|')?t" covers can't / cant / cannot.
+CRISIS_PATTERN = re.compile(
+    r"\b(suicid\w*|kill(ing)? (my ?self|me)|end(ing)? (it|it all|my life|my own life|everything|things)|"
+    r"take (my|my own) life|self[- ]?harm\w*|hurt(ing)? myself|cut(ting)? myself|hang(ing)? myself|"
+    r"overdos\w*|jump(ing)? (off|in front)|bridge|noose|pills|"
+    r"(want|wanna|wish|going|ready) to die|(wish|rather) (i )?(was |were |be )?dead|better off dead|"
+    r"better off without me|do(n'?t| not) want to (live|be here|be alive|exist|wake up)|"
+    r"nothing to live for|not worth living|reason to live|"
+    r"can(no|')?t (go on|take (it|this|any ?more)|do this any ?more|keep going|cope|live like this)|"
+    r"no (way out|point|hope|future)|hopeless\w*|worthless|give up on (life|everything|myself)|giving up|"
+    r"(all|it|this|everything) (to )?be over|be over with|disappear\w*|vanish\w*|not be (here|around)|"
+    r"goodbye forever|say goodbye)\b",
+    re.IGNORECASE
+)
+
+# Emotionally loaded language - the LLM's emotional assessment matters here
+EMOTION_PATTERN = re.compile(
+    r"\b(stress(ed|ful)?|anxious|anxiety|scared|terrified|afraid|fear|panic\w*|worr(y|ied|ying)|"
+    r"overwhelm\w*|ashamed|shame|embarrass\w*|guilt\w*|depress\w*|desperate|crying|cried|"
+    r"upset|angry|frustrat\w*|lost|drowning|nightmare|can(no|')?t sleep|freaking out|losing my mind|"
+    r"help me|i do(n'?t| not) know what to do|sad|miserable|awful|terrible|horrible|hate|"
+    r"struggl\w*|suffer\w*|exhausted|alone|lonely|trapped|stuck|ruin\w*|failure|failed|"
+    r"devastat\w*|heartbroken|broken|breaking down|falling apart|can(no|')?t (handle|deal)|"
+    r"tired of|sick of|fed up|pointless|numb|empty)\b",
+    re.IGNORECASE
+)
+
+FINANCE_PATTERN = re.compile(
+    r"\b(debts?|loans?|credit|mortgage|rent|income|salary|wage|paycheck|pay|paid|earn\w*|"
+    r"save|saving|savings|budget\w*|owe|owing|broke|money|bills?|invest\w*|retire\w*|"
+    r"401k|rrsp|tfsa|house|tuition|student|expenses?|spend\w*|interest|apr|bank|"
+    r"emergency fund|financ\w*|cash)\b",
+    re.IGNORECASE
+)
+
+GREETING_PATTERN = re.compile(
+    r"^\s*(hi+|hello+|hey+|yo|hiya|howdy|greetings|good (morning|afternoon|evening)|"
+    r"what'?s up|sup|thanks|thank you)\b[\s!.,?]*(there|moneybird|bot)?[\s!.,?]*$",
+    re.IGNORECASE
+)
+
+META_QUESTION_PATTERN = re.compile(
+    r"^\s*(what (is|'s) this|what can you do|what do you do|who are you|what are you|"
+    r"how does this work|how do(es)? (this|you) work|what is moneybird|help)\b[\s\w]*[?!.]*\s*$",
+    re.IGNORECASE
+)
+
+# "$5,000", "5k", "5000 dollars", "12%", "4.5 percent"
+STRONG_AMOUNT_PATTERN = re.compile(
+    r"([$€£]\s?\d[\d,]*(\.\d+)?\s?[kKmM]?)|"
+    r"(\b\d[\d,]*(\.\d+)?\s?(k|K|grand|dollars?|bucks|usd|cad)\b)|"
+    r"(\b\d+(\.\d+)?\s?(%|percent\b))"
+)
+
+# A bare number of 3+ digits ("I make 4000 a month")
+BARE_NUMBER_PATTERN = re.compile(r"\b\d{1,3}(,\d{3})+\b|\b\d{3,}\b")
+
+# "in 2023", "since 2019" - years, not amounts
+YEAR_PHRASE_PATTERN = re.compile(r"\b(in|since|by|from|until|before|after|of)\s+(19|20)\d{2}\b", re.IGNORECASE)
+
+MAX_FAST_PATH_WORDS = 40
+
+NEUTRAL_EMOTIONS = {
+    "anxiety": 3,
+    "shame": 0,
+    "overwhelm": 2,
+    "hope": 5,
+    "primary_emotion": "neutral"
+}
+
+
+def has_money_signal(message: str) -> bool:
+    """Cheap predictor that a message carries financial figures."""
+    if STRONG_AMOUNT_PATTERN.search(message):
+        return True
+    message = YEAR_PHRASE_PATTERN.sub(" ", message)
+    return bool(
+        BARE_NUMBER_PATTERN.search(message)
+        and (FINANCE_PATTERN.search(message) or re.search(r"\b(make|made|bring in)\b", message, re.IGNORECASE))
+    )
+
+
+def _missing_info(message: str) -> List[str]:
+    """Figures to ask for, most relevant first (no numbers were given)."""
+    if re.search(r"\b(debts?|owe|owing|loans?|credit)\b", message, re.IGNORECASE):
+        return ["total debt amount", "monthly income", "monthly expenses"]
+    return ["monthly income", "monthly expenses", "total debt amount"]
+
+
+def _profile(intent: str, missing_info: Optional[List[str]] = None, validation: str = "") -> Dict[str, Any]:
+    return {
+        "intent": intent,
+        "emotional_state": dict(NEUTRAL_EMOTIONS),
+        "financial_psychology": {"money_beliefs": [], "triggers": []},
+        "rapport_indicators": {"engagement_level": "medium", "trust_needed": []},
+        "safety_concerns": {"crisis_flag": False, "escalation_needed": False},
+        "validation_hook": validation,
+        "missing_info": missing_info or [],
+        "classified_by": "fast_path"
+    }
+
+
+def classify_intent_fast(message: str, history: Optional[List[Dict[str, str]]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Returns an intake_profile for unambiguous messages, or None to defer to
+    the Intake LLM. Follow-up turns are only settled when they carry figures
+    or are plain greetings, since their meaning depends on the conversation.
+    """
+    text = message.strip()
+    if not text:
+        return None
+    if CRISIS_PATTERN.search(text) or EMOTION_PATTERN.search(text):
+        return None
+    if len(text.split()) > MAX_FAST_PATH_WORDS:
+        return None
+
+    has_finance = bool(FINANCE_PATTERN.search(text))
+    has_digits = any(ch.isdigit() for ch in text)
+
+    if has_money_signal(text):
+        return _profile(
+            "DATA_SUBMISSION",
+            validation="Thanks for sharing those numbers - that gives us something concrete to work with."
+        )
+
+    if has_digits:
+        # Numbers we can't interpret (ages, dates, counts) - let the LLM decide
+        return None
+
+    if GREETING_PATTERN.match(text) or (META_QUESTION_PATTERN.match(text) and not has_finance):
+        return _profile("GREETING", validation="Welcome - glad you're here.")
+
+    if history:
+        return None
+
+    if has_finance:
+        return _profile(
+            "CLARIFICATION",
+            missing_info=_missing_info(text),
+            validation="Thanks for opening up about this - a lot of people are in the same spot."
+        )
+
+    return None
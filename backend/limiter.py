@@ -0,0 +1,314 @@
+"""
+limiter.py - Per-upstream admission control for Gemini, Tavily and Supabase
+
+One UpstreamLimiter per service combines:
+  * an optional token bucket (requests/second per worker, with burst),
+  * an AIMD concurrency limit: starts at its ceiling unless initial_limit
+    is set, x0.9 when a call runs over the latency target, halved on a 429,
+    and +1/limit per healthy call back up to the ceiling,
+  * a bounded wait queue with a deadline, and
+  * a circuit breaker that opens after consecutive upstream failures
+    (429 / 5xx / transport errors) and lets one probe through after a
+    cool-down.
+A call that can't get in raises UpstreamOverloaded straight away instead of
+queueing without bound; /api/chat turns that into 503 + Retry-After.
+"""
+import asyncio
+import inspect
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Deque, Dict, Optional, TypeVar
+
+import httpx
+from prometheus_client import Counter
+
+from config import get_settings
+from metrics import timed_call
+
+
+T = TypeVar("T")
+
+LIMITER_EVENTS = Counter(
+    "mindmoney_limiter_events",
+    "Upstream limiter events: shed, rate_limited (429 seen), breaker_open",
+    ["service", "event"]
+)
+
+
+class UpstreamOverloaded(Exception):
+    """A call to `service` was shed; retry after `retry_after_s`."""
+
+    def __init__(self, service: str, retry_after_s: float, reason: str):
+        super().__init__(f"{service} overloaded ({reason})")
+        self.service = service
+        self.retry_after_s = max(1.0, retry_after_s)
+        self.reason = reason
+
+
+def _status_code(e: Exception) -> Optional[int]:
+    """HTTP status behind an SDK error, when it carries one."""
+    for candidate in (getattr(e, "code", None), getattr(e, "status_code", None),
+                      getattr(getattr(e, "response", None), "status_code", None)):
+        if isinstance(candidate, int):
+            return candidate
+    return None
+
+
+def is_rate_limited(e: Exception) -> bool:
+    return _status_code(e) == 429 or "resource_exhausted" in str(e).lower()
+
+
+def is_upstream_failure(e: Exception) -> bool:
+    """Errors that say the upstream is unhealthy (not e.g. a 400 for a bad request)."""
+    status = _status_code(e)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(e, (httpx.TransportError, asyncio.TimeoutError, ConnectionError))
+
+
+class UpstreamLimiter:
+    def __init__(
+        self,
+        service: str,
+        rate_per_s: float,
+        burst: float,
+        min_limit: int,
+        max_limit: int,
+        latency_target_s: float,
+        max_queue: int,
+        queue_timeout_s: float,
+        breaker_failures: int,
+        breaker_reset_s: float,
+        initial_limit: Optional[int] = None
+    ):
+        self.service = service
+        self.rate_per_s = rate_per_s
+        self.burst = burst or max(1.0, rate_per_s)   # a rate configured without a burst allows 1s worth
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target_s = latency_target_s
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_s = breaker_reset_s
+
+        # No probing up from a low start: full speed until the upstream pushes back
+        start = max_limit if initial_limit is None else initial_limit
+        self.limit = float(min(max(start, min_limit), max_limit))
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._tokens = burst
+        self._refilled_at = time.monotonic()
+
+        self.breaker_state = "closed"
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+        self.admitted = 0
+        self.shed = 0
+        self.rate_limited = 0
+        self.breaker_trips = 0
+
+    # ------------------------------------------------------------------ admission
+    def _reject(self, retry_after_s: float, reason: str) -> UpstreamOverloaded:
+        self.shed += 1
+        LIMITER_EVENTS.labels(self.service, "shed").inc()
+        return UpstreamOverloaded(self.service, retry_after_s, reason)
+
+    def _check_breaker(self):
+        if self.breaker_state == "open":
+            remaining = self._opened_at + self.breaker_reset_s - time.monotonic()
+            if remaining > 0:
+                raise self._reject(remaining, "circuit open")
+            self.breaker_state = "half_open"
+        if self.breaker_state == "half_open" and self._probe_in_flight:
+            raise self._reject(1.0, "circuit half-open, probe in flight")
+
+    @property
+    def saturated(self) -> bool:
+        return self.in_flight >= int(self.limit)
+
+    def admit(self):
+        """Raise now if a new call would be shed (breaker open or wait queue full)."""
+        self._check_breaker()
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject(self.queue_timeout_s, "queue full")
+
+    async def _take_token(self, deadline: float):
+        if not self.rate_per_s:
+            return
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_per_s)
+            self._refilled_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            wait = (1 - self._tokens) / self.rate_per_s
+            if now + wait > deadline:
+                raise self._reject(wait, "rate limit")
+            await asyncio.sleep(wait)
+
+    async def _take_slot(self, deadline: float, admitted: bool):
+        if not self._waiters and not self.saturated:
+            self.in_flight += 1
+            return
+        if not admitted and len(self._waiters) >= self.max_queue:
+            raise self._reject(self.queue_timeout_s, "queue full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            raise self._reject(self.queue_timeout_s, "queue timeout")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()   # the slot was handed over just as we were cancelled
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _release(self):
+        self.in_flight -= 1
+        while self._waiters and not self.saturated:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    # ------------------------------------------------------------------ feedback
+    def _on_success(self, latency_s: float):
+        self._consecutive_failures = 0
+        if self.breaker_state == "half_open":
+            self.breaker_state = "closed"
+        if self.latency_target_s and latency_s > self.latency_target_s:
+            self.limit = max(self.min_limit, self.limit * 0.9)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _on_failure(self, e: Exception):
+        if not is_upstream_failure(e):
+            return
+        if is_rate_limited(e):
+            self.rate_limited += 1
+            LIMITER_EVENTS.labels(self.service, "rate_limited").inc()
+            self.limit = max(self.min_limit, self.limit / 2)
+        self._consecutive_failures += 1
+        if self.breaker_state == "half_open" or self._consecutive_failures >= self.breaker_failures:
+            if self.breaker_state != "open":
+                self.breaker_trips += 1
+                LIMITER_EVENTS.labels(self.service, "breaker_open").inc()
+                print(f"{self.service} circuit opened after {self._consecutive_failures} failures ({e})")
+            self.breaker_state = "open"
+            self._opened_at = time.monotonic()
+
+    @asynccontextmanager
+    async def slot(self, admitted: bool = False) -> AsyncIterator[None]:
+        """
+        Hold one of this upstream's concurrency slots for the duration of a
+        call. admitted=True is for calls made on behalf of a request that
+        already passed admit(): they aren't shed for a full queue (only by
+        the deadline), so work already started isn't thrown away mid-turn.
+        A 429 from the upstream is re-raised as UpstreamOverloaded.
+        """
+        self._check_breaker()
+        probe = self.breaker_state == "half_open"
+        if probe:
+            self._probe_in_flight = True
+        try:
+            deadline = time.monotonic() + self.queue_timeout_s
+            await self._take_token(deadline)
+            await self._take_slot(deadline, admitted)
+        except BaseException:
+            if probe:
+                self._probe_in_flight = False
+            raise
+
+        self.admitted += 1
+        started = time.monotonic()
+        try:
+            yield
+        except UpstreamOverloaded:
+            raise
+        except Exception as e:
+            self._on_failure(e)
+            if is_rate_limited(e):
+                raise UpstreamOverloaded(self.service, min(self.breaker_reset_s, 2.0 * self._consecutive_failures), "upstream 429") from e
+            raise
+        else:
+            self._on_success(time.monotonic() - started)
+        finally:
+            if probe:
+                self._probe_in_flight = False
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "breaker": self.breaker_state,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "rate_limited": self.rate_limited,
+            "breaker_trips": self.breaker_trips
+        }
+
+
+# Per-worker defaults; settings.upstream_limits overrides individual keys.
+# Gemini starts at llm_max_concurrency with no rate bucket (rate_per_s 0 = off).
+UPSTREAM_DEFAULTS: Dict[str, Dict[str, float]] = {
+    "gemini": {
+        "rate_per_s": 0, "burst": 0, "min_limit": 2,
+        "latency_target_s": 30.0, "max_queue": 200, "queue_timeout_s": 5.0,
+        "breaker_failures": 5, "breaker_reset_s": 15.0
+    },
+    "tavily": {
+        "rate_per_s": 5, "burst": 10, "initial_limit": 4, "min_limit": 1, "max_limit": 8,
+        "latency_target_s": 5.0, "max_queue": 50, "queue_timeout_s": 2.0,
+        "breaker_failures": 5, "breaker_reset_s": 30.0
+    },
+    "supabase": {
+        "rate_per_s": 0, "burst": 0, "initial_limit": 10, "min_limit": 2,
+        "latency_target_s": 2.0, "max_queue": 500, "queue_timeout_s": 5.0,
+        "breaker_failures": 10, "breaker_reset_s": 10.0
+    }
+}
+
+_limiters: Dict[str, UpstreamLimiter] = {}
+
+
+def get_limiter(service: str) -> UpstreamLimiter:
+    """The worker's limiter for `service` (gemini, tavily, supabase)."""
+    limiter = _limiters.get(service)
+    if limiter is None:
+        settings = get_settings()
+        # Concurrency ceilings follow the existing pool / in-flight settings
+        ceilings = {"gemini": settings.llm_max_concurrency, "supabase": settings.supabase_pool_size}
+        params = {
+            "max_limit": ceilings.get(service, 16),
+            **UPSTREAM_DEFAULTS[service],
+            **settings.upstream_limits.get(service, {})
+        }
+        limiter = UpstreamLimiter(service, **params)
+        _limiters[service] = limiter
+    return limiter
+
+
+def limiter_stats() -> Dict[str, Any]:
+    return {service: limiter.stats() for service, limiter in _limiters.items()}
+
+
+async def limited_call(service: str, operation: str, awaitable: Awaitable[T]) -> T:
+    """timed_call inside a limiter slot. A shed call's coroutine is closed unstarted."""
+    try:
+        async with get_limiter(service).slot():
+            return await timed_call(service, operation, awaitable)
+    except UpstreamOverloaded:
+        if inspect.iscoroutine(awaitable):
+            awaitable.close()
+        raise
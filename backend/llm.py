@@ -0,0 +1,406 @@
+"""
+llm.py - Shared Gemini Client & Call Path
+One pooled client per process, reused by every agent.
+"""
+import asyncio
+import re
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, Type, TypeVar
+
+import httpx
+from google import genai
+from google.genai import types
+from pydantic import BaseModel, ValidationError
+
+from config import get_settings
+from metrics import LLM_HEDGES, Span, upstream_span
+from limiter import get_limiter
+from model_router import get_model_router
+from prompting import count_tokens
+
+
+T = TypeVar("T")
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+_client: Optional[genai.Client] = None
+
+
+def get_gemini_client() -> genai.Client:
+    """
+    Get or create the process-wide Gemini client.
+    The underlying HTTP pool keeps connections alive (HTTP/2 when enabled),
+    so agents stop paying a TLS handshake per call.
+    """
+    global _client
+    if _client is None:
+        settings = get_settings()
+        pool_args = {
+            "http2": settings.gemini_http2,
+            "limits": httpx.Limits(
+                max_connections=settings.gemini_pool_size,
+                max_keepalive_connections=settings.gemini_pool_size,
+                keepalive_expiry=settings.gemini_keepalive_s
+            )
+        }
+        _client = genai.Client(
+            api_key=settings.gemini_api_key,
+            http_options=types.HttpOptions(
+                client_args=pool_args,
+                async_client_args=pool_args
+            )
+        )
+    return _client
+
+
+async def close_gemini_client():
+    """Close the shared client's connection pools (called on app shutdown)."""
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        try:
+            await client.aio.aclose()
+            client.close()
+        except Exception as e:
+            print(f"Gemini client close error: {e}")
+
+
+# ============================================================================
+# HEDGING
+# ============================================================================
+class HedgeBudget:
+    """
+    Token bucket that caps hedges at `pct` percent of calls: every call
+    earns pct/100 of a hedge, every hedge spends one, up to `burst` saved.
+    """
+
+    def __init__(self, pct: float, burst: float):
+        self.ratio = pct / 100
+        self.burst = burst
+        self.credits = min(1.0, burst)
+
+        self.calls = 0
+        self.eligible = 0
+        self.sent = 0
+        self.won = 0
+        self.over_budget = 0
+        self.loser_prompt_tokens = 0
+        self.loser_output_tokens = 0
+
+    def earn(self):
+        self.calls += 1
+        self.credits = min(self.burst, self.credits + self.ratio)
+
+    def try_spend(self) -> bool:
+        self.eligible += 1
+        if self.credits < 1.0:
+            self.over_budget += 1
+            return False
+        self.credits -= 1.0
+        self.sent += 1
+        return True
+
+    def record_loser(self, usage_metadata: Any):
+        """Tokens spent by the losing call of a hedged pair - the extra cost of hedging."""
+        self.loser_prompt_tokens += usage_metadata.prompt_token_count or 0
+        self.loser_output_tokens += usage_metadata.candidates_token_count or 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": get_settings().llm_hedging,
+            "calls": self.calls,
+            "eligible": self.eligible,
+            "sent": self.sent,
+            "won": self.won,
+            "over_budget": self.over_budget,
+            "hedge_rate": round(self.sent / self.calls, 4) if self.calls else 0.0,
+            "win_rate": round(self.won / self.sent, 4) if self.sent else 0.0,
+            "credits": round(self.credits, 2),
+            "loser_prompt_tokens": self.loser_prompt_tokens,
+            "loser_output_tokens": self.loser_output_tokens
+        }
+
+
+_hedge_budget: Optional[HedgeBudget] = None
+
+
+def get_hedge_budget() -> HedgeBudget:
+    global _hedge_budget
+    if _hedge_budget is None:
+        settings = get_settings()
+        _hedge_budget = HedgeBudget(settings.hedge_budget_pct, settings.hedge_burst)
+    return _hedge_budget
+
+
+def _hedge_delay(agent: Optional[str], model: str) -> Optional[float]:
+    """How long to wait before hedging: the agent's rolling p90 (None = don't hedge)."""
+    settings = get_settings()
+    if not settings.llm_hedging or not agent:
+        return None
+    threshold = get_model_router().quantile(agent, model, settings.hedge_quantile)
+    if threshold is None:
+        return None
+    return max(threshold, settings.hedge_min_delay_s)
+
+
+def _usage_metadata(response: Any) -> Any:
+    return getattr(response, "usage_metadata", None)
+
+
+def _prompt_only_usage(contents: str) -> types.GenerateContentResponseUsageMetadata:
+    """Usage for a call cancelled before it reported any: its prompt, counted locally."""
+    return types.GenerateContentResponseUsageMetadata(
+        prompt_token_count=count_tokens(contents),
+        candidates_token_count=0
+    )
+
+
+async def _hedged_call(
+    request: Callable[[], Awaitable[T]],
+    delay: float,
+    agent: str,
+    span: Span,
+    contents: str,
+    usage_of: Callable[[T], Any] = _usage_metadata,
+    discard: Optional[Callable[[T], Awaitable[None]]] = None
+) -> T:
+    """
+    Runs `request`; if it hasn't finished after `delay` and the budget allows
+    (and a concurrency slot is free), runs a duplicate. The first success
+    wins and the other call is cancelled. The loser's tokens are still
+    recorded on `span` - its reported usage if it finished (then `discard`
+    closes its result), else its prompt counted locally - since Gemini bills
+    the work either way.
+    """
+    budget = get_hedge_budget()
+    primary = asyncio.ensure_future(request())
+    pending = {primary}
+    hedge = None
+    winner = None
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return primary.result()
+        if get_limiter("gemini").saturated:
+            # Worker is at its Gemini concurrency limit - a hedge would only queue
+            LLM_HEDGES.labels(agent, "no_slot").inc()
+            return await primary
+        if not budget.try_spend():
+            LLM_HEDGES.labels(agent, "over_budget").inc()
+            return await primary
+
+        async def hedge_request():
+            async with get_limiter("gemini").slot(admitted=True):
+                return await request()
+
+        hedge = asyncio.ensure_future(hedge_request())
+        pending.add(hedge)
+        LLM_HEDGES.labels(agent, "sent").inc()
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    if task is hedge:
+                        budget.won += 1
+                        LLM_HEDGES.labels(agent, "won").inc()
+                    else:
+                        LLM_HEDGES.labels(agent, "lost").inc()
+                    return task.result()
+        # Both failed - surface the primary's error
+        return primary.result()
+    finally:
+        for task in (primary, hedge):
+            if task is not None and not task.done():
+                task.cancel()
+        if winner is not None:
+            loser = hedge if winner is primary else primary
+            await _settle_loser(loser, span, contents, usage_of, discard)
+
+
+async def _settle_loser(
+    loser: "asyncio.Future[Any]",
+    span: Span,
+    contents: str,
+    usage_of: Callable[[Any], Any],
+    discard: Optional[Callable[[Any], Awaitable[None]]]
+):
+    """Record a losing hedge's tokens and release whatever it returned."""
+    try:
+        result = await loser
+    except asyncio.CancelledError:
+        usage = _prompt_only_usage(contents)
+    except Exception:
+        return  # failed calls aren't billed
+    else:
+        usage = usage_of(result) or _prompt_only_usage(contents)
+        if discard is not None:
+            try:
+                await discard(result)
+            except Exception as e:
+                print(f"Hedge cleanup error: {e}")
+    get_hedge_budget().record_loser(usage)
+    span.record_usage(usage)
+
+
+async def generate_content(
+    contents: str,
+    config: types.GenerateContentConfig,
+    model: Optional[str] = None,
+    agent: Optional[str] = None
+):
+    """
+    Awaits a Gemini completion on the SDK's async client so the event loop
+    stays free for other requests while the model is thinking.
+    `model` defaults to settings.model_name; with `agent` set, the call's
+    latency feeds that agent's fallback decision (see model_router.py) and,
+    with llm_hedging on, slow calls are hedged (see HEDGING).
+    """
+    model = model or get_settings().model_name
+    client = get_gemini_client()
+    
+    def request():
+        return client.aio.models.generate_content(model=model, contents=contents, config=config)
+    
+    async with upstream_span("gemini", "generate_content") as span:
+        async with get_limiter("gemini").slot(admitted=True):
+            span.mark_started()
+            if get_settings().llm_hedging:
+                get_hedge_budget().earn()
+            delay = _hedge_delay(agent, model)
+            if delay is None:
+                response = await request()
+            else:
+                response = await _hedged_call(request, delay, agent, span, contents)
+        if agent:
+            get_model_router().record(agent, model, time.perf_counter() - span.call_started)
+        span.record_usage(response.usage_metadata)
+        return response
+
+
+async def _close_stream(opened: Tuple[Any, Any]):
+    aclose = getattr(opened[0], "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+async def generate_content_stream(
+    contents: str,
+    config: types.GenerateContentConfig,
+    model: Optional[str] = None,
+    agent: Optional[str] = None
+) -> AsyncIterator[str]:
+    """
+    Yields the completion text chunk by chunk as Gemini produces it. With
+    llm_hedging on, a stream whose first chunk is slower than the agent's
+    rolling time-to-first-chunk p90 is hedged; nothing has been yielded yet,
+    so the caller just continues on whichever stream answered first.
+    """
+    model = model or get_settings().model_name
+    client = get_gemini_client()
+    first_chunk_key = f"{agent}:first_chunk" if agent else None
+    
+    async def open_stream():
+        stream = await client.aio.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=config
+        )
+        return stream, await anext(stream, None)
+    
+    async with upstream_span("gemini", "generate_content_stream") as span:
+        usage_metadata = None
+        async with get_limiter("gemini").slot(admitted=True):
+            span.mark_started()
+            if get_settings().llm_hedging:
+                get_hedge_budget().earn()
+            delay = _hedge_delay(first_chunk_key, model)
+            if delay is None:
+                stream, chunk = await open_stream()
+            else:
+                stream, chunk = await _hedged_call(
+                    open_stream, delay, agent, span, contents,
+                    usage_of=lambda opened: None, discard=_close_stream
+                )
+            if first_chunk_key:
+                get_model_router().record(first_chunk_key, model, time.perf_counter() - span.call_started)
+            while chunk is not None:
+                # Usage is reported on the final chunk
+                usage_metadata = chunk.usage_metadata or usage_metadata
+                if chunk.text:
+                    yield chunk.text
+                chunk = await anext(stream, None)
+        if agent:
+            get_model_router().record(agent, model, time.perf_counter() - span.call_started)
+        span.record_usage(usage_metadata)
+
+
+# ============================================================================
+# STRUCTURED OUTPUT
+# ============================================================================
+class StructuredOutputError(Exception):
+    """Gemini's reply still didn't match the schema after repair and retries."""
+
+
+def parse_model(text: Optional[str], schema: Type[ModelT]) -> ModelT:
+    """
+    Validates the reply straight into the model (pydantic's Rust JSON parser).
+    If that fails, retries once on the outermost {...} with code fences
+    stripped, which covers the usual ways a reply wraps its JSON.
+    """
+    if not text:
+        raise ValueError("empty response")
+    try:
+        return schema.model_validate_json(text)
+    except ValidationError as first_error:
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end <= start:
+            raise first_error
+        repaired = re.sub(r"```(json)?", "", text[start:end + 1])
+        return schema.model_validate_json(repaired)
+
+
+def _describe_error(e: Exception) -> str:
+    if isinstance(e, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in err['loc']) or 'reply'}: {err['msg']}"
+            for err in e.errors()[:3]
+        )
+    return str(e)
+
+
+async def generate_model(
+    contents: str,
+    config: types.GenerateContentConfig,
+    schema: Type[ModelT],
+    model: Optional[str] = None,
+    agent: Optional[str] = None
+) -> Tuple[ModelT, int]:
+    """
+    Gemini call constrained to `schema` (response_schema), parsed into the
+    model. An invalid reply is retried up to structured_output_retries times
+    with the validation error appended, then raises StructuredOutputError
+    instead of degrading to an empty dict. Returns (model, attempts).
+    """
+    settings = get_settings()
+    config = config.model_copy(update={
+        "response_mime_type": "application/json",
+        "response_schema": schema
+    })
+    
+    prompt = contents
+    attempts = 0
+    while True:
+        attempts += 1
+        response = await generate_content(contents=prompt, config=config, model=model, agent=agent)
+        try:
+            return parse_model(response.text, schema), attempts
+        except (ValidationError, ValueError) as e:
+            error = _describe_error(e)
+            if attempts > settings.structured_output_retries:
+                raise StructuredOutputError(f"{schema.__name__}: {error}") from e
+            print(f"{schema.__name__} output invalid ({error}) - retrying")
+            prompt = (
+                f"{contents}\n\nYOUR PREVIOUS REPLY WAS INVALID ({error[:200]}). "
+                f"Reply again with JSON matching the schema only."
+            )
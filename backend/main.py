@@ -1,16 +1,127 @@
 """
 main.py - The API Entrypoint (Fixed History & Logs)
 """
-from typing import Optional, List, Dict, Any
+import asyncio
+import json
+import math
+import os
+import signal
+import time
+from contextlib import asynccontextmanager
+from typing import Optional, List, Dict, Any, Tuple
 from fastapi import FastAPI, HTTPException, Header, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from schemas import ChatRequest, ChatResponse
-from workflow import run_mindmoney_workflow
-from supabase_logger import get_supabase_logger
+from workflow import get_speculation_stats, run_mindmoney_workflow, stream_mindmoney_workflow
+from supabase_logger import PendingTurn, get_supabase_logger
+from turn_writer import get_turn_writer
+from history_cache import get_history_cache
+from session_store import load_recent_turns, load_financial_profile, remember_turn
+from finance_engine import payoff_schedule
+from statemanager import get_state_manager
+from tools import get_search_cache, get_tavily_client
+from response_cache import get_response_cache
+from coalesce import IdempotencyConflict, coalesce_key, get_coalescer
+from llm import close_gemini_client, get_gemini_client, get_hedge_budget
+from config import get_settings
+from prompting import warm_tokenizer
+from metrics import metrics_payload
+from model_router import get_model_router
+from limiter import UpstreamOverloaded, get_limiter, limiter_stats
 import uvicorn
 
-app = FastAPI(title="MindMoney API")
+
+async def warm_up():
+    """
+    Create every lazily-built shared resource before the worker takes
+    traffic, so the first user on each worker doesn't pay the cold start.
+    (The LangGraph graph is already compiled when workflow is imported.)
+    """
+    settings = get_settings()
+    try:
+        get_gemini_client()
+    except Exception as e:
+        print(f"Gemini client warm-up error: {e}")
+    if settings.tavily_api_key:
+        get_tavily_client()
+    get_history_cache()
+    get_search_cache()
+    get_response_cache()
+    get_coalescer()
+    # The local tokenizer may fetch its vocabulary on first load
+    await asyncio.to_thread(warm_tokenizer)
+
+    try:
+        await get_supabase_logger().get_client()
+    except Exception as e:
+        print(f"Supabase warm-up error: {e}")
+
+    state_manager = get_state_manager()
+    if state_manager.enabled:
+        try:
+            await (await state_manager.get_client()).ping()
+        except Exception as e:
+            print(f"Redis warm-up error: {e}")
+
+
+def install_drain_hook(app: FastAPI, drain_s: float):
+    """
+    Wrap the server's SIGTERM handler so readiness flips first: /readyz
+    answers 503 for `drain_s` while the worker still serves, giving the load
+    balancer time to stop routing here; then the server's own graceful
+    shutdown starts. A second SIGTERM skips the wait. SIGINT is untouched.
+    Must run after the server installed its handlers (i.e. in the lifespan).
+    """
+    previous = signal.getsignal(signal.SIGTERM)
+    if drain_s <= 0 or not callable(previous):
+        return
+    loop = asyncio.get_running_loop()
+
+    def on_sigterm(sig, frame):
+        if getattr(app.state, "draining", False):
+            previous(sig, frame)
+            return
+        app.state.draining = True
+        app.state.ready = False
+        print(f"Worker {os.getpid()} draining: not ready, shutting down in {drain_s:g}s")
+        loop.call_soon_threadsafe(loop.call_later, drain_s, previous, sig, frame)
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    app.state.draining = False
+    started = time.perf_counter()
+    get_turn_writer().start()
+    await warm_up()
+    app.state.startup_ms = round((time.perf_counter() - started) * 1000, 1)
+    app.state.ready = True
+    install_drain_hook(app, get_settings().readiness_drain_s)
+    print(f"Worker {os.getpid()} ready in {app.state.startup_ms} ms")
+    yield
+    # Shutdown (readiness already 503 since SIGTERM, in-flight requests have
+    # drained): flush queued turn logs, then release pooled upstream connections
+    app.state.ready = False
+    await get_turn_writer().stop()
+    await close_gemini_client()
+    await get_supabase_logger().close()
+    await get_state_manager().close()
+
+
+app = FastAPI(title="MindMoney API", lifespan=lifespan)
+
+@app.exception_handler(UpstreamOverloaded)
+async def upstream_overloaded_handler(request, exc: UpstreamOverloaded):
+    """Shed load fast: 503 with Retry-After instead of a degraded answer or an unbounded queue."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "retry_after_s": round(exc.retry_after_s, 1)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after_s))}
+    )
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,6 +131,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- HEALTH PROBES ---
+@app.get("/healthz")
+async def liveness():
+    """Liveness: the worker's event loop is answering."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readiness():
+    """Readiness: warm-up finished and the worker isn't shutting down."""
+    if not getattr(app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"status": "starting_or_draining"})
+    return {"status": "ready", "pid": os.getpid(), "startup_ms": app.state.startup_ms}
+
 # --- 1. GET SESSIONS (Fixed Attribute Error) ---
 @app.get("/api/sessions")
 async def list_sessions(user_id: Optional[str] = Query(None)):
@@ -57,51 +181,219 @@ async def get_history(session_id: str):
         print(f"History Error: {e}")
         return {"history": []}
 
+# --- 3. GET PAYOFF SCHEDULE ---
+@app.get("/api/payoff-schedule/{session_id}")
+async def get_payoff_schedule(session_id: str, user_id: Optional[str] = Query(None)):
+    """Month-by-month payoff rows for the session's current plan (the profile only keeps a summary)."""
+    profile = await load_financial_profile(session_id, user_id)
+    schedule = payoff_schedule(profile)
+    if schedule is None:
+        raise HTTPException(status_code=404, detail="No payoff plan for this session")
+    return schedule
+
+# --- WRITE QUEUE HEALTH ---
+@app.get("/api/metrics/writes")
+async def write_queue_metrics():
+    """Queue depth, flush latency and dropped-write counters for alerting."""
+    return get_turn_writer().stats()
+
+@app.get("/api/metrics/history-cache")
+async def history_cache_metrics():
+    """Hit rate and memory use of the recent-history cache."""
+    return get_history_cache().stats()
+
+@app.get("/api/metrics/search-cache")
+async def search_cache_metrics():
+    """Hit rate of the Market Researcher's search cache."""
+    return get_search_cache().stats()
+
+@app.get("/api/metrics/response-cache")
+async def response_cache_metrics():
+    """Hit rate of the Care Manager's GREETING reply cache."""
+    return get_response_cache().stats()
+
+@app.get("/api/metrics/coalescing")
+async def coalescing_metrics():
+    """How many /api/chat duplicates joined an in-flight run or were replayed."""
+    return get_coalescer().stats()
+
+@app.get("/api/metrics/speculation")
+async def speculation_metrics():
+    """Hit rate and discarded (wasted) runs of the speculative Wealth/Research fan-out."""
+    return get_speculation_stats().stats()
+
+@app.get("/api/metrics/models")
+async def model_metrics():
+    """Per-agent model tier, latency SLO, rolling p95 per model and fallback count."""
+    return get_model_router().stats()
+
+@app.get("/api/metrics/hedging")
+async def hedging_metrics():
+    """Hedge rate, win rate and remaining budget of hedged Gemini calls."""
+    return get_hedge_budget().stats()
+
+@app.get("/api/metrics/limiters")
+async def limiter_metrics():
+    """Adaptive limit, in-flight, queue depth, breaker state and shed counts per upstream."""
+    return limiter_stats()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Per-agent and per-upstream latency/token histograms (Prometheus text format)."""
+    body, content_type = metrics_payload()
+    return Response(content=body, media_type=content_type)
+
 # --- 3. CHAT ENDPOINT (Fixed User Tracking) ---
+async def load_history_context(request: ChatRequest) -> Tuple[List[Dict[str, str]], int]:
+    """
+    Use the client's history, or rebuild the recent window from the
+    session store (cache → Redis → Supabase) when omitted.
+    Returns (history, turn_number for this message).
+    """
+    history_context = request.history
+    if history_context:
+        return history_context, (len(history_context) // 2) + 1
+
+    recent_turns = await load_recent_turns(request.session_id)
+    for h in recent_turns:
+        history_context.append({"role": "user", "content": h['user_message']})
+        history_context.append({"role": "assistant", "content": h['assistant_response']})
+    last_turn = recent_turns[-1].get("turn_number", len(recent_turns)) if recent_turns else 0
+    return history_context, last_turn + 1
+
+
+async def load_turn_context(request: ChatRequest) -> Tuple[List[Dict[str, str]], int, Dict[str, Any]]:
+    """History window, turn number and the session's stored financial profile, fetched together."""
+    (history_context, turn_number), financial_profile = await asyncio.gather(
+        load_history_context(request),
+        load_financial_profile(request.session_id, request.user_id)
+    )
+    return history_context, turn_number, financial_profile
+
+
+async def log_turn(request: ChatRequest, turn_number: int, result_state: Dict[str, Any]):
+    """
+    Write the turn through to the cache/Redis tiers, then hand it to the
+    write-behind queue; the response doesn't wait for Supabase.
+    """
+    turn = PendingTurn(
+        session_id=request.session_id,
+        turn_number=turn_number,
+        user_message=request.message,
+        assistant_response=result_state["final_response"],
+        state_snapshot=result_state,
+        agent_logs=result_state.get("agent_log", []),
+        user_id=request.user_id
+    )
+    await remember_turn(turn)
+    get_turn_writer().submit(turn)
+
+
+async def run_chat_turn(request: ChatRequest) -> ChatResponse:
+    """One full turn: context, workflow, turn log. Run at most once per duplicate group."""
+    # 1. Fetch Context
+    history_context, turn_number, financial_profile = await load_turn_context(request)
+
+    # 2. Run Workflow
+    result_state = await run_mindmoney_workflow(
+        user_input=request.message,
+        history=history_context,
+        financial_profile=financial_profile
+    )
+    
+    # 3. Queue the Supabase log (WITH USER ID) - written in the background
+    logs = result_state.get("agent_log", [])
+    await log_turn(request, turn_number, result_state)
+    
+    return ChatResponse(
+        response=result_state["final_response"],
+        agent_logs=logs,
+        action_plan=result_state.get("action_plan", {})
+    )
+
+
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(
+    request: ChatRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     # Debug print to confirm user_id is arriving
     print(f"Received: {request.message} (Session: {request.session_id}) User: {request.user_id}")
     
     try:
-        logger = get_supabase_logger()
+        # Refuse up front while Gemini is shedding, before loading any context
+        get_limiter("gemini").admit()
         
-        # 1. Fetch Context
-        history_context = request.history
-        if not history_context:
-             db_history = await logger.get_session_history(request.session_id)
-             for h in db_history:
-                 history_context.append({"role": "user", "content": h['user_message']})
-                 history_context.append({"role": "assistant", "content": h['assistant_response']})
-
-        # 2. Run Workflow
-        result_state = await run_mindmoney_workflow(
-            user_input=request.message,
-            history=history_context
-        )
-        
-        # 3. Log to Supabase (WITH USER ID)
-        logs = result_state.get("agent_log", [])
-        
-        await logger.log_conversation_turn(
-            session_id=request.session_id,
-            turn_number=(len(history_context) // 2) + 1,
-            user_message=request.message,
-            assistant_response=result_state["final_response"],
-            state_snapshot=result_state,
-            agent_logs=logs,
-            user_id=request.user_id 
-        )
-        
-        return ChatResponse(
-            response=result_state["final_response"],
-            agent_logs=logs,
-            action_plan=result_state.get("action_plan", {})
+        # Double-submits and retries share one run (and one logged turn);
+        # a finished result is only replayed to retries that send the same Idempotency-Key
+        key, fingerprint = coalesce_key(request, idempotency_key)
+        return await get_coalescer().run(
+            key, fingerprint, lambda: run_chat_turn(request), replay=idempotency_key is not None
         )
         
+    except UpstreamOverloaded:
+        raise
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
     except Exception as e:
         print(f"Chat Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+
+# --- 4. STREAMING CHAT ENDPOINT (Server-Sent Events) ---
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Same workflow as /api/chat, streamed as SSE:
+      agent_log - one per agent, as its node finishes
+      token     - Care Manager text as Gemini generates it
+      action_plan, then done (full response + logs) last
+    """
+    print(f"Received (stream): {request.message} (Session: {request.session_id}) User: {request.user_id}")
+    get_limiter("gemini").admit()
+
+    async def event_stream():
+        try:
+            history_context, turn_number, financial_profile = await load_turn_context(request)
+            result_state: Dict[str, Any] = {}
+
+            async for event in stream_mindmoney_workflow(request.message, history_context, financial_profile):
+                if event["type"] == "agent_log":
+                    yield sse_event("agent_log", event["entry"])
+                elif event["type"] == "token":
+                    yield sse_event("token", {"text": event["text"]})
+                elif event["type"] == "final":
+                    result_state = event["state"]
+
+            # Persist before the final events: once the client has `done` it may
+            # disconnect, which closes this generator. Shielded so a disconnect
+            # mid-write still records the turn (and its turn number).
+            await asyncio.shield(log_turn(request, turn_number, result_state))
+
+            yield sse_event("action_plan", result_state.get("action_plan"))
+            yield sse_event("done", ChatResponse(
+                response=result_state["final_response"],
+                agent_logs=result_state.get("agent_log", []),
+                action_plan=result_state.get("action_plan", {})
+            ).model_dump())
+
+        except UpstreamOverloaded as e:
+            # Headers are already sent - tell the client when to retry
+            yield sse_event("error", {"detail": str(e), "retry_after_s": round(e.retry_after_s, 1)})
+        except Exception as e:
+            print(f"Chat Stream Error: {e}")
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 if __name__ == "__main__":
+    # Development server; production runs `python serve.py` (multi-worker)
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,199 @@
+"""
+metrics.py - Prometheus instrumentation for agents and upstream calls
+
+Every LangGraph node and every external call (Gemini, Tavily, Supabase)
+runs inside a timing span that records wall time, queue wait, Gemini token
+usage and outcome. The histograms are served at /metrics; node timings and
+token usage are also stamped onto each agent_log entry.
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+
+T = TypeVar("T")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 45.0, 90.0)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+AGENT_DURATION = Histogram(
+    "mindmoney_agent_duration_seconds",
+    "Wall time of each agent / graph node",
+    ["agent", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+UPSTREAM_DURATION = Histogram(
+    "mindmoney_upstream_duration_seconds",
+    "Wall time of external calls, including any queue wait",
+    ["service", "operation", "agent", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+UPSTREAM_QUEUE_WAIT = Histogram(
+    "mindmoney_upstream_queue_wait_seconds",
+    "Time an external call waited for a concurrency slot",
+    ["service", "agent"],
+    buckets=LATENCY_BUCKETS
+)
+LLM_TOKENS = Histogram(
+    "mindmoney_llm_tokens",
+    "Gemini tokens per call, from the response usage metadata",
+    ["agent", "direction"],
+    buckets=TOKEN_BUCKETS
+)
+PROMPT_SECTIONS_DROPPED = Counter(
+    "mindmoney_prompt_sections_dropped",
+    "Prompt sections dropped to fit an agent's input token budget",
+    ["agent"]
+)
+
+SPECULATION = Counter(
+    "mindmoney_speculation",
+    "Speculative Wealth/Research runs started alongside intake, by outcome",
+    ["outcome"]
+)
+LLM_HEDGES = Counter(
+    "mindmoney_llm_hedges",
+    "Hedged Gemini calls: sent, won (hedge answered first), lost, over_budget, no_slot",
+    ["agent", "outcome"]
+)
+
+
+@dataclass
+class AgentUsage:
+    """Gemini usage accumulated while one agent runs."""
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+
+
+_current_agent: ContextVar[str] = ContextVar("mindmoney_agent", default="none")
+_current_usage: ContextVar[Optional[AgentUsage]] = ContextVar("mindmoney_agent_usage", default=None)
+
+
+# ============================================================================
+# UPSTREAM SPANS
+# ============================================================================
+class Span:
+    """Timing for one external call. Call mark_started() once a queued call gets its slot."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.call_started: Optional[float] = None
+        self.outcome = "ok"
+
+    def mark_started(self):
+        self.call_started = time.perf_counter()
+
+    def record_usage(self, usage_metadata: Any):
+        """Token counts from a Gemini response (usage_metadata may be missing)."""
+        if usage_metadata is None:
+            return
+        agent = _current_agent.get()
+        prompt_tokens = usage_metadata.prompt_token_count or 0
+        output_tokens = usage_metadata.candidates_token_count or 0
+        LLM_TOKENS.labels(agent, "input").observe(prompt_tokens)
+        LLM_TOKENS.labels(agent, "output").observe(output_tokens)
+
+        usage = _current_usage.get()
+        if usage is not None:
+            usage.llm_calls += 1
+            usage.prompt_tokens += prompt_tokens
+            usage.output_tokens += output_tokens
+
+
+@asynccontextmanager
+async def upstream_span(service: str, operation: str) -> AsyncIterator[Span]:
+    span = Span()
+    try:
+        yield span
+    except (asyncio.CancelledError, GeneratorExit):
+        span.outcome = "cancelled"
+        raise
+    except Exception:
+        span.outcome = "error"
+        raise
+    finally:
+        agent = _current_agent.get()
+        if span.call_started is not None:
+            UPSTREAM_QUEUE_WAIT.labels(service, agent).observe(span.call_started - span.started)
+        UPSTREAM_DURATION.labels(service, operation, agent, span.outcome).observe(time.perf_counter() - span.started)
+
+
+async def timed_call(service: str, operation: str, awaitable: Awaitable[T]) -> T:
+    """Await an external call inside a span (no queue to wait for)."""
+    async with upstream_span(service, operation):
+        return await awaitable
+
+
+# ============================================================================
+# NODE INSTRUMENTATION
+# ============================================================================
+def _outcome_from_logs(entries: list) -> str:
+    statuses = {entry.get("status") for entry in entries}
+    if "failed" in statuses:
+        return "failed"
+    if statuses and statuses <= {"idle"}:
+        return "skipped"
+    return "ok"
+
+
+def instrument_node(
+    agent: str,
+    node: Callable[[Any], Awaitable[Dict[str, Any]]]
+) -> Callable[[Any], Awaitable[Dict[str, Any]]]:
+    """
+    Wraps a graph node so its wall time and outcome land in
+    mindmoney_agent_duration_seconds, and its own agent_log entries get
+    duration_ms plus the Gemini usage of the calls it made. Keyword
+    arguments LangGraph injects (e.g. config) pass straight through.
+    """
+    @wraps(node)
+    async def instrumented(state, **kwargs):
+        usage = AgentUsage()
+        agent_token = _current_agent.set(agent)
+        usage_token = _current_usage.set(usage)
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await node(state, **kwargs)
+            own_entries = [e for e in (result or {}).get("agent_log", []) if e.get("agent") == agent]
+            outcome = _outcome_from_logs(own_entries)
+            duration_ms = round((time.perf_counter() - started) * 1000)
+            for entry in own_entries:
+                entry.setdefault("duration_ms", duration_ms)
+                if usage.llm_calls:
+                    entry["llm_usage"] = {
+                        "calls": usage.llm_calls,
+                        "prompt_tokens": usage.prompt_tokens,
+                        "output_tokens": usage.output_tokens
+                    }
+            return result
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            AGENT_DURATION.labels(agent, outcome).observe(time.perf_counter() - started)
+            _current_usage.reset(usage_token)
+            _current_agent.reset(agent_token)
+
+    return instrumented
+
+
+def metrics_payload() -> Tuple[bytes, str]:
+    """
+    Body and content type for the /metrics endpoint. Under the multi-worker
+    launcher (PROMETHEUS_MULTIPROC_DIR set, see serve.py) every worker
+    writes its samples to that directory and any worker serves the total.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,109 @@
+"""
+Model Router - Per-agent Gemini model tiers with a latency-aware fallback.
+Each agent gets its own model and generation config from settings. If an
+agent's recent Gemini calls on its configured model run over its latency
+SLO (rolling p95), its calls move to the fallback model until those slow
+samples age out of the window.
+"""
+
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from google.genai import types
+
+from config import get_settings
+
+
+def _quantile(samples: list, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ModelRouter:
+    """
+    Keeps a time-bounded window of call latencies per (agent, model).
+    Falling back doesn't feed the primary's window, so the primary is tried
+    again once its slow samples are older than `window_s` - a built-in
+    cool-down instead of flapping between models every call.
+    """
+
+    def __init__(self, window_s: float, min_samples: int):
+        self.window_s = window_s
+        self.min_samples = min_samples
+        self._samples: Dict[Tuple[str, str], Deque[Tuple[float, float]]] = {}
+        self.fallbacks: Dict[str, int] = {}
+
+    def record(self, agent: str, model: str, seconds: float):
+        self._samples.setdefault((agent, model), deque(maxlen=1000)).append((time.time(), seconds))
+
+    def quantile(self, agent: str, model: str, q: float) -> Optional[float]:
+        """Rolling latency quantile in seconds, or None with too few recent samples to judge."""
+        window = self._samples.get((agent, model))
+        if not window:
+            return None
+        cutoff = time.time() - self.window_s
+        while window and window[0][0] < cutoff:
+            window.popleft()
+        if len(window) < self.min_samples:
+            return None
+        return _quantile([seconds for _, seconds in window], q)
+
+    def p95(self, agent: str, model: str) -> Optional[float]:
+        return self.quantile(agent, model, 0.95)
+
+    def choose_model(self, agent: str) -> str:
+        settings = get_settings()
+        model = settings.agent_models.get(agent) or settings.model_name
+        slo = settings.agent_latency_slo_s.get(agent)
+        fallback = settings.fallback_model
+        if not slo or not fallback or fallback == model:
+            return model
+
+        p95 = self.p95(agent, model)
+        if p95 is not None and p95 > slo:
+            self.fallbacks[agent] = self.fallbacks.get(agent, 0) + 1
+            return fallback
+        return model
+
+    def stats(self) -> Dict[str, Any]:
+        settings = get_settings()
+        agents = sorted({agent for agent, _ in self._samples} | set(settings.agent_models))
+        return {
+            agent: {
+                "model": settings.agent_models.get(agent) or settings.model_name,
+                "slo_s": settings.agent_latency_slo_s.get(agent),
+                "p95_s": {
+                    model: round(p95, 3)
+                    for (a, model) in list(self._samples)
+                    if a == agent and (p95 := self.p95(agent, model)) is not None
+                },
+                "fallback_calls": self.fallbacks.get(agent, 0)
+            }
+            for agent in agents
+        }
+
+
+_router: Optional[ModelRouter] = None
+
+
+def get_model_router() -> ModelRouter:
+    global _router
+    if _router is None:
+        settings = get_settings()
+        _router = ModelRouter(
+            window_s=settings.latency_window_s,
+            min_samples=settings.latency_min_samples
+        )
+    return _router
+
+
+def choose_model(agent: str) -> str:
+    """Model for this agent's next call: its tier, or the fallback while over SLO."""
+    return get_model_router().choose_model(agent)
+
+
+def agent_generation_config(agent: str, **defaults: Any) -> types.GenerateContentConfig:
+    """The agent's GenerateContentConfig: code defaults, overridden by settings.agent_generation_config."""
+    overrides = get_settings().agent_generation_config.get(agent, {})
+    return types.GenerateContentConfig(**{**defaults, **overrides})
@@ -0,0 +1,173 @@
+"""
+prompting.py - Shared prompt assembly for the agents
+
+State fragments (the Wealth Architect's profile, strategy, challenges...)
+are serialised once as compact JSON and cached on the state under
+`prompt_fragments`, so the Care Manager and Action Generator don't each
+re-dump them. Prompts are built from prioritised sections and kept under a
+per-agent token budget by dropping whole low-priority sections, so JSON is
+never cut in half.
+
+Token counts come from Gemini's local tokenizer (google-genai[local-tokenizer],
+in requirements.txt). If it can't be loaded - e.g. its vocabulary can't be
+fetched - counts fall back to a length estimate, and every agent_log entry
+says which counter was used (`token_counter`).
+"""
+import json
+import math
+from typing import Any, Dict, List, Tuple
+
+from config import get_settings
+from finance_engine import format_facts
+from metrics import PROMPT_SECTIONS_DROPPED
+
+
+# Explicit fallback only, for when the local tokenizer can't be loaded
+CHARS_PER_TOKEN = 4
+
+# Section priorities - lower is dropped first when over budget
+REQUIRED = 100
+HIGH = 50
+NORMAL = 20
+LOW = 10
+
+
+# ============================================================================
+# TOKEN COUNTING
+# ============================================================================
+_tokenizer: Any = None
+_tokenizer_unavailable = False
+
+
+def _get_tokenizer():
+    global _tokenizer, _tokenizer_unavailable
+    if _tokenizer is None and not _tokenizer_unavailable:
+        try:
+            from google.genai.local_tokenizer import LocalTokenizer
+            _tokenizer = LocalTokenizer(model_name=get_settings().model_name)
+        except Exception as e:
+            print(f"Local tokenizer unavailable ({e}) - estimating tokens from length")
+            _tokenizer_unavailable = True
+    return _tokenizer
+
+
+def warm_tokenizer():
+    """Load the tokenizer up front (it may download its vocabulary on first use)."""
+    _get_tokenizer()
+
+
+def token_counter() -> str:
+    """"local" when counts come from the Gemini tokenizer, "estimate" for the length fallback."""
+    return "local" if _get_tokenizer() is not None else "estimate"
+
+
+def count_tokens(text: str) -> int:
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        try:
+            return tokenizer.count_tokens(text).total_tokens
+        except Exception:
+            pass
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+# ============================================================================
+# FRAGMENTS
+# ============================================================================
+def compact_json(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def build_profile_fragments(profile: Dict[str, Any]) -> Dict[str, str]:
+    """Every serialised view of the financial profile the downstream prompts use."""
+    strategy = profile.get("detailed_strategy", {})
+    return {
+        "profile": compact_json(profile),
+        "facts": format_facts(profile),
+        "strategy": compact_json(strategy),
+        "phase_1": compact_json(strategy.get("phase_1_immediate", {})),
+        "challenges": compact_json(profile.get("major_challenges", [])),
+        "opportunities": compact_json(profile.get("immediate_opportunities", []))
+    }
+
+
+def get_fragment(state: Dict[str, Any], name: str) -> str:
+    """
+    A serialised profile fragment, from the state's cache when the Wealth
+    Architect already produced it, else built from the profile. The node's
+    input state is never modified.
+    """
+    fragments = state.get("prompt_fragments")
+    if not fragments or name not in fragments:
+        fragments = build_profile_fragments(state.get("financial_profile") or {})
+    return fragments[name]
+
+
+def format_history(history: List[Dict[str, str]]) -> List[str]:
+    return [f"{msg.get('role', 'user').upper()}: {msg.get('content', '')}" for msg in history]
+
+
+# ============================================================================
+# PROMPT BUILDER
+# ============================================================================
+class PromptBuilder:
+    """
+    Assembles "SYSTEM: ..." plus labelled sections and enforces a token budget.
+    When over budget, the lowest-priority sections go first (earliest added
+    first among equals, so the oldest history turns are dropped before newer
+    ones). REQUIRED sections are always kept.
+    """
+
+    def __init__(self, agent: str, system: str, budget: int, separator: str = "\n"):
+        self.agent = agent
+        self.system = system
+        self.budget = budget
+        self.separator = separator
+        self._sections: List[Tuple[int, str]] = []
+        self.input_tokens = 0
+        self.dropped_sections = 0
+
+    def add(self, text: str, priority: int = REQUIRED) -> "PromptBuilder":
+        if text:
+            self._sections.append((priority, text))
+        return self
+
+    def add_history(self, history: List[Dict[str, str]], priority: int = LOW) -> "PromptBuilder":
+        for line in format_history(history):
+            self.add(line, priority)
+        return self
+
+    def build(self) -> str:
+        kept = list(range(len(self._sections)))
+        sizes = [count_tokens(text) for _, text in self._sections]
+        total = count_tokens(f"SYSTEM: {self.system}") + sum(sizes)
+
+        drop_order = sorted(
+            (i for i, (priority, _) in enumerate(self._sections) if priority < REQUIRED),
+            key=lambda i: (self._sections[i][0], i)
+        )
+        for i in drop_order:
+            if total <= self.budget:
+                break
+            kept.remove(i)
+            total -= sizes[i]
+            self.dropped_sections += 1
+            PROMPT_SECTIONS_DROPPED.labels(self.agent).inc()
+
+        if total > self.budget:
+            print(f"{self.agent}: prompt is {total} tokens, over its {self.budget} budget with only required sections left")
+
+        prompt = self.separator.join(
+            [f"SYSTEM: {self.system}"] + [self._sections[i][1] for i in kept]
+        )
+        self.input_tokens = count_tokens(prompt)
+        return prompt
+
+    def log_fields(self) -> Dict[str, Any]:
+        """Merged into the agent's log entry."""
+        return {
+            "input_tokens": self.input_tokens,
+            "token_budget": self.budget,
+            "dropped_sections": self.dropped_sections,
+            "token_counter": token_counter()
+        }
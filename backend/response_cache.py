@@ -0,0 +1,115 @@
+"""
+Response Cache - Pooled cache of Care Manager replies for input-only prompts.
+The GREETING path sends only the prompt template and the raw user message,
+so its reply depends on little else; repeated "hi"/"what can you do" turns
+are served from a small pool of earlier replies instead of a Gemini call.
+"""
+
+import hashlib
+import random
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List
+
+from config import get_settings
+
+
+@dataclass
+class _ResponsePool:
+    variants: List[str] = field(default_factory=list)
+    expires_at: float = 0.0
+
+
+def normalise_message(message: str) -> str:
+    """Case, whitespace, punctuation and stretched letters ("hiii") don't change the reply."""
+    text = re.sub(r"[^\w\s']", " ", message.lower())
+    text = re.sub(r"(\w)\1{2,}", r"\1", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def response_cache_key(template: str, message: str, model: str, temperature: float) -> str:
+    raw = "\x1f".join([template, normalise_message(message), model, repr(temperature)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    LRU of reply pools keyed by (template, normalised message, model, temperature).
+    A key keeps collecting fresh LLM replies until it holds `variants_per_key`
+    of them; after that lookups pick one at random so replies don't feel canned.
+    Pools expire after `ttl_s`.
+    """
+
+    def __init__(self, max_keys: int, variants_per_key: int, ttl_s: float):
+        self.max_keys = max_keys
+        self.variants_per_key = variants_per_key
+        self.ttl_s = ttl_s
+        self._pools: "OrderedDict[str, _ResponsePool]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.fills = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """A cached reply once the key's pool is full, else None (call the LLM)."""
+        pool = self._pools.get(key)
+        if pool is not None and pool.expires_at <= time.time():
+            del self._pools[key]
+            pool = None
+
+        if pool is None or len(pool.variants) < self.variants_per_key:
+            self.misses += 1
+            return None
+
+        self._pools.move_to_end(key)
+        self.hits += 1
+        return random.choice(pool.variants)
+
+    def put(self, key: str, response: str):
+        """Add a fresh reply to the key's pool (ignored once the pool is full)."""
+        pool = self._pools.get(key)
+        if pool is None or pool.expires_at <= time.time():
+            pool = _ResponsePool(expires_at=time.time() + self.ttl_s)
+            self._pools[key] = pool
+        self._pools.move_to_end(key)
+
+        if len(pool.variants) < self.variants_per_key and response not in pool.variants:
+            pool.variants.append(response)
+            self.fills += 1
+
+        while len(self._pools) > self.max_keys:
+            self._pools.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._pools.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "keys": len(self._pools),
+            "variants": sum(len(pool.variants) for pool in self._pools.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "fills": self.fills,
+            "evictions": self.evictions
+        }
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        settings = get_settings()
+        _response_cache = ResponseCache(
+            max_keys=settings.response_cache_max_keys,
+            variants_per_key=settings.response_cache_variants,
+            ttl_s=settings.response_cache_ttl_s
+        )
+    return _response_cache
@@ -1,7 +1,7 @@
 # schemas.py
 import operator
-from typing import TypedDict, Any, List, Dict, Annotated, Optional
-from pydantic import BaseModel
+from typing import TypedDict, Any, List, Dict, Annotated, Literal, Optional
+from pydantic import BaseModel, Field
 
 
 def merge_dicts(existing: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
@@ -11,7 +11,12 @@ def merge_dicts(existing: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]
     if not new:
         return existing
     updated = existing.copy()
-    updated.update(new)
+    for key, value in new.items():
+        # Nested objects merge too, so a partial update (e.g. one new debt figure) keeps its siblings
+        if isinstance(value, dict) and isinstance(updated.get(key), dict):
+            updated[key] = merge_dicts(updated[key], value)
+        else:
+            updated[key] = value
     return updated
 
 
@@ -24,6 +29,8 @@ class MindMoneyState(TypedDict):
     intake_profile: Annotated[Dict[str, Any], merge_dicts]
     financial_profile: Annotated[Dict[str, Any], merge_dicts]
     market_data: str
+    # Compact JSON of financial_profile views, serialised once per turn (see prompting.py)
+    prompt_fragments: Annotated[Dict[str, str], merge_dicts]
     
     # Final Results
     final_response: str
@@ -43,4 +50,123 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     response: str
     agent_logs: List[Dict[str, Any]]
-    action_plan: Optional[Dict[str, Any]] = None
\ No newline at end of file
+    action_plan: Optional[Dict[str, Any]] = None
+
+# ============================================================================
+# STRUCTURED LLM OUTPUT (Gemini response_schema)
+# Every field is optional so a Wealth delta (only changed keys) validates
+# against the same model; dump with exclude_none to drop what wasn't sent.
+# ============================================================================
+class EmotionalState(BaseModel):
+    anxiety: Optional[int] = Field(None, description="0-10")
+    shame: Optional[int] = Field(None, description="0-10")
+    overwhelm: Optional[int] = Field(None, description="0-10")
+    hope: Optional[int] = Field(None, description="0-10")
+    primary_emotion: Optional[str] = Field(None, description="Their main feeling")
+
+
+class FinancialPsychology(BaseModel):
+    money_beliefs: Optional[List[str]] = Field(None, description="Beliefs about money you detect")
+    triggers: Optional[List[str]] = Field(None, description="Emotional triggers around money")
+
+
+class RapportIndicators(BaseModel):
+    engagement_level: Optional[Literal["low", "medium", "high"]] = None
+    trust_needed: Optional[List[str]] = Field(None, description="e.g. validation, competence, confidentiality")
+
+
+class SafetyConcerns(BaseModel):
+    crisis_flag: bool = False
+    escalation_needed: bool = False
+
+
+class IntakeProfile(BaseModel):
+    intent: Literal["GREETING", "CLARIFICATION", "DATA_SUBMISSION"]
+    emotional_state: Optional[EmotionalState] = None
+    financial_psychology: Optional[FinancialPsychology] = None
+    rapport_indicators: Optional[RapportIndicators] = None
+    safety_concerns: Optional[SafetyConcerns] = None
+    validation_hook: Optional[str] = Field(None, description="A compassionate, specific sentence validating their situation or emotion")
+    missing_info: Optional[List[str]] = Field(
+        None,
+        description="1-3 specific things needed to build a plan (e.g. 'monthly income', 'total debt amount') - only for CLARIFICATION"
+    )
+
+
+class FinancialSnapshot(BaseModel):
+    monthly_income: Optional[float] = Field(None, description="Dollars per month; null if unknown")
+    monthly_expenses: Optional[float] = Field(None, description="Dollars per month, stated or estimated")
+
+
+class DebtItem(BaseModel):
+    type: Optional[str] = Field(None, description="Credit Card|Student Loan|Mortgage|Medical|Other")
+    amount: Optional[float] = Field(None, description="Outstanding balance in dollars")
+    interest_rate: Optional[float] = Field(None, description="Annual % as stated; null if unknown")
+    minimum_payment: Optional[float] = Field(None, description="Dollars per month, if stated")
+
+
+class DebtAnalysis(BaseModel):
+    total_debt: Optional[float] = Field(None, description="Dollars; null if unknown")
+    debt_types: Optional[List[DebtItem]] = None
+
+
+class AssetsAndSavings(BaseModel):
+    emergency_fund: Optional[str] = Field(None, description="Amount or status")
+    retirement_savings: Optional[str] = Field(None, description="Amount if mentioned")
+    other_assets: Optional[str] = None
+
+
+class StrategyPhase(BaseModel):
+    focus: Optional[str] = None
+    actions: Optional[List[str]] = None
+    timeline: Optional[str] = None
+
+
+class DetailedStrategy(BaseModel):
+    phase_1_immediate: Optional[StrategyPhase] = Field(None, description="Main priority, 1-4 weeks")
+    phase_2_short_term: Optional[StrategyPhase] = Field(None, description="Next priority, 1-3 months")
+    phase_3_long_term: Optional[StrategyPhase] = Field(None, description="Future goals, 3-12 months")
+
+
+class FinancialProfile(BaseModel):
+    financial_snapshot: Optional[FinancialSnapshot] = None
+    debt_analysis: Optional[DebtAnalysis] = None
+    assets_and_savings: Optional[AssetsAndSavings] = None
+    major_challenges: Optional[List[str]] = None
+    immediate_opportunities: Optional[List[str]] = None
+    detailed_strategy: Optional[DetailedStrategy] = None
+    key_metrics_to_track: Optional[List[str]] = None
+
+
+class PlanningForm(BaseModel):
+    title: Optional[str] = None
+    description: Optional[str] = None
+
+
+class ImmediateAction(BaseModel):
+    action: str
+    deadline: Optional[Literal["This week", "Next 2 weeks", "This month"]] = None
+    difficulty: Optional[Literal["easy", "medium", "hard"]] = None
+    expected_impact: Optional[str] = None
+    category: Optional[Literal["debt", "savings", "income", "budgeting"]] = None
+
+
+class MetricToTrack(BaseModel):
+    name: str
+    current: Optional[str] = None
+    target: Optional[str] = None
+    timeframe: Optional[str] = None
+
+
+class Milestone(BaseModel):
+    milestone: str
+    target_date: Optional[str] = None
+    reward: Optional[str] = Field(None, description="How to celebrate")
+
+
+class ActionPlan(BaseModel):
+    financial_planning_form: Optional[PlanningForm] = None
+    immediate_actions: Optional[List[ImmediateAction]] = None
+    quick_wins: Optional[List[str]] = None
+    metrics_to_track: Optional[List[MetricToTrack]] = None
+    milestones: Optional[List[Milestone]] = None
@@ -0,0 +1,91 @@
+"""
+serve.py - Production launcher for the MindMoney API
+
+Runs main:app under uvicorn's multi-process supervisor:
+  * N workers (WEB_CONCURRENCY), each a separate process with its own
+    event loop and connection pools. The default (0) is one per CPU only
+    when REDIS_URL is set; without Redis it is a single worker, because the
+    per-process history/profile cache would serve stale sessions when
+    consecutive turns land on different workers. Other per-process state
+    stays per worker either way: /api/chat duplicate coalescing only
+    joins duplicates that reach the same worker, and the search and
+    greeting-reply caches are warmed separately in each.
+  * Each worker warms up in the FastAPI lifespan (clients, caches,
+    tokenizer) before it starts listening, so no user pays a cold start;
+    /readyz reports 503 until then.
+  * SIGTERM first flips /readyz to 503 for READINESS_DRAIN_S while the
+    worker keeps serving (so the load balancer stops routing to it), then
+    stops accepting connections, lets in-flight turns finish for up to
+    GRACEFUL_SHUTDOWN_S and runs the lifespan shutdown (turn-log flush,
+    pool close). SIGINT skips the readiness drain. Workers that die are
+    replaced.
+
+Usage (from backend/):
+    python serve.py --workers 4 --port 8000
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import tempfile
+
+import uvicorn
+
+from config import get_settings
+
+
+def prepare_metrics_dir(workers: int):
+    """
+    Prometheus needs a shared directory to aggregate histograms across
+    worker processes; it must be set before any worker imports metrics.py
+    and be emptied of the previous run's files.
+    """
+    if workers <= 1:
+        return
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        path = tempfile.mkdtemp(prefix="mindmoney-prom-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    os.makedirs(path, exist_ok=True)
+    for stale in glob.glob(os.path.join(path, "*.db")):
+        os.remove(stale)
+
+
+def resolve_workers(requested: int) -> int:
+    """Worker count; see the module docstring for the Redis-less default."""
+    settings = get_settings()
+    if requested:
+        if requested > 1 and not settings.redis_url:
+            print(f"Warning: {requested} workers without REDIS_URL - session history and profiles "
+                  "are cached per worker and can be stale when a session moves between workers")
+        return requested
+    return multiprocessing.cpu_count() if settings.redis_url else 1
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=settings.server_host)
+    parser.add_argument("--port", type=int, default=settings.server_port)
+    parser.add_argument("--workers", type=int, default=settings.web_concurrency, help="0 = one per CPU with Redis, else 1")
+    parser.add_argument("--graceful-timeout", type=int, default=settings.graceful_shutdown_s)
+    args = parser.parse_args()
+
+    workers = resolve_workers(args.workers)
+    prepare_metrics_dir(workers)
+    print(f"Starting {workers} worker(s) on {args.host}:{args.port}")
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        timeout_keep_alive=settings.server_keepalive_s,
+        proxy_headers=True,
+        access_log=settings.debug
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Session Store - Tiered lookup of a session's recent turns and profiles.
+
+Reads go Redis (optional, shared across workers) → Supabase when Redis is
+enabled, and in-process history cache → Supabase when it isn't, for both the
+recent turns and the accumulated financial profile. With Redis on, the
+per-process cache is only read if Redis itself fails: any worker may have
+served the session's last turn, so a local copy can be stale. Writes go
+through to the cache and Redis immediately; Supabase is written behind by
+the TurnWriteQueue.
+"""
+
+from typing import Optional, Dict, Any, List
+
+from history_cache import get_history_cache
+from statemanager import get_state_manager, history_entries_to_turns
+from supabase_logger import PendingTurn, compact_state_snapshot, get_supabase_service
+
+
+async def load_recent_turns(session_id: str, user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Recent turns for a session, oldest first, from the fastest tier that has them."""
+    cache = get_history_cache()
+    turns = None
+    
+    state_manager = get_state_manager()
+    if state_manager.enabled:
+        # Shared tier is authoritative: another worker may have served the last turn
+        try:
+            entries = await state_manager.get_conversation_history(session_id)
+            if entries:
+                turns = history_entries_to_turns(entries)
+        except Exception as e:
+            print(f"Redis read error: {e}")
+            turns = cache.get(session_id)
+    else:
+        turns = cache.get(session_id)
+    if turns is not None:
+        cache.put(session_id, turns)
+        return turns
+    
+    turns = await get_supabase_service().get_recent_turns(session_id, user_id, limit=cache.window_turns)
+    if turns is None:
+        # DB unavailable - don't cache an empty window
+        return []
+    
+    cache.put(session_id, turns)
+    return turns
+
+
+async def load_financial_profile(session_id: str, user_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    The session's accumulated financial profile ({} if none yet), from the
+    fastest tier that has it. The Wealth Architect extends it with a delta.
+    """
+    cache = get_history_cache()
+    profile = None
+    
+    state_manager = get_state_manager()
+    if state_manager.enabled:
+        try:
+            state = await state_manager.get_state(session_id)
+            if state is not None:
+                profile = state.get("financial_profile") or {}
+        except Exception as e:
+            print(f"Redis read error: {e}")
+            profile = cache.get_profile(session_id)
+    else:
+        profile = cache.get_profile(session_id)
+    if profile is not None:
+        cache.put_profile(session_id, profile)
+        return profile
+    
+    profile = await get_supabase_service().load_financial_profile(session_id, user_id)
+    if profile is None:
+        # DB unavailable - don't cache an empty profile
+        return {}
+    
+    cache.put_profile(session_id, profile)
+    return profile
+
+
+async def remember_turn(turn: PendingTurn):
+    """Write-through of a finished turn so the next message sees it before Supabase does."""
+    snapshot = compact_state_snapshot(turn.state_snapshot)
+    cache = get_history_cache()
+    cache.append_turn(turn.session_id, turn.turn_number, turn.user_message, turn.assistant_response)
+    cache.put_profile(turn.session_id, snapshot["financial_profile"])
+    
+    state_manager = get_state_manager()
+    if state_manager.enabled:
+        try:
+            await state_manager.save_turn(
+                turn.session_id,
+                turn.turn_number,
+                turn.user_message,
+                turn.assistant_response,
+                {
+                    "intake_profile": turn.state_snapshot.get("intake_profile") or {},
+                    "financial_profile": snapshot["financial_profile"]
+                }
+            )
+        except Exception as e:
+            print(f"Redis write error: {e}")
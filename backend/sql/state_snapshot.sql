@@ -0,0 +1,5 @@
+-- Compact per-turn state (accumulated financial_profile + action_plan).
+-- The Wealth Architect reads the latest one back as the session's prior
+-- profile; /api/history reads action_plan from it.
+ALTER TABLE conversation_turns
+    ADD COLUMN IF NOT EXISTS state_snapshot jsonb;
@@ -0,0 +1,32 @@
+-- upsert_session: single round-trip session metadata write used by
+-- SupabaseService.create_or_update_session.
+--
+-- Inserts the session on its first turn (keeping preview/first_message_at
+-- from that insert) and otherwise bumps last_message_at and total_turns.
+-- ON CONFLICT makes concurrent first turns for one session safe.
+-- p_turns lets a batched write record several turns of one session in a
+-- single call.
+
+create unique index if not exists sessions_session_id_key
+    on public.sessions (session_id);
+
+-- Replaces the earlier 3-argument version (an overload would make calls ambiguous)
+drop function if exists public.upsert_session(text, text, uuid);
+
+create or replace function public.upsert_session(
+    p_session_id text,
+    p_preview text,
+    p_user_id uuid default null,
+    p_turns integer default 1
+)
+returns void
+language sql
+as $$
+    insert into public.sessions (session_id, preview, first_message_at, last_message_at, total_turns, user_id)
+    values (p_session_id, p_preview, now(), now(), p_turns, p_user_id)
+    on conflict (session_id) do update
+        set last_message_at = excluded.last_message_at,
+            total_turns = coalesce(public.sessions.total_turns, 0) + p_turns,
+            -- claim ownership if the session was previously anonymous
+            user_id = coalesce(excluded.user_id, public.sessions.user_id);
+$$;
@@ -1,10 +1,16 @@
 """
 Redis State Management Service.
 Handles session state persistence and retrieval.
+
+Optional shared tier in front of Supabase: holds each session's last
+intake/financial profile and its trimmed history so any worker or node can
+serve any session. When enabled it is the source of truth for recent turns
+and profiles (the per-process cache is only a fallback). Disabled when
+redis_url is empty.
 """
 
 import json
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 import redis.asyncio as redis
 
@@ -18,20 +24,26 @@ class RedisStateManager:
         self.settings = get_settings()
         self._client: Optional[redis.Redis] = None
     
+    @property
+    def enabled(self) -> bool:
+        """Redis tier is opt-in via REDIS_URL."""
+        return bool(self.settings.redis_url)
+    
     async def get_client(self) -> redis.Redis:
         """Get or create Redis client."""
         if self._client is None:
             self._client = redis.from_url(
                 self.settings.redis_url,
                 encoding="utf-8",
-                decode_responses=True
+                decode_responses=True,
+                max_connections=self.settings.redis_pool_size
             )
         return self._client
     
     async def close(self):
         """Close Redis connection."""
         if self._client:
-            await self._client.close()
+            await self._client.aclose()
             self._client = None
     
     def _state_key(self, session_id: str) -> str:
@@ -39,8 +51,11 @@ class RedisStateManager:
         return f"mindmoney:state:{session_id}"
     
     def _history_key(self, session_id: str) -> str:
-        """Generate Redis key for conversation history."""
-        return f"mindmoney:history:{session_id}"
+        """
+        Generate Redis key for conversation history: a sorted set scored by
+        turn number (one member per turn, so re-saving a turn replaces it).
+        """
+        return f"mindmoney:turns:{session_id}"
     
     async def get_state(self, session_id: str) -> Optional[Dict[str, Any]]:
         """Retrieve session state from Redis."""
@@ -66,48 +81,88 @@ class RedisStateManager:
         return True
     
     async def get_conversation_history(self, session_id: str) -> list:
-        """Get conversation history for a session."""
+        """Get conversation history for a session (oldest first)."""
         client = await self.get_client()
-        data = await client.get(self._history_key(session_id))
-        
-        if data:
-            return json.loads(data)
-        return []
+        entries = await client.zrange(self._history_key(session_id), 0, -1)
+        return [json.loads(entry) for entry in entries]
     
     async def append_to_history(
-        self, 
-        session_id: str, 
-        user_message: str, 
-        assistant_response: str
+        self,
+        session_id: str,
+        user_message: str,
+        assistant_response: str,
+        turn_number: int
+    ) -> bool:
+        """
+        Add a turn to conversation history (replacing any earlier copy of
+        the same turn). The writes run as one MULTI/EXEC, so concurrent
+        appends can't overwrite each other.
+        """
+        client = await self.get_client()
+        async with client.pipeline(transaction=True) as pipe:
+            self._queue_history_append(pipe, session_id, user_message, assistant_response, turn_number)
+            await pipe.execute()
+        
+        return True
+    
+    async def save_turn(
+        self,
+        session_id: str,
+        turn_number: int,
+        user_message: str,
+        assistant_response: str,
+        state: Dict[str, Any]
     ) -> bool:
-        """Append a turn to conversation history."""
+        """
+        Save the latest profiles and add the turn atomically. Idempotent per
+        turn_number: a retried turn replaces its history entry, and the state
+        is only written if no later turn has been saved meanwhile (WATCH on
+        the state key; retried if another worker writes it concurrently).
+        """
         client = await self.get_client()
+        state_key = self._state_key(session_id)
+        state = {**state, "turn_number": turn_number, "_last_updated": datetime.utcnow().isoformat()}
         
-        history = await self.get_conversation_history(session_id)
-        history.append({
+        async with client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(state_key)
+                    current = await pipe.get(state_key)
+                    stored_turn = (json.loads(current).get("turn_number") or 0) if current else 0
+                    pipe.multi()
+                    if turn_number >= stored_turn:
+                        pipe.set(state_key, json.dumps(state, default=str), ex=self.settings.state_ttl)
+                    self._queue_history_append(pipe, session_id, user_message, assistant_response, turn_number)
+                    await pipe.execute()
+                    return True
+                except redis.WatchError:
+                    continue
+    
+    def _queue_history_append(
+        self,
+        pipe,
+        session_id: str,
+        user_message: str,
+        assistant_response: str,
+        turn_number: int
+    ):
+        key = self._history_key(session_id)
+        pipe.zremrangebyscore(key, turn_number, turn_number)
+        pipe.zadd(key, {json.dumps({
+            "turn_number": turn_number,
             "user": user_message,
             "assistant": assistant_response,
             "timestamp": datetime.utcnow().isoformat()
-        })
-        
-        # Keep only last 20 turns
-        if len(history) > 20:
-            history = history[-20:]
-        
-        await client.setex(
-            self._history_key(session_id),
-            self.settings.state_ttl,
-            json.dumps(history)
-        )
-        
-        return True
+        }): turn_number})
+        # Keep only the window the agents read
+        pipe.zremrangebyrank(key, 0, -self.settings.history_window_turns - 1)
+        pipe.expire(key, self.settings.state_ttl)
     
     async def delete_session(self, session_id: str) -> bool:
         """Delete all data for a session."""
         client = await self.get_client()
         
-        await client.delete(self._state_key(session_id))
-        await client.delete(self._history_key(session_id))
+        await client.delete(self._state_key(session_id), self._history_key(session_id))
         
         return True
     
@@ -121,6 +176,18 @@ class RedisStateManager:
             return False
 
 
+def history_entries_to_turns(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Convert Redis history entries to the conversation_turns row shape."""
+    return [
+        {
+            "turn_number": entry.get("turn_number"),
+            "user_message": entry.get("user", ""),
+            "assistant_response": entry.get("assistant", "")
+        }
+        for entry in entries
+    ]
+
+
 # Singleton instance
 _state_manager: Optional[RedisStateManager] = None
 
@@ -130,4 +197,4 @@ def get_state_manager() -> RedisStateManager:
     global _state_manager
     if _state_manager is None:
         _state_manager = RedisStateManager()
-    return _state_manager
\ No newline at end of file
+    return _state_manager
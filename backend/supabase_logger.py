@@ -3,31 +3,113 @@ Supabase Service - Session Management & Logging with User Auth
 Handles conversation persistence and retrieval for multi-turn agent context.
 """
 
-from typing import Optional, Dict, Any, List
+import asyncio
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Union
 from datetime import datetime
-from supabase import create_client, Client
+import time
+import httpx
+from postgrest import AsyncPostgrestClient
+from supabase import acreate_client, AsyncClient, AsyncClientOptions
 
 from config import get_settings
+from history_cache import get_history_cache
+from limiter import limited_call
+
+
+@dataclass
+class PendingTurn:
+    """A conversation turn waiting to be written, with per-stage progress."""
+    session_id: str
+    turn_number: int
+    user_message: str
+    assistant_response: str
+    state_snapshot: Dict[str, Any]
+    agent_logs: List[Dict[str, Any]]
+    user_id: Optional[str] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+    session_written: bool = False
+    turn_written: bool = False
+    turn_id: Optional[str] = None
+    logs_written: bool = False
+
+
+def compact_state_snapshot(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The part of a turn's final state worth keeping: the accumulated financial
+    profile (carried into the next turn) and the action plan shown in history.
+    """
+    profile = {k: v for k, v in (state.get("financial_profile") or {}).items() if k != "error"}
+    return {
+        "intent": (state.get("intake_profile") or {}).get("intent"),
+        "financial_profile": profile,
+        "action_plan": state.get("action_plan")
+    }
 
 
 class SupabaseService:
-    """Handles all Supabase operations for MindMoney."""
+    """
+    Handles all Supabase operations for MindMoney.
+    Uses the async client over one shared httpx pool, so DB round-trips
+    overlap with LLM calls instead of blocking the worker.
+    """
     
     def __init__(self):
         self.settings = get_settings()
-        self._client: Optional[Client] = None
+        self._client: Optional[Union[AsyncClient, AsyncPostgrestClient]] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._client_lock = asyncio.Lock()
     
-    def get_client(self) -> Client:
-        """Get or create Supabase client."""
+    async def get_client(self) -> Union[AsyncClient, AsyncPostgrestClient]:
+        """
+        Get or create the async Supabase client.
+        If supabase_rest_url is set, talks straight to that PostgREST
+        endpoint instead (e.g. a local PostgREST + Postgres stand-in).
+        """
         if self._client is None:
-            if not self.settings.supabase_url or not self.settings.supabase_key:
-                raise ValueError("Supabase URL and Key must be configured")
-            self._client = create_client(
-                self.settings.supabase_url,
-                self.settings.supabase_key
-            )
+            async with self._client_lock:
+                if self._client is None:
+                    self._client = await self._create_client()
         return self._client
     
+    async def _create_client(self) -> Union[AsyncClient, AsyncPostgrestClient]:
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.settings.supabase_pool_size,
+                max_keepalive_connections=self.settings.supabase_pool_size
+            ),
+            timeout=self.settings.supabase_timeout_s
+        )
+        
+        if self.settings.supabase_rest_url:
+            headers = {"Accept": "application/json", "Content-Type": "application/json"}
+            if self.settings.supabase_key:
+                headers["apikey"] = self.settings.supabase_key
+                headers["Authorization"] = f"Bearer {self.settings.supabase_key}"
+            return AsyncPostgrestClient(
+                self.settings.supabase_rest_url,
+                headers=headers,
+                http_client=self._http
+            )
+        
+        if not self.settings.supabase_url or not self.settings.supabase_key:
+            raise ValueError("Supabase URL and Key must be configured")
+        return await acreate_client(
+            self.settings.supabase_url,
+            self.settings.supabase_key,
+            options=AsyncClientOptions(
+                httpx_client=self._http,
+                postgrest_client_timeout=self.settings.supabase_timeout_s
+            )
+        )
+    
+    async def close(self):
+        """Close the shared connection pool."""
+        if self._http is not None:
+            await self._http.aclose()
+        self._http = None
+        self._client = None
+    
     # =========================================================================
     # USER PROFILE MANAGEMENT
     # =========================================================================
@@ -35,12 +117,12 @@ class SupabaseService:
     async def get_user_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Get user profile by ID."""
         try:
-            client = self.get_client()
-            result = client.table("user_profiles")\
+            client = await self.get_client()
+            result = await limited_call("supabase", "get_user_profile", client.table("user_profiles")\
                 .select("*")\
                 .eq("id", user_id)\
                 .single()\
-                .execute()
+                .execute())
             return result.data
         except Exception as e:
             print(f"Error getting user profile: {e}")
@@ -53,12 +135,12 @@ class SupabaseService:
     ) -> bool:
         """Update user profile."""
         try:
-            client = self.get_client()
+            client = await self.get_client()
             updates["updated_at"] = datetime.utcnow().isoformat()
-            client.table("user_profiles")\
+            await limited_call("supabase", "update_user_profile", client.table("user_profiles")\
                 .update(updates)\
                 .eq("id", user_id)\
-                .execute()
+                .execute())
             return True
         except Exception as e:
             print(f"Error updating user profile: {e}")
@@ -78,7 +160,7 @@ class SupabaseService:
         Load conversation history for a session.
         """
         try:
-            client = self.get_client()
+            client = await self.get_client()
             
             query = client.table("conversation_turns")\
                 .select("user_message, assistant_response, turn_number")\
@@ -89,7 +171,7 @@ class SupabaseService:
             if user_id:
                 query = query.eq("user_id", user_id)
             
-            result = query.execute()
+            result = await limited_call("supabase", "load_session_history", query.execute())
             
             if not result.data:
                 return []
@@ -111,6 +193,34 @@ class SupabaseService:
             print(f"Error loading session history: {e}")
             return []
     
+    async def load_financial_profile(
+        self,
+        session_id: str,
+        user_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        The financial profile stored with the session's latest turn ({} if
+        none) - only that JSON field is fetched. Returns None if the query failed.
+        """
+        try:
+            client = await self.get_client()
+            
+            query = client.table("conversation_turns")\
+                .select("financial_profile:state_snapshot->financial_profile")\
+                .eq("session_id", session_id)\
+                .order("turn_number", desc=True)\
+                .limit(1)
+            
+            if user_id:
+                query = query.eq("user_id", user_id)
+            
+            result = await limited_call("supabase", "load_financial_profile", query.execute())
+            return (result.data[0].get("financial_profile") or {}) if result.data else {}
+            
+        except Exception as e:
+            print(f"Error loading financial profile: {e}")
+            return None
+    
     async def load_session_context(
         self,
         session_id: str,
@@ -120,7 +230,7 @@ class SupabaseService:
         Load full session context including last state snapshots.
         """
         try:
-            client = self.get_client()
+            client = await self.get_client()
             
             history = await self.load_session_history(session_id, user_id, limit=20)
             
@@ -133,7 +243,7 @@ class SupabaseService:
             if user_id:
                 query = query.eq("user_id", user_id)
                 
-            latest = query.execute()
+            latest = await limited_call("supabase", "load_session_context", query.execute())
             
             context = {
                 "conversation_history": history,
@@ -154,6 +264,7 @@ class SupabaseService:
                         "crisis_flag": last_turn.get("safety_flag", False)
                     }
                 }
+                context["last_financial_profile"] = (last_turn.get("state_snapshot") or {}).get("financial_profile") or {}
             
             return context
             
@@ -176,7 +287,7 @@ class SupabaseService:
         Get all sessions for a user.
         """
         try:
-            client = self.get_client()
+            client = await self.get_client()
             
             query = client.table("sessions")\
                 .select("session_id, first_message_at, last_message_at, preview, total_turns, had_safety_flag, user_id")\
@@ -189,7 +300,7 @@ class SupabaseService:
             else:
                 pass 
             
-            result = query.execute()
+            result = await limited_call("supabase", "get_user_sessions", query.execute())
             
             # Additional safety: If user_id was requested, double check the results
             if user_id and result.data:
@@ -205,6 +316,65 @@ class SupabaseService:
     # LOGGING
     # =========================================================================
     
+    def _build_turn_row(
+        self,
+        session_id: str,
+        turn_number: int,
+        user_message: str,
+        assistant_response: str,
+        state_snapshot: Dict[str, Any],
+        user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Shape one conversation_turns row from a workflow result."""
+        intake = state_snapshot.get("intake_profile", {})
+        emotions = intake.get("emotional_state", {})
+        safety = intake.get("safety_concerns", {})
+        
+        turn_data = {
+            "session_id": session_id,
+            "turn_number": turn_number,
+            "user_message": user_message,
+            "assistant_response": assistant_response,
+            "intake_anxiety": emotions.get("anxiety"),
+            "intake_shame": emotions.get("shame"),
+            "safety_flag": safety.get("crisis_flag", False),
+            "strategy_mode": state_snapshot.get("strategy_decision", {}).get("mode"),
+            "entities_count": len(state_snapshot.get("financial_profile", {}).get("debt_analysis", {}).get("debt_types", [])),
+            "state_snapshot": compact_state_snapshot(state_snapshot),
+            "created_at": datetime.utcnow().isoformat()
+        }
+        
+        if user_id:
+            turn_data["user_id"] = user_id
+        return turn_data
+    
+    def _build_agent_log_rows(
+        self,
+        session_id: str,
+        turn_id: Optional[str],
+        agent_logs: List[Dict[str, Any]],
+        user_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Shape agent_logs rows for one turn."""
+        logs_to_insert = []
+        for log in agent_logs:
+            log_data = {
+                "session_id": session_id,
+                "turn_id": turn_id,
+                "agent_name": log.get("agent", "unknown"),
+                "input_summary": log.get("thought", ""),
+                "output_summary": log.get("status", ""),
+                "duration_ms": log.get("duration_ms"),
+                # Set by the agent that called Gemini (None for skipped / fast-path / cached)
+                "model_used": log.get("model_used"),
+                "decision_made": log.get("thought", ""),
+                "created_at": datetime.utcnow().isoformat()
+            }
+            if user_id:
+                log_data["user_id"] = user_id
+            logs_to_insert.append(log_data)
+        return logs_to_insert
+    
     async def log_conversation_turn(
         self,
         session_id: str,
@@ -217,56 +387,24 @@ class SupabaseService:
     ) -> Optional[str]:
         """Log a complete conversation turn."""
         try:
+            get_history_cache().append_turn(session_id, turn_number, user_message, assistant_response)
+            
             # 1. Update Session Metadata
             await self.create_or_update_session(session_id, user_message, user_id)
             
-            client = self.get_client()
-            
-            intake = state_snapshot.get("intake_profile", {})
-            emotions = intake.get("emotional_state", {})
-            safety = intake.get("safety_concerns", {})
+            client = await self.get_client()
             
             # 2. Log Turn
-            turn_data = {
-                "session_id": session_id,
-                "turn_number": turn_number,
-                "user_message": user_message,
-                "assistant_response": assistant_response,
-                "intake_anxiety": emotions.get("anxiety"),
-                "intake_shame": emotions.get("shame"),
-                "safety_flag": safety.get("crisis_flag", False),
-                "strategy_mode": state_snapshot.get("strategy_decision", {}).get("mode"),
-                "entities_count": len(state_snapshot.get("financial_profile", {}).get("debt_analysis", {}).get("debt_types", [])),
-                "created_at": datetime.utcnow().isoformat()
-            }
-            
-            if user_id:
-                turn_data["user_id"] = user_id
-            
-            result = client.table("conversation_turns").insert(turn_data).execute()
+            turn_data = self._build_turn_row(
+                session_id, turn_number, user_message, assistant_response, state_snapshot, user_id
+            )
+            result = await limited_call("supabase", "insert_turn", client.table("conversation_turns").insert(turn_data).execute())
             turn_id = result.data[0]["id"] if result.data else None
             
             # 3. Log Agent Activity
-            if agent_logs:
-                logs_to_insert = []
-                for log in agent_logs:
-                    log_data = {
-                        "session_id": session_id,
-                        "turn_id": turn_id,
-                        "agent_name": log.get("agent", "unknown"),
-                        "input_summary": log.get("thought", ""),
-                        "output_summary": log.get("status", ""),
-                        "duration_ms": log.get("duration_ms"),
-                        "model_used": self.settings.model_name,
-                        "decision_made": log.get("thought", ""),
-                        "created_at": datetime.utcnow().isoformat()
-                    }
-                    if user_id:
-                        log_data["user_id"] = user_id
-                    logs_to_insert.append(log_data)
-                    
-                if logs_to_insert:
-                    client.table("agent_logs").insert(logs_to_insert).execute()
+            logs_to_insert = self._build_agent_log_rows(session_id, turn_id, agent_logs, user_id)
+            if logs_to_insert:
+                await limited_call("supabase", "insert_agent_logs", client.table("agent_logs").insert(logs_to_insert).execute())
             
             return turn_id
             
@@ -274,6 +412,90 @@ class SupabaseService:
             print(f"Supabase logging error: {e}")
             return None
     
+    async def write_turn_batch(self, turns: List["PendingTurn"]) -> None:
+        """
+        Write several turns with one insert per table.
+        Raises on failure; progress is recorded on each PendingTurn so a
+        retry skips the stages that already succeeded.
+        """
+        client = await self.get_client()
+        
+        # 1. Session metadata (one upsert per distinct session, concurrently)
+        by_session: Dict[str, List[PendingTurn]] = {}
+        for turn in turns:
+            if not turn.session_written:
+                by_session.setdefault(turn.session_id, []).append(turn)
+        if by_session:
+            results = await asyncio.gather(*(
+                self.create_or_update_session(
+                    session_id, session_turns[0].user_message, session_turns[0].user_id, turns=len(session_turns)
+                )
+                for session_id, session_turns in by_session.items()
+            ))
+            failed = []
+            for (session_id, session_turns), ok in zip(by_session.items(), results):
+                if ok:
+                    for turn in session_turns:
+                        turn.session_written = True
+                else:
+                    failed.append(session_id)
+            if failed:
+                raise RuntimeError(f"Session update failed for {', '.join(failed)}")
+        
+        # 2. Turns (one insert for the batch)
+        pending = [t for t in turns if not t.turn_written]
+        if pending:
+            result = await limited_call("supabase", "insert_turns", client.table("conversation_turns").insert([
+                self._build_turn_row(
+                    t.session_id, t.turn_number, t.user_message,
+                    t.assistant_response, t.state_snapshot, t.user_id
+                )
+                for t in pending
+            ]).execute())
+            for turn, row in zip(pending, result.data or []):
+                turn.turn_id = row.get("id")
+            for turn in pending:
+                turn.turn_written = True
+        
+        # 3. Agent logs (one insert for the batch)
+        log_rows = []
+        for turn in turns:
+            if not turn.logs_written:
+                log_rows.extend(self._build_agent_log_rows(turn.session_id, turn.turn_id, turn.agent_logs, turn.user_id))
+        if log_rows:
+            await limited_call("supabase", "insert_agent_logs", client.table("agent_logs").insert(log_rows).execute())
+        for turn in turns:
+            turn.logs_written = True
+    
+    async def get_recent_turns(
+        self,
+        session_id: str,
+        user_id: Optional[str] = None,
+        limit: int = 4
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Last `limit` turns of a session, oldest first - only the columns the
+        agents read. Returns None (rather than []) if the query failed.
+        """
+        try:
+            client = await self.get_client()
+            
+            query = client.table("conversation_turns")\
+                .select("turn_number, user_message, assistant_response")\
+                .eq("session_id", session_id)\
+                .order("turn_number", desc=True)\
+                .limit(limit)
+            
+            if user_id:
+                query = query.eq("user_id", user_id)
+            
+            result = await limited_call("supabase", "get_recent_turns", query.execute())
+            return list(reversed(result.data)) if result.data else []
+            
+        except Exception as e:
+            print(f"Supabase query error: {e}")
+            return None
+    
     async def get_session_history(
         self,
         session_id: str,
@@ -282,7 +504,7 @@ class SupabaseService:
     ) -> List[Dict[str, Any]]:
         """Retrieve full conversation history from Supabase."""
         try:
-            client = self.get_client()
+            client = await self.get_client()
             
             query = client.table("conversation_turns")\
                 .select("*")\
@@ -293,50 +515,36 @@ class SupabaseService:
             if user_id:
                 query = query.eq("user_id", user_id)
             
-            result = query.execute()
+            result = await limited_call("supabase", "get_session_history", query.execute())
             return result.data if result.data else []
             
         except Exception as e:
             print(f"Supabase query error: {e}")
             return []
     
-    async def create_or_update_session(self, session_id: str, user_message: str, user_id: Optional[str] = None) -> bool:
-        """Create or update session metadata."""
+    async def create_or_update_session(
+        self,
+        session_id: str,
+        user_message: str,
+        user_id: Optional[str] = None,
+        turns: int = 1
+    ) -> bool:
+        """
+        Create or update session metadata in one round-trip.
+        Uses the upsert_session RPC (see sql/upsert_session.sql), which inserts
+        on the first turn and otherwise bumps last_message_at and total_turns
+        (by `turns`, for a batch holding several turns of the session).
+        """
         try:
-            client = self.get_client()
-            
-            # Check if session exists
-            existing = client.table("sessions")\
-                .select("id")\
-                .eq("session_id", session_id)\
-                .limit(1)\
-                .execute()
-            
-            if existing.data:
-                # Update existing session
-                update_data = {"last_message_at": datetime.utcnow().isoformat()}
-                if user_id:
-                    update_data["user_id"] = user_id # Ensure ownership is claimed if previously anon
-                    
-                client.table("sessions")\
-                    .update(update_data)\
-                    .eq("session_id", session_id)\
-                    .execute()
-            else:
-                # Create new session
-                preview = user_message[:100] + "..." if len(user_message) > 100 else user_message
-                session_data = {
-                    "session_id": session_id,
-                    "preview": preview,
-                    "first_message_at": datetime.utcnow().isoformat(),
-                    "last_message_at": datetime.utcnow().isoformat()
-                }
-                if user_id:
-                    session_data["user_id"] = user_id
-                    
-                client.table("sessions")\
-                    .insert(session_data)\
-                    .execute()
+            client = await self.get_client()
+            
+            preview = user_message[:100] + "..." if len(user_message) > 100 else user_message
+            await limited_call("supabase", "upsert_session", client.rpc("upsert_session", {
+                "p_session_id": session_id,
+                "p_preview": preview,
+                "p_user_id": user_id,
+                "p_turns": turns
+            }).execute())
             
             return True
             
@@ -0,0 +1,61 @@
+"""Duplicate /api/chat handling: join in-flight twins, replay only keyed retries."""
+import asyncio
+
+import pytest
+
+from coalesce import IdempotencyConflict, RequestCoalescer, coalesce_key
+from schemas import ChatRequest
+
+
+def make_work(calls, delay=0.0):
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return len(calls)
+    return work
+
+
+def test_repeated_message_without_key_runs_again():
+    coalescer = RequestCoalescer(result_ttl_s=30, max_results=10)
+    request = ChatRequest(message="yes", session_id="s1")
+    key, fingerprint = coalesce_key(request, None)
+    calls = []
+
+    async def scenario():
+        first = await coalescer.run(key, fingerprint, make_work(calls), replay=False)
+        second = await coalescer.run(key, fingerprint, make_work(calls), replay=False)
+        return first, second
+
+    assert asyncio.run(scenario()) == (1, 2)
+    assert coalescer.stats()["replayed"] == 0
+
+
+def test_in_flight_duplicates_share_one_run():
+    coalescer = RequestCoalescer(result_ttl_s=30, max_results=10)
+    key, fingerprint = coalesce_key(ChatRequest(message="hi", session_id="s1"), None)
+    calls = []
+
+    async def scenario():
+        return await asyncio.gather(*(
+            coalescer.run(key, fingerprint, make_work(calls, delay=0.05), replay=False) for _ in range(3)
+        ))
+
+    assert asyncio.run(scenario()) == [1, 1, 1]
+    assert coalescer.stats()["joined"] == 2
+
+
+def test_keyed_retry_is_replayed_and_key_reuse_conflicts():
+    coalescer = RequestCoalescer(result_ttl_s=30, max_results=10)
+    key, fingerprint = coalesce_key(ChatRequest(message="ok", session_id="s1"), "k1")
+    _, other = coalesce_key(ChatRequest(message="something else", session_id="s1"), "k1")
+    calls = []
+
+    async def scenario():
+        first = await coalescer.run(key, fingerprint, make_work(calls))
+        retry = await coalescer.run(key, fingerprint, make_work(calls))
+        with pytest.raises(IdempotencyConflict):
+            await coalescer.run(key, other, make_work(calls))
+        return first, retry
+
+    assert asyncio.run(scenario()) == (1, 1)
+    assert coalescer.stats()["replayed"] == 1
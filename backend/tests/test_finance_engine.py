@@ -0,0 +1,122 @@
+"""Recomputing derived figures over a stored profile."""
+from finance_engine import (
+    compute_financials, extracted_profile, format_facts, normalise_debts, parse_rate, payoff_schedule,
+    simulate_payoff
+)
+from schemas import merge_dicts
+
+
+TWO_DEBTS = {
+    "financial_snapshot": {"monthly_income": 4200, "monthly_expenses": 3900},
+    "debt_analysis": {
+        "debt_types": [
+            {"type": "Credit Card", "amount": 6500, "interest_rate": 22},
+            {"type": "Medical", "amount": 1500, "interest_rate": 0}
+        ]
+    }
+}
+
+
+def recompute(prior, delta):
+    """What the Wealth Architect does with a delta, followed by the state reducer."""
+    data = merge_dicts(extracted_profile(prior), delta)
+    computed = compute_financials(data)
+    return merge_dicts(prior, merge_dicts(delta, computed))
+
+
+def test_stale_computed_fields_are_replaced():
+    prior = merge_dicts(TWO_DEBTS, compute_financials(TWO_DEBTS))
+    assert prior["payoff_plan"]["alternative"] is not None
+
+    one_debt = {"debt_analysis": {"debt_types": [{"type": "Credit Card", "amount": 6500, "interest_rate": 22}]}}
+    profile = recompute(prior, one_debt)
+
+    assert profile["payoff_plan"]["alternative"] is None
+    assert [step["debt"] for step in profile["payoff_plan"]["order"]] == ["Credit Card"]
+    assert profile["debt_analysis"]["total_debt"] == 6500
+    assert "instead" not in format_facts(profile)
+
+
+def test_fields_without_inputs_are_cleared():
+    prior = merge_dicts(TWO_DEBTS, compute_financials(TWO_DEBTS))
+    profile = recompute(prior, {"debt_analysis": {"debt_types": []}})
+
+    assert profile["payoff_plan"] is None
+    assert profile["debt_analysis"]["minimum_payments"] is None
+    assert profile["debt_analysis"]["recommended_strategy"] is None
+    assert profile["financial_snapshot"]["monthly_cash_flow"] == 300
+    assert profile["debt_analysis"]["total_debt"] is None
+    assert "total debt" not in format_facts(profile)
+
+
+def test_stated_total_debt_survives_deltas():
+    prior = {"debt_analysis": {"total_debt": 30000}}
+    prior = merge_dicts(prior, compute_financials(prior))
+    profile = recompute(prior, {"financial_snapshot": {"monthly_income": 5000}})
+
+    assert profile["debt_analysis"]["total_debt"] == 30000
+
+
+def test_cached_simulation_is_not_shared():
+    debts = [{"name": "Card", "balance": 1000.0, "apr": 20.0, "minimum": 50.0, "apr_assumed": False}]
+    first = simulate_payoff(debts, 200.0, "Avalanche")
+    first["schedule"][0]["payments"]["Card"] = 0
+    first["order"].clear()
+
+    second = simulate_payoff(debts, 200.0, "Avalanche")
+    assert second["schedule"][0]["payments"]["Card"] == 200.0
+    assert [step["debt"] for step in second["order"]] == ["Card"]
+
+
+def test_sub_one_percent_aprs_are_percentages():
+    assert parse_rate(0.9) == 0.9
+    assert parse_rate("0.9% APR") == 0.9
+    assert parse_rate(0) == 0.0
+
+    car_loan = {
+        "financial_snapshot": {"monthly_income": 5000, "monthly_expenses": 3000},
+        "debt_analysis": {"debt_types": [{"type": "Car Loan", "amount": 20000, "interest_rate": 0.9}]}
+    }
+    plan = compute_financials(car_loan)["payoff_plan"]
+    # 0.9% on a declining $20k balance is a few hundred dollars, not thousands
+    assert plan["order"][0]["apr"] == 0.9
+    assert plan["total_interest"] < 300
+
+    promo = {"debt_analysis": {"debt_types": [{"type": "Credit Card", "amount": 3000, "interest_rate": 0}]}}
+    plan = compute_financials(promo)["payoff_plan"]
+    assert plan["total_interest"] == 0
+    assert plan["assumed_aprs"] == []
+
+
+def test_debts_of_the_same_type_stay_separate():
+    two_cards = {
+        "financial_snapshot": {"monthly_income": 4200, "monthly_expenses": 3900},
+        "debt_analysis": {
+            "debt_types": [
+                {"type": "Credit Card", "amount": 9000, "interest_rate": 25},
+                {"type": "Credit Card", "amount": 1200, "interest_rate": 18}
+            ]
+        }
+    }
+    debts = normalise_debts(two_cards["debt_analysis"]["debt_types"])
+    assert [d["name"] for d in debts] == ["Credit Card", "Credit Card #2"]
+
+    first_month = simulate_payoff(debts, 500.0, "Avalanche")["schedule"][0]["payments"]
+    assert set(first_month) == {"Credit Card", "Credit Card #2"}
+    assert first_month["Credit Card #2"] == round(debts[1]["minimum"], 2)
+
+    plan = compute_financials(two_cards)["payoff_plan"]
+    assert plan["alternative"] is not None
+    assert {plan["strategy"], plan["alternative"]["strategy"]} == {"Avalanche", "Snowball"}
+
+
+def test_payoff_schedule_matches_the_stored_plan():
+    profile = merge_dicts(TWO_DEBTS, compute_financials(TWO_DEBTS))
+    plan = profile["payoff_plan"]
+    schedule = payoff_schedule(profile)
+
+    assert schedule["strategy"] == plan["strategy"]
+    assert len(schedule["schedule"]) == plan["months_to_debt_free"]
+    assert schedule["schedule"][-1]["remaining_balance"] == 0
+    assert "schedule" not in plan
+    assert payoff_schedule(recompute(profile, {"debt_analysis": {"debt_types": []}})) is None
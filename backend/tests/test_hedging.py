@@ -0,0 +1,75 @@
+"""Hedged Gemini calls: streams hedge until their first chunk, losers' tokens are counted."""
+import asyncio
+
+import llm
+from benchmarks.stubs import StubResponse, StubUsage, install_stubs
+from limiter import get_limiter
+from metrics import AgentUsage, Span, _current_usage
+from prompting import count_tokens
+
+install_stubs(llm_latency_s=0, search_latency_s=0, db_latency_s=0)
+
+
+def fresh_budget(monkeypatch) -> llm.HedgeBudget:
+    budget = llm.HedgeBudget(pct=100, burst=10)
+    monkeypatch.setattr(llm, "_hedge_budget", budget)
+    monkeypatch.setattr(llm, "_hedge_delay", lambda agent, model: 0.02)
+    return budget
+
+
+def test_cancelled_loser_is_billed_for_its_prompt(monkeypatch):
+    budget = fresh_budget(monkeypatch)
+    delays = iter([0.5, 0.0])
+
+    async def request():
+        await asyncio.sleep(next(delays))
+        return StubResponse("fast", StubUsage(40, 5))
+
+    async def scenario():
+        usage = AgentUsage()
+        _current_usage.set(usage)
+        response = await llm._hedged_call(request, 0.02, "intake", Span(), "prompt " * 50)
+        return response, usage
+
+    response, usage = asyncio.run(scenario())
+    assert response.text == "fast"
+    assert budget.won == 1
+    assert budget.loser_prompt_tokens == count_tokens("prompt " * 50)
+    assert usage.llm_calls == 1 and usage.prompt_tokens == budget.loser_prompt_tokens
+
+
+def test_slow_stream_is_hedged_before_its_first_chunk(monkeypatch):
+    budget = fresh_budget(monkeypatch)
+    client = llm.get_gemini_client()
+    opened, closed = [], []
+
+    async def generate_content_stream(model, contents, config=None):
+        index = len(opened)
+        opened.append(index)
+
+        async def chunks():
+            try:
+                await asyncio.sleep(0.5 if index == 0 else 0.0)
+                yield StubResponse(f"stream {index} ", None)
+                yield StubResponse("done", StubUsage(30, 4))
+            finally:
+                closed.append(index)
+        return chunks()
+
+    monkeypatch.setattr(client.aio.models, "generate_content_stream", generate_content_stream)
+
+    async def scenario():
+        usage = AgentUsage()
+        _current_usage.set(usage)
+        texts = [text async for text in llm.generate_content_stream("hello " * 20, config=None, agent="care")]
+        return texts, usage
+
+    texts, usage = asyncio.run(scenario())
+    assert texts == ["stream 1 ", "done"]
+    assert opened == [0, 1]
+    assert 0 in closed  # the losing stream was torn down
+    assert budget.sent == 1 and budget.won == 1
+    # The winner's reported usage plus the cancelled primary's prompt
+    assert usage.llm_calls == 2
+    assert usage.prompt_tokens == 30 + count_tokens("hello " * 20)
+    assert get_limiter("gemini").in_flight == 0
@@ -0,0 +1,48 @@
+"""Byte-budget eviction in the recent-history cache."""
+from history_cache import HistoryCache
+
+
+def make_cache(max_bytes=10_000, max_profile_bytes=10_000):
+    return HistoryCache(
+        window_turns=4, ttl_s=60, max_sessions=100,
+        max_bytes=max_bytes, max_profile_bytes=max_profile_bytes
+    )
+
+
+def turn(n, text="x" * 100):
+    return {"turn_number": n, "user_message": text, "assistant_response": text}
+
+
+def test_large_profiles_do_not_evict_turns():
+    cache = make_cache(max_bytes=5_000, max_profile_bytes=5_000)
+    for i in range(10):
+        cache.put_profile(f"p{i}", {"notes": "y" * 1_000})
+
+    cache.put("s1", [turn(1), turn(2)])
+
+    assert cache.get("s1") == [turn(1), turn(2)]
+    stats = cache.stats()
+    assert stats["bytes"] <= stats["max_bytes"]
+    assert stats["profile_bytes"] <= stats["max_profile_bytes"]
+
+
+def test_turns_do_not_evict_profiles():
+    cache = make_cache(max_bytes=2_000, max_profile_bytes=5_000)
+    cache.put_profile("s0", {"total_debt": 1000})
+    for i in range(20):
+        cache.put(f"s{i}", [turn(1)])
+
+    assert cache.get_profile("s0") == {"total_debt": 1000}
+    assert cache.stats()["bytes"] <= 2_000
+
+
+def test_each_budget_evicts_least_recently_used():
+    cache = make_cache(max_bytes=1_000)
+    cache.put("old", [turn(1)])
+    cache.put("mid", [turn(1)])
+    cache.get("old")
+    for i in range(5):
+        cache.put(f"new{i}", [turn(1)])
+
+    assert cache.get("mid") is None
+    assert cache.stats()["bytes"] <= 1_000
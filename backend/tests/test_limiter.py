@@ -0,0 +1,166 @@
+"""Upstream limiter: shedding, slot hand-off on cancel, breaker states, 429 -> 503."""
+import asyncio
+
+import httpx
+import pytest
+
+import limiter
+import llm
+import turn_writer
+from benchmarks.stubs import install_stubs
+from limiter import UpstreamLimiter, UpstreamOverloaded
+
+install_stubs(llm_latency_s=0, search_latency_s=0, db_latency_s=0)
+import main  # noqa: E402  (after the stubs)
+
+
+class UpstreamError(Exception):
+    def __init__(self, code: int):
+        super().__init__(f"upstream returned {code}")
+        self.code = code
+
+
+def make_limiter(**overrides) -> UpstreamLimiter:
+    params = {
+        "rate_per_s": 0, "burst": 0, "min_limit": 1, "max_limit": 1,
+        "latency_target_s": 0, "max_queue": 1, "queue_timeout_s": 0.1,
+        "breaker_failures": 2, "breaker_reset_s": 0.1
+    }
+    return UpstreamLimiter("test", **{**params, **overrides})
+
+
+async def hold(lim: UpstreamLimiter, release: asyncio.Event):
+    async with lim.slot():
+        await release.wait()
+
+
+def test_full_queue_is_shed():
+    lim = make_limiter()
+
+    async def scenario():
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(lim, release))
+        queued = asyncio.create_task(hold(lim, release))
+        await asyncio.sleep(0)
+        assert (lim.in_flight, len(lim._waiters)) == (1, 1)
+
+        with pytest.raises(UpstreamOverloaded, match="queue full"):
+            lim.admit()
+        with pytest.raises(UpstreamOverloaded, match="queue full"):
+            async with lim.slot():
+                pass
+
+        release.set()
+        await asyncio.gather(holder, queued)
+
+    asyncio.run(scenario())
+    assert lim.shed == 2
+    assert lim.in_flight == 0
+
+
+def test_queued_call_is_shed_at_its_deadline():
+    lim = make_limiter(queue_timeout_s=0.05)
+
+    async def scenario():
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(lim, release))
+        await asyncio.sleep(0)
+        with pytest.raises(UpstreamOverloaded, match="queue timeout") as shed:
+            async with lim.slot():
+                pass
+        assert shed.value.retry_after_s >= 1.0
+        assert not lim._waiters
+        release.set()
+        await holder
+
+    asyncio.run(scenario())
+    assert lim.in_flight == 0
+
+
+def test_slot_handed_to_a_cancelled_waiter_is_released():
+    lim = make_limiter()
+
+    async def use_slot():
+        async with lim.slot():
+            pass
+
+    async def scenario():
+        holder = lim.slot()
+        await holder.__aenter__()
+        waiter = asyncio.create_task(use_slot())
+        await asyncio.sleep(0)
+        assert len(lim._waiters) == 1
+
+        # The holder hands its slot to the waiter, which is cancelled before it runs.
+        # Depending on the Python version wait_for either raises CancelledError (the
+        # limiter must give the slot back) or returns, and the waiter uses the slot.
+        await holder.__aexit__(None, None, None)
+        assert lim.in_flight == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+        assert lim.in_flight == 0
+        assert not lim._waiters
+        async with lim.slot():
+            assert lim.in_flight == 1
+
+    asyncio.run(scenario())
+
+
+def test_breaker_opens_probes_and_closes():
+    lim = make_limiter(max_limit=4, max_queue=4)
+
+    async def fail():
+        async with lim.slot():
+            raise UpstreamError(500)
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(UpstreamError):
+                await fail()
+        assert lim.breaker_state == "open"
+        with pytest.raises(UpstreamOverloaded, match="circuit open"):
+            lim.admit()
+
+        await asyncio.sleep(0.15)
+        probe_release = asyncio.Event()
+        probe = asyncio.create_task(hold(lim, probe_release))
+        await asyncio.sleep(0)
+        assert lim.breaker_state == "half_open"
+        with pytest.raises(UpstreamOverloaded, match="probe in flight"):
+            async with lim.slot():
+                pass
+
+        probe_release.set()
+        await probe
+        assert lim.breaker_state == "closed"
+
+    asyncio.run(scenario())
+    assert lim.breaker_trips == 1
+
+
+def test_upstream_429_becomes_503_with_retry_after(monkeypatch):
+    # Fresh per-loop singletons: this test runs its own event loop
+    monkeypatch.setattr(limiter, "_limiters", {})
+    monkeypatch.setattr(turn_writer, "_writer", None)
+    gemini = llm.get_gemini_client()
+
+    async def rate_limited(*args, **kwargs):
+        raise UpstreamError(429)
+
+    monkeypatch.setattr(gemini.aio.models, "generate_content", rate_limited)
+    monkeypatch.setattr(gemini.aio.models, "generate_content_stream", rate_limited)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with main.lifespan(main.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.post("/api/chat", json={
+                    "message": "I'm not sure where my money goes each month", "session_id": "limited"
+                })
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert "gemini overloaded" in response.json()["detail"]
+    assert limiter.get_limiter("gemini").rate_limited >= 1
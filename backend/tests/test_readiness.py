@@ -0,0 +1,39 @@
+"""SIGTERM flips /readyz to 503 before the server's own shutdown starts."""
+import asyncio
+import os
+import signal
+
+import httpx
+
+from benchmarks.stubs import install_stubs
+from config import get_settings
+
+install_stubs(llm_latency_s=0, search_latency_s=0, db_latency_s=0)
+import main  # noqa: E402  (after the stubs)
+
+
+def test_sigterm_drains_readiness_before_shutdown(monkeypatch):
+    monkeypatch.setattr(get_settings(), "readiness_drain_s", 0.3)
+    server_exits = []
+    original = signal.signal(signal.SIGTERM, lambda sig, frame: server_exits.append(sig))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with main.lifespan(main.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                assert (await client.get("/readyz")).status_code == 200
+
+                os.kill(os.getpid(), signal.SIGTERM)
+                await asyncio.sleep(0.05)
+                # Draining: not ready, still serving, server shutdown not started yet
+                assert (await client.get("/readyz")).status_code == 503
+                assert (await client.get("/healthz")).status_code == 200
+                assert server_exits == []
+
+                await asyncio.sleep(0.4)
+                assert server_exits == [signal.SIGTERM]
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        signal.signal(signal.SIGTERM, original)
@@ -0,0 +1,91 @@
+"""Two workers sharing one Redis: each must see the other's turns and profile."""
+import asyncio
+
+import fakeredis
+import pytest
+
+import session_store
+from config import get_settings
+from history_cache import HistoryCache
+from statemanager import RedisStateManager
+from supabase_logger import PendingTurn
+
+
+class Worker:
+    """One process's view: its own history cache, a state manager on the shared Redis."""
+
+    def __init__(self, server: fakeredis.FakeServer):
+        self.cache = HistoryCache(window_turns=4, ttl_s=1800, max_sessions=100, max_bytes=1 << 20, max_profile_bytes=1 << 20)
+        self.state_manager = RedisStateManager()
+        self.state_manager._client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+    def activate(self, monkeypatch):
+        monkeypatch.setattr(session_store, "get_history_cache", lambda: self.cache)
+        monkeypatch.setattr(session_store, "get_state_manager", lambda: self.state_manager)
+
+
+def pending_turn(turn_number: int, debt: int) -> PendingTurn:
+    return PendingTurn(
+        session_id="s1",
+        turn_number=turn_number,
+        user_message=f"message {turn_number}",
+        assistant_response=f"reply {turn_number}",
+        state_snapshot={"financial_profile": {"debt_analysis": {"total_debt": debt}}},
+        agent_logs=[]
+    )
+
+
+@pytest.fixture
+def redis_enabled(monkeypatch):
+    monkeypatch.setattr(get_settings(), "redis_url", "redis://shared")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_worker_sees_turns_written_by_another_worker(monkeypatch, redis_enabled):
+    server = fakeredis.FakeServer()
+    a, b = Worker(server), Worker(server)
+
+    a.activate(monkeypatch)
+    run(session_store.remember_turn(pending_turn(1, debt=1000)))
+    assert [t["turn_number"] for t in run(session_store.load_recent_turns("s1"))] == [1]
+
+    b.activate(monkeypatch)
+    run(session_store.remember_turn(pending_turn(2, debt=2000)))
+
+    # A still holds turn 1 and the old profile locally; Redis must win
+    a.activate(monkeypatch)
+    assert [t["turn_number"] for t in run(session_store.load_recent_turns("s1"))] == [1, 2]
+    assert run(session_store.load_financial_profile("s1")) == {"debt_analysis": {"total_debt": 2000}}
+
+
+def test_save_turn_is_idempotent_per_turn_number(monkeypatch, redis_enabled):
+    worker = Worker(fakeredis.FakeServer())
+    worker.activate(monkeypatch)
+
+    run(session_store.remember_turn(pending_turn(1, debt=1000)))
+    run(session_store.remember_turn(pending_turn(2, debt=2000)))
+    # Retry of turn 2, then a late retry of turn 1
+    run(session_store.remember_turn(pending_turn(2, debt=2000)))
+    run(worker.state_manager.save_turn("s1", 1, "message 1", "reply 1", {"financial_profile": {"stale": True}}))
+
+    entries = run(worker.state_manager.get_conversation_history("s1"))
+    assert [e["turn_number"] for e in entries] == [1, 2]
+    state = run(worker.state_manager.get_state("s1"))
+    assert state["financial_profile"] == {"debt_analysis": {"total_debt": 2000}}
+
+
+def test_local_cache_is_fallback_when_redis_fails(monkeypatch, redis_enabled):
+    worker = Worker(fakeredis.FakeServer())
+    worker.activate(monkeypatch)
+    run(session_store.remember_turn(pending_turn(1, debt=1000)))
+
+    async def broken(*args, **kwargs):
+        raise ConnectionError("redis down")
+    monkeypatch.setattr(worker.state_manager, "get_conversation_history", broken)
+    monkeypatch.setattr(worker.state_manager, "get_state", broken)
+
+    assert [t["turn_number"] for t in run(session_store.load_recent_turns("s1"))] == [1]
+    assert run(session_store.load_financial_profile("s1")) == {"debt_analysis": {"total_debt": 1000}}
@@ -1,6 +1,45 @@
 # backend/tools.py
+import asyncio
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
 from tavily import TavilyClient
 from config import get_settings
+from limiter import limited_call
+
+
+_tavily: Optional[TavilyClient] = None
+
+
+def get_tavily_client() -> TavilyClient:
+    """Shared Tavily client (created once per process)."""
+    global _tavily
+    if _tavily is None:
+        _tavily = TavilyClient(api_key=get_settings().tavily_api_key)
+    return _tavily
+
+
+def _tavily_search(query: str) -> str:
+    """Runs the blocking Tavily search and formats it. Raises on failure."""
+    # We ask for 'advanced' search to get serious financial sources
+    response = get_tavily_client().search(
+        query=query,
+        search_depth="basic",
+        max_results=3,
+        include_domains=["nerdwallet.com", "canada.ca", "investopedia.com", "reddit.com"]
+    )
+
+    # Format the results into a bulleted string for the LLM
+    results = []
+    for res in response.get("results", []):
+        results.append(f"- {res['title']}: {res['content']} (Source: {res['url']})")
+
+    return "\n".join(results)
+
 
 def perform_market_search(query: str) -> str:
     """
@@ -11,20 +50,174 @@ def perform_market_search(query: str) -> str:
         return "Search disabled (No API Key)."
 
     try:
-        tavily = TavilyClient(api_key=settings.tavily_api_key)
-        # We ask for 'advanced' search to get serious financial sources
-        response = tavily.search(
-            query=query, 
-            search_depth="basic", 
-            max_results=3,
-            include_domains=["nerdwallet.com", "canada.ca", "investopedia.com", "reddit.com"] 
+        return _tavily_search(query)
+    except Exception as e:
+        return f"Search failed: {str(e)}"
+
+
+# ============================================================================
+# SEARCH RESULT CACHE
+# ============================================================================
+class SearchCache:
+    """
+    TTL + LRU cache of formatted search results keyed by normalised query.
+    Optionally mirrored to a local SQLite file so results survive restarts;
+    the file is only touched from worker threads (one at a time), never on
+    the event loop.
+    """
+
+    def __init__(self, ttl_s: float, max_entries: int, disk_path: str = ""):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalise(query: str) -> str:
+        return re.sub(r"\s+", " ", query.strip().lower())
+
+    async def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        if self._db is not None:
+            try:
+                row = await asyncio.to_thread(self._disk_get, key, now)
+            except sqlite3.Error as e:
+                print(f"Search cache read error: {e}")
+                row = None
+            if row:
+                self._remember(key, row[0], row[1])
+                self.disk_hits += 1
+                return row[0]
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, value: str):
+        expires_at = time.time() + self.ttl_s
+        self._remember(key, value, expires_at)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_put, key, value, expires_at)
+
+    def _disk_get(self, key: str, now: float) -> Optional[tuple]:
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT value, expires_at FROM search_cache WHERE key = ? AND expires_at > ?",
+                (key, now)
+            ).fetchone()
+
+    def _disk_put(self, key: str, value: str, expires_at: float):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at)
+            )
+            # Keep the file bounded: drop expired rows and anything beyond max_entries
+            self._db.execute("DELETE FROM search_cache WHERE expires_at <= ?", (time.time(),))
+            self._db.execute(
+                "DELETE FROM search_cache WHERE key NOT IN "
+                "(SELECT key FROM search_cache ORDER BY expires_at DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+            self._db.commit()
+
+    def _remember(self, key: str, value: str, expires_at: float):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions
+        }
+
+
+_search_cache: Optional[SearchCache] = None
+_inflight: Dict[str, "asyncio.Task[str]"] = {}
+
+
+def get_search_cache() -> SearchCache:
+    global _search_cache
+    if _search_cache is None:
+        settings = get_settings()
+        _search_cache = SearchCache(
+            ttl_s=settings.search_cache_ttl_s,
+            max_entries=settings.search_cache_max_entries,
+            disk_path=settings.search_cache_path
         )
-        
-        # Format the results into a bulleted string for the LLM
-        results = []
-        for res in response.get("results", []):
-            results.append(f"- {res['title']}: {res['content']} (Source: {res['url']})")
-        
-        return "\n".join(results)
+    return _search_cache
+
+
+async def _fetch_and_cache(key: str, query: str) -> str:
+    try:
+        # Tavily's client is synchronous - keep it off the event loop
+        result = await limited_call("tavily", "search", asyncio.to_thread(_tavily_search, query))
+    except Exception as e:
+        _inflight.pop(key, None)
+        return f"Search failed: {str(e)}"
+
+    try:
+        await get_search_cache().put(key, result)
     except Exception as e:
-        return f"Search failed: {str(e)}"
\ No newline at end of file
+        # e.g. "database is locked" with several workers on one file - the result is still good
+        print(f"Search cache write error: {e}")
+    finally:
+        _inflight.pop(key, None)
+    return result
+
+
+async def cached_market_search(query: str) -> str:
+    """
+    Async, cached front for perform_market_search.
+    Concurrent misses for the same query share one upstream call; failures
+    are returned to every waiter but never cached. The upstream call runs
+    in its own task, so a caller timing out doesn't cancel it for the others.
+    """
+    settings = get_settings()
+    if not settings.tavily_api_key:
+        return "Search disabled (No API Key)."
+
+    cache = get_search_cache()
+    key = SearchCache.normalise(query)
+    cached = await cache.get(key)
+    if cached is not None:
+        return cached
+
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_fetch_and_cache(key, query))
+        _inflight[key] = task
+    else:
+        cache.coalesced += 1
+    return await asyncio.shield(task)
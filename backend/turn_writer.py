@@ -0,0 +1,172 @@
+"""
+Turn Writer - Write-behind queue for Supabase conversation logging.
+Lets /api/chat return before the session/turn/agent-log writes land.
+"""
+
+import asyncio
+import time
+from typing import Optional, Dict, Any, List
+
+from config import get_settings
+from supabase_logger import PendingTurn, SupabaseService, get_supabase_service
+
+
+class TurnWriteQueue:
+    """
+    Bounded in-memory queue drained by a single background task.
+    Turns are written in batches with exponential-backoff retries and
+    flushed on shutdown. Turns that can't be queued or written are counted
+    as dropped.
+    """
+
+    def __init__(self, service: Optional[SupabaseService] = None):
+        self.settings = get_settings()
+        self._service = service
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._closing = False
+
+        # Counters exposed through stats()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.retries = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.max_queue_wait_ms = 0.0
+
+    @property
+    def service(self) -> SupabaseService:
+        if self._service is None:
+            self._service = get_supabase_service()
+        return self._service
+
+    def start(self):
+        """Start the background flusher (idempotent)."""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.settings.write_queue_max_size)
+        if self._worker is None or self._worker.done():
+            self._closing = False
+            self._worker = asyncio.create_task(self._run())
+
+    def submit(self, turn: PendingTurn) -> bool:
+        """Queue a turn for writing. Never blocks; returns False if dropped."""
+        if self._closing:
+            self.dropped += 1
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait(turn)
+            self.enqueued += 1
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            print(f"Turn write queue full - dropped turn for session {turn.session_id}")
+            return False
+
+    async def stop(self, timeout: Optional[float] = None):
+        """Flush whatever is queued, then stop the worker."""
+        if self._worker is None:
+            return
+        self._closing = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout or self.settings.write_shutdown_timeout_s)
+        except asyncio.TimeoutError:
+            print(f"Turn writer shutdown timed out with {self._queue.qsize()} turns queued")
+            self.dropped += self._queue.qsize()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    async def _next_batch(self) -> List[PendingTurn]:
+        """Wait for one turn, then collect more until the batch is full or the flush interval passes."""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.settings.write_flush_interval_s
+        while len(batch) < self.settings.write_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._closing and self._queue.empty():
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._write_with_retry(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write_with_retry(self, batch: List[PendingTurn]):
+        started = time.monotonic()
+        self.max_queue_wait_ms = max(
+            self.max_queue_wait_ms,
+            max((started - t.enqueued_at) * 1000 for t in batch)
+        )
+
+        for attempt in range(self.settings.write_max_retries + 1):
+            try:
+                await self.service.write_turn_batch(batch)
+                self.written += len(batch)
+                break
+            except Exception as e:
+                if attempt == self.settings.write_max_retries:
+                    print(f"Turn batch write failed after {attempt + 1} attempts ({e}), writing turns one by one")
+                    await self._write_individually(batch)
+                    break
+                self.retries += 1
+                delay = self.settings.write_retry_base_s * (2 ** attempt)
+                print(f"Turn write failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+        elapsed_ms = (time.monotonic() - started) * 1000
+        self.flushes += 1
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self.total_flush_ms += elapsed_ms
+
+    async def _write_individually(self, batch: List[PendingTurn]):
+        """
+        Last resort after the batch retries: one write per turn, so a single
+        bad row (e.g. a constraint violation) loses only itself.
+        """
+        for turn in batch:
+            try:
+                await self.service.write_turn_batch([turn])
+                self.written += 1
+            except Exception as e:
+                print(f"Dropping turn {turn.turn_number} of session {turn.session_id}: {e}")
+                self.dropped += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "retries": self.retries,
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_ms, 1),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 1) if self.flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 1),
+            "max_queue_wait_ms": round(self.max_queue_wait_ms, 1)
+        }
+
+
+_writer: Optional[TurnWriteQueue] = None
+
+
+def get_turn_writer() -> TurnWriteQueue:
+    global _writer
+    if _writer is None:
+        _writer = TurnWriteQueue()
+    return _writer
@@ -1,9 +1,15 @@
 # workflow.py
 import asyncio
-from typing import Literal
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Literal, Optional
 
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, START, END
+from config import get_settings
 from schemas import MindMoneyState
+from metrics import SPECULATION, instrument_node
+from intent_classifier import has_money_signal
+from limiter import UpstreamOverloaded
 
 from agents import (
     run_intake_agent,
@@ -17,27 +23,190 @@ from agents import (
 # ============================================================================
 # PARALLEL ANALYSIS NODE
 # ============================================================================
+async def _run_timed_branch(
+    agent_name: str,
+    role: str,
+    agent: Callable[[MindMoneyState], Awaitable[Dict[str, Any]]],
+    state: MindMoneyState,
+    timeout_s: float,
+    fallback: Dict[str, Any],
+    fan_out_start: float
+) -> Dict[str, Any]:
+    """
+    Runs one analysis branch under its own timeout and stamps its
+    agent_log entries with timings relative to the start of the fan-out.
+    """
+    started = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(agent(state), timeout=timeout_s)
+    except asyncio.TimeoutError:
+        print(f"{agent_name} timed out after {timeout_s}s")
+        result = {
+            **fallback,
+            "agent_log": [{
+                "agent": agent_name,
+                "role": role,
+                "thought": f"Timed out after {timeout_s:g}s - continuing without this branch",
+                "status": "failed",
+                "input_state": {"timeout_s": timeout_s},
+                "output_state": {"error": "timeout"},
+                "state_changes": {"added": [], "routing": "→ Care Manager (parallel merge)"}
+            }]
+        }
+    finished = time.perf_counter()
+
+    for entry in result.get("agent_log", []):
+        entry["duration_ms"] = round((finished - started) * 1000)
+        entry["started_offset_ms"] = round((started - fan_out_start) * 1000)
+        entry["finished_offset_ms"] = round((finished - fan_out_start) * 1000)
+    return result
+
+
 async def run_parallel_analysis(state: MindMoneyState):
     """
     Runs Wealth Architect and Market Researcher in parallel.
     Only called when intent is DATA_SUBMISSION.
+    Each branch has its own timeout so a slow search can't hold up the plan.
     """
     print("Running parallel financial analysis...")
+    settings = get_settings()
+    fan_out_start = time.perf_counter()
     
     # Run both agents concurrently
     wealth_result, research_result = await asyncio.gather(
-        run_financial_agent(state),
-        run_research_agent(state)
+        _run_timed_branch(
+            "Wealth Architect", "Financial Analysis & Strategy",
+            instrument_node("Wealth Architect", run_financial_agent), state, settings.wealth_timeout_s,
+            {"financial_profile": {}}, fan_out_start
+        ),
+        _run_timed_branch(
+            "Market Researcher", "External Data & Resources",
+            instrument_node("Market Researcher", run_research_agent), state, settings.research_timeout_s,
+            {"market_data": ""}, fan_out_start
+        )
     )
     
+    total_ms = round((time.perf_counter() - fan_out_start) * 1000)
+    branch_ms = [
+        entry.get("duration_ms", 0)
+        for entry in wealth_result.get("agent_log", []) + research_result.get("agent_log", [])
+    ]
+    print(f"   Parallel analysis took {total_ms}ms (branches: {branch_ms}, sum {sum(branch_ms)}ms)")
+    
     # Merge results
     return {
         "financial_profile": wealth_result.get("financial_profile", {}),
+        "prompt_fragments": wealth_result.get("prompt_fragments", {}),
         "market_data": research_result.get("market_data", ""),
         "agent_log": wealth_result.get("agent_log", []) + research_result.get("agent_log", [])
     }
 
 
+# ============================================================================
+# SPECULATIVE ANALYSIS
+# Messages carrying figures are almost always DATA_SUBMISSION, and the
+# Wealth Architect / Market Researcher only need the intent from intake.
+# So when a money signal is present, the analysis fan-out starts alongside
+# intake; the analysis node adopts it if intake agrees, otherwise it is
+# cancelled. The task lives in a per-run slot in config["configurable"].
+# ============================================================================
+class SpeculationStats:
+    """Counters for tuning speculation (also exported as mindmoney_speculation)."""
+
+    def __init__(self):
+        self.started = 0
+        self.hits = 0
+        self.discarded = 0
+        self.discarded_after_finish = 0
+        self.missed = 0
+
+    def record(self, outcome: str):
+        SPECULATION.labels(outcome).inc()
+        if outcome == "started":
+            self.started += 1
+        elif outcome == "hit":
+            self.hits += 1
+        elif outcome == "discarded":
+            self.discarded += 1
+        elif outcome == "discarded_after_finish":
+            self.discarded += 1
+            self.discarded_after_finish += 1
+        elif outcome == "missed":
+            self.missed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        data_turns = self.hits + self.missed
+        return {
+            "started": self.started,
+            "hits": self.hits,
+            # Each discarded run is one wasted Wealth Architect call (plus a search on a cache miss)
+            "discarded": self.discarded,
+            "discarded_after_finish": self.discarded_after_finish,
+            "missed": self.missed,
+            "hit_rate": round(self.hits / self.started, 4) if self.started else 0.0,
+            "coverage": round(self.hits / data_turns, 4) if data_turns else 0.0
+        }
+
+
+_speculation_stats = SpeculationStats()
+
+
+def get_speculation_stats() -> SpeculationStats:
+    return _speculation_stats
+
+
+def _speculation_slot(config: Optional[RunnableConfig]) -> Optional[Dict[str, Any]]:
+    return ((config or {}).get("configurable") or {}).get("speculation")
+
+
+def cancel_speculation(slot: Optional[Dict[str, Any]]):
+    """Drop a speculative run nobody adopted (e.g. the graph failed)."""
+    task = (slot or {}).pop("task", None)
+    if task is not None and not task.done():
+        task.cancel()
+    elif task is not None and not task.cancelled():
+        task.exception()  # retrieved, so a failed run isn't reported as unhandled
+
+
+async def run_intake_with_speculation(state: MindMoneyState, config: RunnableConfig):
+    """
+    Intake Specialist node. Starts the analysis fan-out speculatively when
+    the message carries figures, and cancels it if intake routes elsewhere.
+    """
+    slot = _speculation_slot(config)
+    if slot is not None and get_settings().speculative_analysis and has_money_signal(state["user_input"]):
+        assumed = {**state, "intake_profile": {"intent": "DATA_SUBMISSION"}}
+        slot["task"] = asyncio.create_task(run_parallel_analysis(assumed))
+        get_speculation_stats().record("started")
+
+    result = await run_intake_agent(state)
+
+    task = (slot or {}).get("task")
+    if task is not None and result.get("intake_profile", {}).get("intent") != "DATA_SUBMISSION":
+        get_speculation_stats().record("discarded_after_finish" if task.done() else "discarded")
+        cancel_speculation(slot)
+    return result
+
+
+async def run_analysis_node(state: MindMoneyState, config: RunnableConfig):
+    """Parallel analysis node: adopts the speculative run when there is one."""
+    slot = _speculation_slot(config)
+    task = (slot or {}).pop("task", None)
+    if task is None:
+        if slot is not None and get_settings().speculative_analysis:
+            get_speculation_stats().record("missed")
+        return await run_parallel_analysis(state)
+
+    result = await task
+    get_speculation_stats().record("hit")
+    anxiety = state.get("intake_profile", {}).get("emotional_state", {}).get("anxiety", 0)
+    for entry in result.get("agent_log", []):
+        entry["speculative"] = True
+        if "anxiety_level" in entry.get("input_state", {}):
+            entry["input_state"]["anxiety_level"] = anxiety
+    return result
+
+
 # ============================================================================
 # ROUTING LOGIC
 # ============================================================================
@@ -57,6 +226,21 @@ def route_after_intake(state: MindMoneyState) -> Literal["analyze", "converse"]:
         return "converse"
 
 
+ROUTE_TARGETS = {
+    "analyze": ["parallel_analysis"],                    # Has financial data
+    "converse": ["care_manager", "action_generator"]     # No data yet, just chat
+}
+
+# Pipeline order of agent_log entries, independent of which nodes ran concurrently
+AGENT_LOG_ORDER = ["Intake Specialist", "Wealth Architect", "Market Researcher", "Care Manager", "Action Generator"]
+
+
+def order_agent_log(agent_log: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Stable-sorts log entries into pipeline order (unknown agents go last)."""
+    rank = {name: i for i, name in enumerate(AGENT_LOG_ORDER)}
+    return sorted(agent_log, key=lambda entry: rank.get(entry.get("agent"), len(rank)))
+
+
 # ============================================================================
 # GRAPH CONSTRUCTION
 # ============================================================================
@@ -66,16 +250,23 @@ def create_graph():
     
     Flow:
     START → Intake Specialist → [ROUTER]
-                                    ├─ DATA_SUBMISSION → Parallel Analysis → Care Manager → Action Generator → END
-                                    └─ GREETING/CLARIFICATION → Care Manager → Action Generator → END
+                                    ├─ DATA_SUBMISSION → Parallel Analysis ─┬→ Care Manager ────┬→ END
+                                    │                                       └→ Action Generator ┘
+                                    └─ GREETING/CLARIFICATION ──────────────┬→ Care Manager ────┬→ END
+                                                                            └→ Action Generator ┘
+    
+    Care Manager and Action Generator only depend on the intake and financial
+    profiles, so they run in the same step and join at END. When the message
+    carries figures, Parallel Analysis is started speculatively alongside
+    intake (see SPECULATIVE ANALYSIS).
     """
     workflow = StateGraph(MindMoneyState)
 
-    # 1. Add all nodes
-    workflow.add_node("intake_specialist", run_intake_agent)
-    workflow.add_node("parallel_analysis", run_parallel_analysis)
-    workflow.add_node("care_manager", run_synthesizer_agent)
-    workflow.add_node("action_generator", run_action_generator)
+    # 1. Add all nodes (each timed into /metrics and its agent_log duration_ms)
+    workflow.add_node("intake_specialist", instrument_node("Intake Specialist", run_intake_with_speculation))
+    workflow.add_node("parallel_analysis", instrument_node("Parallel Analysis", run_analysis_node))
+    workflow.add_node("care_manager", instrument_node("Care Manager", run_synthesizer_agent))
+    workflow.add_node("action_generator", instrument_node("Action Generator", run_action_generator))
 
     # 2. Entry point
     workflow.add_edge(START, "intake_specialist")
@@ -83,18 +274,16 @@ def create_graph():
     # 3. Conditional routing after intake
     workflow.add_conditional_edges(
         "intake_specialist",
-        route_after_intake,
-        {
-            "analyze": "parallel_analysis",   # Has financial data
-            "converse": "care_manager"        # No data yet, just chat
-        }
+        lambda state: ROUTE_TARGETS[route_after_intake(state)],
+        ["parallel_analysis", "care_manager", "action_generator"]
     )
 
-    # 4. After parallel analysis, go to care manager
+    # 4. After parallel analysis, fan out to care manager + action generator
     workflow.add_edge("parallel_analysis", "care_manager")
+    workflow.add_edge("parallel_analysis", "action_generator")
 
-    # 5. Care manager → Action generator → END
-    workflow.add_edge("care_manager", "action_generator")
+    # 5. Both branches join at END
+    workflow.add_edge("care_manager", END)
     workflow.add_edge("action_generator", END)
 
     return workflow.compile()
@@ -106,13 +295,50 @@ def create_graph():
 app_graph = create_graph()
 
 
-async def run_mindmoney_workflow(user_input: str, history: list) -> MindMoneyState:
+def build_initial_state(user_input: str, history: list, financial_profile: Optional[Dict[str, Any]] = None) -> MindMoneyState:
+    """
+    Per-turn state handed to the graph. The session's stored financial
+    profile is carried in; the Wealth Architect's delta merges into it.
+    """
+    return {
+        "user_input": user_input,
+        "conversation_history": history,
+        "intake_profile": {},
+        "financial_profile": financial_profile or {},
+        "market_data": "",
+        "prompt_fragments": {},
+        "final_response": "",
+        "action_plan": None,
+        "agent_log": []
+    }
+
+
+def run_config(speculation: Dict[str, Any]) -> RunnableConfig:
+    """Per-run graph config; `speculation` is the slot the intake and analysis nodes share."""
+    return {"configurable": {"speculation": speculation}}
+
+
+def build_fallback_state(initial_state: MindMoneyState, error: Exception) -> MindMoneyState:
+    """Safe state returned when the graph itself fails."""
+    return {
+        **initial_state,
+        "final_response": "I apologize, but I encountered an error. Could you try rephrasing your message?",
+        "agent_log": [{"agent": "System", "thought": f"Workflow error: {error}", "status": "failed"}]
+    }
+
+
+async def run_mindmoney_workflow(
+    user_input: str,
+    history: list,
+    financial_profile: Optional[Dict[str, Any]] = None
+) -> MindMoneyState:
     """
     Main entry point to run the MindMoney workflow.
     
     Args:
         user_input: The user's message
         history: List of previous messages [{"role": "user"|"assistant", "content": "..."}]
+        financial_profile: The session's stored profile from earlier turns, if any
     
     Returns:
         Final state with all agent outputs
@@ -122,19 +348,12 @@ async def run_mindmoney_workflow(user_input: str, history: list) -> MindMoneySta
     print(f"Input: {user_input[:100]}...")
     print(f"{'='*60}\n")
     
-    initial_state: MindMoneyState = {
-        "user_input": user_input,
-        "conversation_history": history,
-        "intake_profile": {},
-        "financial_profile": {},
-        "market_data": "",
-        "final_response": "",
-        "action_plan": None,
-        "agent_log": []
-    }
+    initial_state = build_initial_state(user_input, history, financial_profile)
+    speculation: Dict[str, Any] = {}
     
     try:
-        final_state = await app_graph.ainvoke(initial_state)
+        final_state = await app_graph.ainvoke(initial_state, config=run_config(speculation))
+        final_state["agent_log"] = order_agent_log(final_state.get("agent_log", []))
         
         print(f"\n{'='*60}")
         print(f"WORKFLOW COMPLETE")
@@ -144,11 +363,57 @@ async def run_mindmoney_workflow(user_input: str, history: list) -> MindMoneySta
         
         return final_state
         
+    except UpstreamOverloaded:
+        raise
     except Exception as e:
         print(f"Workflow error: {e}")
         # Return a safe fallback state
-        return {
-            **initial_state,
-            "final_response": "I apologize, but I encountered an error. Could you try rephrasing your message?",
-            "agent_log": [{"agent": "System", "thought": f"Workflow error: {e}", "status": "failed"}]
-        }
\ No newline at end of file
+        return build_fallback_state(initial_state, e)
+    finally:
+        cancel_speculation(speculation)
+
+
+async def stream_mindmoney_workflow(
+    user_input: str,
+    history: list,
+    financial_profile: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Streaming variant of run_mindmoney_workflow.
+    
+    Yields events as the graph progresses:
+        {"type": "agent_log", "entry": {...}}   - as each node finishes
+        {"type": "token", "text": "..."}        - Care Manager output as it is generated
+        {"type": "final", "state": {...}}       - always last, with the full final state
+    """
+    print(f"\nMINDMONEY WORKFLOW START (streaming) - Input: {user_input[:100]}...")
+    
+    initial_state = build_initial_state(user_input, history, financial_profile)
+    final_state: Dict[str, Any] = initial_state
+    speculation: Dict[str, Any] = {}
+    
+    try:
+        async for mode, chunk in app_graph.astream(
+            initial_state,
+            config=run_config(speculation),
+            stream_mode=["updates", "custom", "values"]
+        ):
+            if mode == "custom":
+                yield chunk
+            elif mode == "updates":
+                for update in chunk.values():
+                    for entry in (update or {}).get("agent_log", []):
+                        yield {"type": "agent_log", "entry": entry}
+            else:
+                final_state = {**chunk, "agent_log": order_agent_log(chunk.get("agent_log", []))}
+    except UpstreamOverloaded:
+        raise
+    except Exception as e:
+        print(f"Workflow error: {e}")
+        final_state = build_fallback_state(initial_state, e)
+        for entry in final_state["agent_log"]:
+            yield {"type": "agent_log", "entry": entry}
+    finally:
+        cancel_speculation(speculation)
+    
+    yield {"type": "final", "state": final_state}